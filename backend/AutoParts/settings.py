@@ -24,6 +24,9 @@ env = environ.Env(
 environ.Env.read_env(os.path.join(BASE_DIR, '..', '.env'))
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
+# Entrega de PDFs: 'django' (FileResponse con Range/ETag), 'x-accel-redirect' (Nginx) o 'x-sendfile'
+PDF_SERVE_MODE = env('PDF_SERVE_MODE', default='django')
+PDF_X_ACCEL_PREFIX = '/protected-media/'
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.0/howto/deployment/checklist/
 
@@ -84,6 +87,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'tienda.context_processors.user_permissions',  # ← Agregar nuestro context processor
+                'tienda.context_processors.carrito_resumen',
             ],
         },
     },
@@ -176,33 +180,34 @@ TRANSBANK_WEBPAY_PLUS = {
 
 
 # Configuración de Email
-# Para desarrollo en Windows (SSL problemático)
-EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
-
-# Para producción: Gmail (cuando se resuelva SSL)
-# EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
-# EMAIL_HOST = 'smtp.gmail.com'
-# EMAIL_PORT = 465
-# EMAIL_USE_TLS = False
-# EMAIL_USE_SSL = True
-# EMAIL_HOST_USER = 'ventas.autoparts.2025@gmail.com'
-# EMAIL_HOST_PASSWORD = 'bqwn zcgy wyft sejj'
-# EMAIL_TIMEOUT = 30
-
-# Opción 2: Usando servidor SMTP personalizado (para producción)
-# EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
-# EMAIL_HOST = 'mail.autoparts.cl'
-# EMAIL_PORT = 587
-# EMAIL_USE_TLS = True
-# EMAIL_HOST_USER = 'ventas@autoparts.cl'
-# EMAIL_HOST_PASSWORD = 'tu-password-smtp'
-
-
+# Cuenta SMTP del proveedor (Gmail por defecto) desde .env (ver .env.example). Con EMAIL_HOST_USER y
+# EMAIL_HOST_PASSWORD definidos el outbox envía por esa conexión autenticada;
+# sin credenciales los emails solo se muestran en consola (desarrollo)
+EMAIL_HOST = env('EMAIL_HOST', default='smtp.gmail.com')
+EMAIL_PORT = env.int('EMAIL_PORT', default=587)
+EMAIL_USE_TLS = env.bool('EMAIL_USE_TLS', default=True)
+EMAIL_USE_SSL = env.bool('EMAIL_USE_SSL', default=False)
+EMAIL_HOST_USER = env('EMAIL_HOST_USER', default='')
+EMAIL_HOST_PASSWORD = env('EMAIL_HOST_PASSWORD', default='')
+EMAIL_TIMEOUT = env.int('EMAIL_TIMEOUT', default=30)
+EMAIL_BACKEND = env(
+    'EMAIL_BACKEND',
+    default='django.core.mail.backends.smtp.EmailBackend' if EMAIL_HOST_USER and EMAIL_HOST_PASSWORD
+    else 'django.core.mail.backends.console.EmailBackend',
+)
 
 # Email por defecto del remitente
 DEFAULT_FROM_EMAIL = 'AutoParts <ventas.autoparts.2025@gmail.com>'
 EMAIL_SUBJECT_PREFIX = '[AutoParts] '
 
+# Outbox de emails (ver tienda/email_outbox.py y el comando enviar_outbox)
+EMAIL_OUTBOX_BACKEND = env('EMAIL_OUTBOX_BACKEND', default=None)  # None = EMAIL_BACKEND (SMTP con credenciales)
+EMAIL_OUTBOX_PROCESAR_AL_ENCOLAR = DEBUG    # En desarrollo se envía sin worker
+EMAIL_OUTBOX_TAMANO_LOTE = 200
+EMAIL_OUTBOX_MAX_POR_SEGUNDO = env.int('EMAIL_OUTBOX_MAX_POR_SEGUNDO', default=0)  # 0 = sin límite
+EMAIL_OUTBOX_MAX_POR_CONEXION = 100         # Gmail corta sesiones largas
+EMAIL_OUTBOX_MAX_INTENTOS = 5
+
 # Configuración adicional
 
 # ================================
@@ -212,6 +217,85 @@ EMAIL_SUBJECT_PREFIX = '[AutoParts] '
 # Obtén tus credenciales en: https://carapi.app/register
 CARAPI_TOKEN = env('CARAPI_TOKEN')
 CARAPI_SECRET = env('CARAPI_SECRET')
+# 'carapi' = las vistas de marcas/modelos consultan CarAPI; 'local' = espejo en BD
+# (poblar con `python manage.py sincronizar_carapi`)
+VEHICULOS_FUENTE = env('VEHICULOS_FUENTE', default='carapi')
+INDICE_VEHICULOS_REVISION = 30  # Segundos entre revisiones de la versión del índice de autocompletado
 TRANSBANK_COMMERCE_CODE = env('TRANSBANK_COMMERCE_CODE')
 TRANSBANK_API_KEY = env('TRANSBANK_API_KEY')
 CHILEXPRESS_API_KEY = env('CHILEXPRESS_API_KEY')
+# URLs base de los upstreams. Para pruebas de carga sin red, levantar
+# `python manage.py upstreams_falsos` y apuntar estas variables a él.
+CHILEXPRESS_BASE_URL = env('CHILEXPRESS_BASE_URL', default='https://testservices.wschilexpress.com')
+CHILEXPRESS_SIMULACION = env.bool('CHILEXPRESS_SIMULACION', default=True)  # OTs y tracking simulados
+CHILEXPRESS_TCC = env('CHILEXPRESS_TCC', default='')
+CARAPI_BASE_URL = env('CARAPI_BASE_URL', default='https://carapi.app/api')
+TRANSBANK_BASE_URL = env('TRANSBANK_BASE_URL', default=None)  # None = host del SDK según IntegrationType
+CHILEXPRESS_GEO_TTL = 7 * 24 * 3600  # Segundos antes de refrescar regiones/comunas en segundo plano
+CHILEXPRESS_COTIZACION_TTL = 6 * 3600  # Vigencia de una tarifa cotizada en cache
+CHILEXPRESS_COTIZACION_PARALELO = 8    # Hilos para cotizar varios destinos/paquetes a la vez
+CHILEXPRESS_COTIZACION_TIMEOUT = 8     # Segundos máximos por lote de cotizaciones
+CHILEXPRESS_OT_PARALELO = 4            # OTs solicitadas a la vez en el despacho por lote
+CHILEXPRESS_OT_POR_SEGUNDO = 5         # Rate limit del proveedor para OTs
+CHILEXPRESS_OT_RECLAMO_MINUTOS = 30    # Reclamo de una corrida de OTs que murió; luego se libera
+CHILEXPRESS_TRACKING_LOTE = 100        # Pedidos por lote del poller de tracking
+CHILEXPRESS_TRACKING_PARALELO = 4      # Consultas de tracking simultáneas
+CHILEXPRESS_TRACKING_POR_SEGUNDO = 10  # Rate limit del tracking
+# Cajas estándar para el empaque (None = tienda.empaque.CAJAS_ESTANDAR)
+EMPAQUE_CAJAS = None
+
+# ================================
+# Cache compartido entre procesos
+# ================================
+# Versiones de carrito y catálogo (tienda/envios.py, tienda/vehiculos.py), el
+# resumen del header, los locks de cotización y las sesiones tienen que verse
+# igual desde todos los workers de gunicorn y los comandos de manage.py; un
+# LocMemCache es por proceso. Con REDIS_URL se usa Redis; si no, una tabla de
+# la base de datos (creada por la migración 0044).
+REDIS_URL = env('REDIS_URL', default=None)
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'tienda_cache',
+            'OPTIONS': {'MAX_ENTRIES': 50000},
+        }
+    }
+
+# El carrito de invitado vive en la sesión (ver tienda/carrito.py). Sesiones
+# leídas desde el cache solo con Redis: con la tabla de cache cached_db leería
+# la BD dos veces, y un cache por proceso serviría carritos viejos a otro worker
+SESSION_ENGINE = (
+    'django.contrib.sessions.backends.cached_db' if REDIS_URL
+    else 'django.contrib.sessions.backends.db'
+)
+
+# ================================
+# Reposición de stock (tienda/reposicion.py)
+# ================================
+STOCK_DIAS_VENTAS = 30        # Ventana de PedidoItem para la velocidad de venta
+STOCK_DIAS_COBERTURA = 14     # Días de venta que debería cubrir un pedido sugerido al proveedor
+STOCK_VENTAS_CACHE_TTL = 3600 # Segundos que se reutiliza la velocidad de venta calculada
+
+# ================================
+# Limpieza de datos antiguos (tienda/limpieza.py, comando limpiar_datos)
+# ================================
+LIMPIEZA_DIAS_CARRITOS = 30   # Carritos inactivos (ya comprados) que se conservan
+LIMPIEZA_DIAS_PEDIDOS = 30    # Pedidos 'pendiente' sin pagar que se conservan
+LIMPIEZA_DIAS_ARCHIVOS = 7    # Antigüedad mínima de un PDF huérfano antes de borrarlo
+LIMPIEZA_LOTE = 500           # Filas por lote (una transacción corta por lote)
+LIMPIEZA_PAUSA = 0.5          # Segundos entre lotes
+
+# ================================
+# Cliente HTTP saliente (tienda/http_client.py)
+# ================================
+# Sobrescribe timeouts/reintentos/circuit breaker por upstream, ej:
+# 'chilexpress': {'timeout_lectura': 5, 'umbral_fallos': 3}
+HTTP_UPSTREAMS = {}
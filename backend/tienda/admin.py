@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Producto, Categoria, Marca, Carrito, PerfilUsuario, Pedido, PedidoItem
+from .models import Producto, Categoria, Marca, Carrito, PerfilUsuario, Pedido, PedidoItem, EmailOutbox, AjusteMasivo, MovimientoStock, SnapshotStock, AlertaStock
+from .inventario import registrar_diferencias
 from django.contrib.auth.models import User
 from django.contrib.auth.admin import UserAdmin
 # Register your models here.
@@ -17,6 +18,14 @@ class ProductoAdmin(admin.ModelAdmin):
     list_display = ('nombre', 'precio', 'fecha_creacion')
     readonly_fields = ('fecha_creacion',)
 
+    def save_model(self, request, obj, form, change):
+        # El cambio de stock hecho a mano queda en el libro de inventario
+        stock_anterior = form.initial.get('stock', 0) if change else 0
+        super().save_model(request, obj, form, change)
+        registrar_diferencias(
+            {obj.pk: stock_anterior}, {obj.pk: obj.stock}, 'ajuste' if change else 'inicial', 'admin', request.user
+        )
+
 @admin.register(Carrito)
 class CarritoAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'creado', 'is_active')
@@ -62,4 +71,48 @@ class PedidoAdmin(admin.ModelAdmin):
 class PedidoItemAdmin(admin.ModelAdmin):
     list_display = ('pedido', 'nombre_producto', 'cantidad', 'precio_unitario', 'subtotal')
     search_fields = ('pedido__order_id', 'nombre_producto')
-    list_filter = ('pedido__fecha',)
\ No newline at end of file
+    list_filter = ('pedido__fecha',)
+
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ('destinatario', 'asunto', 'estado', 'intentos', 'proximo_intento', 'enviado_en')
+    list_filter = ('estado', 'creado')
+    search_fields = ('destinatario', 'asunto', 'pedido__order_id')
+    readonly_fields = ('lote', 'ultimo_error', 'creado', 'enviado_en')
+
+
+@admin.register(AjusteMasivo)
+class AjusteMasivoAdmin(admin.ModelAdmin):
+    list_display = ('id', 'fecha', 'usuario', 'filas_afectadas', 'duracion_ms')
+    list_filter = ('fecha',)
+    readonly_fields = ('usuario', 'reglas', 'filas_afectadas', 'duracion_ms', 'fecha')
+
+
+@admin.register(MovimientoStock)
+class MovimientoStockAdmin(admin.ModelAdmin):
+    list_display = ('fecha', 'producto', 'tipo', 'cantidad', 'referencia', 'usuario')
+    list_filter = ('tipo', 'fecha')
+    search_fields = ('producto__nombre', 'producto__sku', 'referencia')
+    raw_id_fields = ('producto', 'usuario')
+
+    # Solo se agregan movimientos; las correcciones son movimientos de ajuste
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(SnapshotStock)
+class SnapshotStockAdmin(admin.ModelAdmin):
+    list_display = ('fecha', 'producto', 'stock')
+    list_filter = ('fecha',)
+    search_fields = ('producto__nombre', 'producto__sku')
+    raw_id_fields = ('producto',)
+
+
+@admin.register(AlertaStock)
+class AlertaStockAdmin(admin.ModelAdmin):
+    list_display = ('producto', 'stock', 'punto_reorden', 'desde')
+    search_fields = ('producto__nombre', 'producto__sku')
+    readonly_fields = ('producto', 'stock', 'punto_reorden', 'desde')
@@ -0,0 +1,272 @@
+"""
+Micro-benchmarks de AutoParts
+=============================
+
+Mediciones rápidas de rutas críticas, ejecutables con:
+
+    python manage.py benchmark                  # todas las suites
+    python manage.py benchmark email_templates  # una suite
+
+Cada suite retorna una lista de filas {'caso': str, 'n': int, 'ms_por_op': float}
+para que el comando las imprima o se comparen entre versiones.
+"""
+
+import time
+import statistics
+from types import SimpleNamespace
+
+from django.db import transaction
+
+
+def medir(funcion, repeticiones=200, rondas=5):
+    """
+    Ejecuta `funcion` `repeticiones` veces en varias rondas
+
+    Returns:
+        float: mediana de milisegundos por llamada
+    """
+    tiempos = []
+    for _ in range(rondas):
+        inicio = time.perf_counter()
+        for _ in range(repeticiones):
+            funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000 / repeticiones)
+    return statistics.median(tiempos)
+
+
+class _Rollback(Exception):
+    """Se lanza para deshacer los datos creados por una suite"""
+
+
+def _contexto_falso(cantidad_items):
+    items = [
+        SimpleNamespace(nombre_producto=f'Repuesto {i}', cantidad=1 + i % 3, subtotal=19990 * (1 + i % 3))
+        for i in range(cantidad_items)
+    ]
+    return {
+        'nombre_cliente': 'Cliente Benchmark',
+        'numero_comprobante': 'COMP-BENCH',
+        'order_id': 'BENCH',
+        'monto': sum(item.subtotal for item in items),
+        'items': items,
+        'cliente_email': 'bench@autoparts.cl',
+        'empresa_nombre': 'AutoParts',
+        'empresa_url': 'https://autoparts.cl',
+        'soporte_email': 'soporte@autoparts.cl',
+    }
+
+
+def suite_email_templates():
+    """Costo de render por mensaje: plantilla cacheada vs compilar en cada envío"""
+    from django.template import Context, Engine
+    from .email_templates import DIRECTORIO_PLANTILLAS, renderizar_email
+
+    filas = []
+    contexto = _contexto_falso(3)
+
+    def sin_cache():
+        motor = Engine(
+            dirs=[DIRECTORIO_PLANTILLAS],
+            loaders=['django.template.loaders.filesystem.Loader'],
+            libraries={'custom_filters': 'tienda.templatetags.custom_filters'},
+        )
+        motor.get_template('emails/comprobante.html').render(Context(contexto))
+        motor.get_template('emails/comprobante.txt').render(Context(contexto))
+
+    filas.append({'caso': 'comprobante sin cache', 'n': 50, 'ms_por_op': medir(sin_cache, 50)})
+    filas.append({
+        'caso': 'comprobante cacheado',
+        'n': 200,
+        'ms_por_op': medir(lambda: renderizar_email('comprobante', contexto)),
+    })
+
+    # El costo debe crecer con la cantidad de ítems, no con el tamaño de la plantilla
+    for cantidad in (1, 10, 100):
+        contexto_items = _contexto_falso(cantidad)
+        filas.append({
+            'caso': f'comprobante cacheado ({cantidad} ítems)',
+            'n': 100,
+            'ms_por_op': medir(lambda: renderizar_email('comprobante', contexto_items), 100),
+        })
+    return filas
+
+
+def suite_outbox(cantidad=1000):
+    """Encolar y enviar `cantidad` comprobantes por el backend locmem"""
+    from django.core import mail
+    from .email_outbox import encolar_email, procesar_outbox
+    from .email_templates import renderizar_email
+
+    html, texto = renderizar_email('comprobante', _contexto_falso(3))
+    filas = []
+    try:
+        with transaction.atomic():
+            inicio = time.perf_counter()
+            for i in range(cantidad):
+                encolar_email(f'cliente{i}@bench.cl', 'Comprobante', html, texto)
+            filas.append({
+                'caso': 'encolar',
+                'n': cantidad,
+                'ms_por_op': (time.perf_counter() - inicio) * 1000 / cantidad,
+            })
+
+            inicio = time.perf_counter()
+            procesar_outbox(
+                tamano_lote=cantidad,
+                max_por_segundo=0,
+                backend='django.core.mail.backends.locmem.EmailBackend',
+            )
+            filas.append({
+                'caso': 'enviar (1 conexión por lote)',
+                'n': cantidad,
+                'ms_por_op': (time.perf_counter() - inicio) * 1000 / cantidad,
+            })
+            raise _Rollback()
+    except _Rollback:
+        pass
+    finally:
+        mail.outbox = []
+    return filas
+
+
+def _lineas_aleatorias(cantidad, semilla=7):
+    import random
+    azar = random.Random(semilla)
+    return [
+        (azar.randint(1, 4), round(azar.uniform(0.1, 4), 2),
+         azar.randint(5, 45), azar.randint(5, 30), azar.randint(3, 20))
+        for _ in range(cantidad)
+    ]
+
+
+def suite_empaque():
+    """Velocidad y calidad del planificador de empaque vs sumar largos"""
+    from .empaque import planificar_empaque, costo_estimado, LARGO_MAXIMO_CM
+
+    filas = []
+    for cantidad in (1, 10, 100):
+        lineas = _lineas_aleatorias(cantidad)
+        paquetes = planificar_empaque(lineas)
+
+        # Heurística anterior: un solo paquete con los largos sumados
+        anterior = [{
+            'largo': sum(c * l for c, _, l, _, _ in lineas),
+            'ancho': max(a for _, _, _, a, _ in lineas),
+            'alto': max(h for _, _, _, _, h in lineas),
+            'peso': sum(c * p for c, p, _, _, _ in lineas),
+        }]
+        # Calidad: kg cobrables del plan vs el paquete apilado (y si este excede el largo máximo)
+        excede = ' excede largo' if anterior[0]['largo'] > LARGO_MAXIMO_CM else ''
+        filas.append({
+            'caso': (
+                f'empaque {cantidad} líneas: {len(paquetes)} bultos, '
+                f'{costo_estimado(paquetes):.1f} vs {costo_estimado(anterior):.1f} kg{excede}'
+            ),
+            'n': 20,
+            'ms_por_op': medir(lambda: planificar_empaque(lineas), 20, 3),
+        })
+    return filas
+
+
+def suite_upstreams(latencia_ms=20):
+    """Checkout contra los upstreams falsos: rating, tx.create/commit y CarAPI sin red"""
+    from transbank.webpay.webpay_plus.transaction import Transaction, WebpayOptions
+    from transbank.common.integration_type import IntegrationType
+    from .car_api import CarAPIClient
+    from .chilexpress import cotizar_tarifas, _datos_rating
+    from .upstreams_falsos import iniciar_en_hilo, apuntar_a
+
+    servidor = iniciar_en_hilo(latencia_ms=latencia_ms, semilla=7)
+    filas = []
+    try:
+        with apuntar_a(servidor):
+            paquete = {'peso': 2.5, 'largo': 30, 'ancho': 20, 'alto': 15}
+            datos = _datos_rating(paquete, 'PROV', 49990)
+            filas.append({
+                'caso': f'rating Chilexpress (latencia {latencia_ms} ms)',
+                'n': 20,
+                'ms_por_op': medir(lambda: cotizar_tarifas(datos), 20, 3),
+            })
+
+            tx = Transaction(WebpayOptions('597055555532', 'clave', IntegrationType.TEST))
+
+            def pagar():
+                creada = tx.create('BENCH', 'sesion', 49990, 'http://127.0.0.1/confirmar/')
+                tx.commit(creada['token'])
+
+            filas.append({'caso': 'Webpay tx.create + tx.commit', 'n': 20, 'ms_por_op': medir(pagar, 20, 3)})
+
+            cliente = CarAPIClient()
+            filas.append({
+                'caso': 'CarAPI models/v2 (1 página)',
+                'n': 20,
+                'ms_por_op': medir(lambda: cliente._make_request('models/v2', {'make': 'Toyota'}), 20, 3),
+            })
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
+    return filas
+
+
+def suite_autocompletar(cantidad_marcas=40, modelos_por_marca=60):
+    """Consultas de autocompletado sobre un índice de ~2.400 modelos (sin BD)"""
+    from .indice_vehiculos import IndiceVehiculos
+
+    marcas = [(i, f'Marca {i:02d}') for i in range(cantidad_marcas)]
+    modelos = [
+        (i * 1000 + j, f'Modelo {j:03d}', nombre, 1990 + j % 30, None if j % 3 else 2000 + j % 25)
+        for i, nombre in marcas for j in range(modelos_por_marca)
+    ]
+    inicio = time.perf_counter()
+    indice = IndiceVehiculos(marcas, modelos)
+    filas = [{'caso': 'construir índice', 'n': 1, 'ms_por_op': (time.perf_counter() - inicio) * 1000}]
+    for consulta in ('mar', 'marca 07 mod', 'modelo 01', 'marca 07 modelo 0 2005'):
+        filas.append({
+            'caso': f'autocompletar "{consulta}"',
+            'n': 1000,
+            'ms_por_op': medir(lambda: indice.buscar(consulta), 1000),
+        })
+    return filas
+
+
+def suite_precios(cantidad=100_000):
+    """Ajuste masivo (+7% y mayorista = precio × 0.85) sobre `cantidad` productos"""
+    from .models import Categoria, Producto
+    from .precios import aplicar_ajuste
+
+    filas = []
+    try:
+        with transaction.atomic():
+            categoria = Categoria.objects.create(nombre='Benchmark')
+            Producto.objects.bulk_create([
+                Producto(nombre=f'Repuesto {i}', precio=10000 + i % 5000, descripcion='-', stock=5,
+                         categoria=categoria, peso='1.00', largo=10, ancho=10, alto=10)
+                for i in range(cantidad)
+            ], batch_size=5000)
+
+            reglas = [
+                {'campo': 'precio', 'operacion': 'porcentaje', 'valor': 7, 'filtro': {'categoria': categoria.id}},
+                {'campo': 'precio_mayorista', 'operacion': 'multiplicar', 'valor': 0.85, 'base': 'precio',
+                 'filtro': {'categoria': categoria.id}, 'redondeo': 10},
+            ]
+            inicio = time.perf_counter()
+            aplicar_ajuste(reglas)
+            filas.append({
+                'caso': f'ajuste masivo 2 reglas ({cantidad} productos, total ms)',
+                'n': 1,
+                'ms_por_op': (time.perf_counter() - inicio) * 1000,
+            })
+            raise _Rollback()
+    except _Rollback:
+        pass
+    return filas
+
+
+SUITES = {
+    'email_templates': suite_email_templates,
+    'outbox': suite_outbox,
+    'empaque': suite_empaque,
+    'upstreams': suite_upstreams,
+    'autocompletar': suite_autocompletar,
+    'precios': suite_precios,
+}
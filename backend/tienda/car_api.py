@@ -1,35 +1,83 @@
 """
 Integración con CarAPI para obtener datos de vehículos
 https://carapi.app/docs/
+
+El cliente es perezoso: crear la instancia (al importar el módulo) no hace
+ninguna llamada de red. El login ocurre en la primera petición, el JWT se
+renueva antes de que venza (claim `exp`) y un lock evita que varios hilos
+hagan login a la vez.
 """
+import json
+import time
+import base64
 import requests
 import logging
+import threading
 from django.conf import settings
 from django.core.cache import cache
 
+from .http_client import obtener_cliente
+
 logger = logging.getLogger(__name__)
 
+# Segundos antes del vencimiento en que se renueva el token
+MARGEN_RENOVACION_JWT = 60
+# Vigencia asumida si el token no trae `exp`
+VIGENCIA_JWT_POR_DEFECTO = 3600
+# Tras un login fallido no se reintenta hasta pasado este tiempo
+ESPERA_TRAS_FALLO_LOGIN = 30
+
+
+def expiracion_jwt(token):
+    """Timestamp `exp` del JWT (sin verificar firma) o None si no se puede leer"""
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))['exp'])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
 class CarAPIClient:
-    BASE_URL = "https://carapi.app/api"
+    BASE_URL = getattr(settings, 'CARAPI_BASE_URL', "https://carapi.app/api").rstrip('/')
     
     def __init__(self):
-        # Configurar autenticación con JWT
+        # Sesión compartida (pool + timeouts + circuit breaker); no abre conexiones todavía
+        self.http = obtener_cliente('carapi')
+        
+        # El JWT se obtiene en la primera petición, no al construir el cliente
         self.jwt_token = None
+        self.token_expira = 0
+        self.reintentar_login_desde = 0
+        self._lock = threading.Lock()
         self.headers = {
             'Accept': 'application/json',
             'User-Agent': 'AutoParts-Django/1.0',
             'Content-Type': 'application/json'
         }
-        
-        # Intentar autenticarse al inicializar
-        self._authenticate()
     
-    def _authenticate(self):
+    def _token_vigente(self):
+        return bool(self.jwt_token) and time.time() < self.token_expira - MARGEN_RENOVACION_JWT
+    
+    def _authenticate(self, token_rechazado=None):
         """
-        Obtiene un JWT token desde CarAPI
+        Obtiene un JWT token desde CarAPI (un solo hilo a la vez)
+        
+        Args:
+            token_rechazado: token que recibió 401; si otro hilo ya lo
+                reemplazó, no se vuelve a hacer login
         """
+        with self._lock:
+            if token_rechazado is None and self._token_vigente():
+                return
+            if token_rechazado is not None and self.jwt_token != token_rechazado:
+                return
+            if time.monotonic() < self.reintentar_login_desde:
+                return
+            self._login()
+    
+    def _login(self):
         try:
-            # Estas credenciales deberían estar en settings.py o variables de entorno
             auth_data = {
                 "api_token": getattr(settings, 'CARAPI_TOKEN', None),
                 "api_secret": getattr(settings, 'CARAPI_SECRET', None)
@@ -37,10 +85,11 @@ class CarAPIClient:
             
             if not auth_data["api_token"] or not auth_data["api_secret"]:
                 logger.warning("CarAPI credentials not configured. Using free tier.")
+                self.reintentar_login_desde = float('inf')
                 return
             
             auth_url = f"{self.BASE_URL}/auth/login"
-            response = requests.post(auth_url, json=auth_data, timeout=10)
+            response = self.http.post(auth_url, json=auth_data)
             
             if response.status_code == 200:
                 # CarAPI devuelve directamente el token JWT como texto plano, no JSON
@@ -49,23 +98,34 @@ class CarAPIClient:
                 # Verificar que parece un JWT válido (tiene 3 partes separadas por puntos)
                 if jwt_token and jwt_token.count('.') == 2:
                     self.jwt_token = jwt_token
-                    self.headers['Authorization'] = f'Bearer {self.jwt_token}'
+                    self.token_expira = expiracion_jwt(jwt_token) or time.time() + VIGENCIA_JWT_POR_DEFECTO
                     logger.info("CarAPI authentication successful")
-                else:
-                    logger.error("CarAPI authentication failed: Invalid JWT token format")
+                    return
+                logger.error("CarAPI authentication failed: Invalid JWT token format")
             else:
                 logger.error(f"CarAPI authentication failed: {response.status_code} - {response.text}")
                 
         except Exception as e:
             logger.error(f"CarAPI authentication error: {str(e)}")
+        
+        self.jwt_token = None
+        self.reintentar_login_desde = time.monotonic() + ESPERA_TRAS_FALLO_LOGIN
     
     def _ensure_authenticated(self):
         """
-        Verifica que tengamos un token válido
+        Verifica que tengamos un token vigente (lo renueva antes de que venza)
         """
-        if not self.jwt_token:
+        if not self._token_vigente():
             self._authenticate()
     
+    def _headers_peticion(self):
+        # Copia por petición: varios hilos comparten el cliente
+        headers = dict(self.headers)
+        token = self.jwt_token
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        return headers, token
+    
     def _make_request(self, endpoint, params=None):
         """
         Realiza una petición a la API de CarAPI
@@ -75,7 +135,8 @@ class CarAPIClient:
             self._ensure_authenticated()
             
             url = f"{self.BASE_URL}/{endpoint}"
-            response = requests.get(url, headers=self.headers, params=params, timeout=10)
+            headers, token = self._headers_peticion()
+            response = self.http.get(url, headers=headers, params=params)
             
             if response.status_code == 200:
                 try:
@@ -86,9 +147,10 @@ class CarAPIClient:
                     return None
             elif response.status_code == 401:
                 logger.warning("Token expirado, reautenticando...")
-                self._authenticate()
+                self._authenticate(token_rechazado=token)
                 # Reintentar con nuevo token
-                response = requests.get(url, headers=self.headers, params=params, timeout=10)
+                headers, _ = self._headers_peticion()
+                response = self.http.get(url, headers=headers, params=params)
                 if response.status_code == 200:
                     try:
                         return response.json()
@@ -106,6 +168,23 @@ class CarAPIClient:
             logger.error(f"Error de conexión con CarAPI: {str(e)}")
             return None
     
+    def paginar(self, endpoint, params=None, limit=100, max_paginas=200):
+        """
+        Itera todas las filas de un endpoint paginado de CarAPI
+        
+        Raises:
+            Exception: si una página falla (para no sincronizar datos incompletos)
+        """
+        params = dict(params or {}, limit=limit)
+        for page in range(1, max_paginas + 1):
+            params['page'] = page
+            data = self._make_request(endpoint, params)
+            if not data or 'data' not in data:
+                raise Exception(f"CarAPI no respondió la página {page} de {endpoint}")
+            yield from data['data']
+            if not data['data'] or not data.get('collection', {}).get('next'):
+                return
+    
     def get_makes(self, limit=100):
         """
         Obtiene todas las marcas de vehículos disponibles
@@ -321,5 +400,5 @@ class CarAPIClient:
         
         return processed_models
 
-# Instancia global del cliente
+# Instancia global del cliente (no hace login hasta la primera petición)
 car_api_client = CarAPIClient()
@@ -0,0 +1,413 @@
+"""
+Operaciones sobre el carrito activo
+===================================
+
+La base de datos garantiza las dos invariantes del carrito (migración 0042):
+- un solo Carrito con is_active=True por usuario
+- un solo CarritoItem por (carrito, producto)
+
+Con eso cada operación es un UPDATE con F() o un INSERT, sin leer el ítem
+antes y sin carreras entre requests simultáneos:
+- `carrito_activo()`   1 consulta (2 la primera vez)
+- `agregar_item()`     1 UPDATE si el producto ya estaba; si no, 1 INSERT
+- `disminuir_item()`   1 UPDATE, o el DELETE de abajo si la cantidad llega a cero
+- `eliminar_item()`    1 SELECT + 1 DELETE (el DELETE emite post_delete)
+- `aplicar_operaciones()` varias cantidades en una transacción: 1 SELECT de
+  stock/precios, 1 DELETE y 1 INSERT ... ON CONFLICT DO UPDATE
+
+INSERT y DELETE invalidan la versión del carrito de envios.py por señales;
+QuerySet.update() no las emite, así que los UPDATE la invalidan a mano.
+
+`resumen()` (ítems, unidades, subtotal y peso) se guarda en cache por usuario
+junto con la versión del carrito con que se calculó: mientras la versión no
+cambie se sirve sin recalcularlo. Crear, desactivar o borrar un Carrito
+elimina el resumen del usuario. Resumen y versión viven en el cache
+compartido (settings.CACHES), así un cambio atendido por un worker de
+gunicorn se ve en el header que arma cualquier otro. Lo usan el context
+processor del header y CarritoContadorView.
+
+Los invitados no tienen Carrito: su carrito vive en la sesión (ver
+SESSION_ENGINE en settings) como {producto_id: cantidad}, con las mismas respuestas que el
+carrito de la base de datos. Al iniciar sesión `fusionar_sesion()` lo suma al
+carrito del usuario con un solo INSERT ... ON CONFLICT DO UPDATE; el tráfico
+anónimo nunca escribe filas de Carrito ni CarritoItem.
+"""
+
+import logging
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Carrito, CarritoItem, Producto
+from .envios import invalidar_carrito, version_carrito
+
+logger = logging.getLogger(__name__)
+
+CREADO = 'creado'
+ACTUALIZADO = 'actualizado'
+ELIMINADO = 'eliminado'
+SIN_STOCK = 'sin_stock'
+NO_ENCONTRADO = 'no_encontrado'
+MAX_OPERACIONES = 100
+RESUMEN_TIMEOUT = 15 * 60
+CLAVE_SESION = 'carrito_invitado'
+
+
+class OperacionInvalida(ValueError):
+    """El lote de operaciones no se puede aplicar; `detalles` indica qué productos fallaron"""
+
+    def __init__(self, mensaje, detalles=None):
+        super().__init__(mensaje)
+        self.detalles = detalles or []
+
+
+def carrito_activo(user, crear=True):
+    """
+    Carrito activo del usuario (lo crea si no existe y `crear` es True)
+
+    Si dos requests lo crean a la vez, la restricción única hace fallar a uno
+    y ese lee el que creó el otro.
+    """
+    carrito = Carrito.objects.filter(user=user, is_active=True).first()
+    if carrito is not None or not crear:
+        return carrito
+    try:
+        with transaction.atomic():
+            return Carrito.objects.create(user=user, is_active=True)
+    except IntegrityError:
+        return Carrito.objects.get(user=user, is_active=True)
+
+
+def _items(carrito_id, producto_id):
+    return CarritoItem.objects.filter(carrito_id=carrito_id, producto_id=producto_id)
+
+
+def agregar_item(carrito_id, producto_id, cantidad, precio, maximo=None):
+    """
+    Suma `cantidad` al ítem del producto (o lo crea) sin superar `maximo`
+
+    Args:
+        maximo: stock disponible; None = sin límite
+
+    Returns:
+        str: CREADO, ACTUALIZADO o SIN_STOCK
+    """
+    items = _items(carrito_id, producto_id)
+    if maximo is not None:
+        if cantidad > maximo:
+            return SIN_STOCK
+        items = items.filter(cantidad__lte=maximo - cantidad)
+
+    if items.update(cantidad=F('cantidad') + cantidad, precio=precio):
+        invalidar_carrito(carrito_id)
+        return ACTUALIZADO
+    try:
+        with transaction.atomic():
+            CarritoItem.objects.create(
+                carrito_id=carrito_id, producto_id=producto_id, cantidad=cantidad, precio=precio
+            )
+        return CREADO
+    except IntegrityError:
+        # El ítem ya existía y no alcanza el stock, o lo creó otro request recién
+        if items.update(cantidad=F('cantidad') + cantidad, precio=precio):
+            invalidar_carrito(carrito_id)
+            return ACTUALIZADO
+        return SIN_STOCK
+
+
+def disminuir_item(carrito_id, producto_id, cantidad=1):
+    """
+    Resta `cantidad` al ítem; si no queda nada lo elimina
+
+    Returns:
+        str: ACTUALIZADO, ELIMINADO o NO_ENCONTRADO
+    """
+    if _items(carrito_id, producto_id).filter(cantidad__gt=cantidad).update(cantidad=F('cantidad') - cantidad):
+        invalidar_carrito(carrito_id)
+        return ACTUALIZADO
+    return ELIMINADO if eliminar_item(carrito_id, producto_id) else NO_ENCONTRADO
+
+
+def eliminar_item(carrito_id, producto_id):
+    """Quita el producto del carrito; devuelve False si no estaba"""
+    eliminados, _ = _items(carrito_id, producto_id).delete()
+    return bool(eliminados)
+
+
+def vaciar(carrito_id):
+    eliminados, _ = CarritoItem.objects.filter(carrito_id=carrito_id).delete()
+    return eliminados
+
+
+def cantidad_total(carrito_id):
+    """Unidades en el carrito (una consulta SUM)"""
+    return CarritoItem.objects.filter(carrito_id=carrito_id).aggregate(total=Sum('cantidad'))['total'] or 0
+
+
+def contenido(carrito_id):
+    """
+    Ítems y totales del carrito en una consulta
+
+    Returns:
+        dict: {'carrito': [{'producto', 'producto_id', 'cantidad', 'precio'}], 'cantidad_total', 'subtotal'}
+    """
+    items = [
+        {'producto': nombre, 'producto_id': producto_id, 'cantidad': cantidad, 'precio': precio}
+        for producto_id, nombre, cantidad, precio in CarritoItem.objects.filter(carrito_id=carrito_id)
+        .order_by('id').values_list('producto_id', 'producto__nombre', 'cantidad', 'precio')
+    ]
+    return {
+        'carrito': items,
+        'cantidad_total': sum(item['cantidad'] for item in items),
+        'subtotal': sum(item['precio'] * item['cantidad'] for item in items),
+    }
+
+
+def _validar_operaciones(operaciones):
+    """[{'producto_id', 'cantidad'}] -> {producto_id: cantidad} (si se repite, gana la última)"""
+    if not isinstance(operaciones, list) or not operaciones:
+        raise OperacionInvalida("Se requiere una lista de operaciones")
+    if len(operaciones) > MAX_OPERACIONES:
+        raise OperacionInvalida(f"Máximo {MAX_OPERACIONES} operaciones por lote")
+    cantidades = {}
+    for posicion, operacion in enumerate(operaciones, start=1):
+        try:
+            producto_id, cantidad = int(operacion['producto_id']), int(operacion['cantidad'])
+        except (TypeError, KeyError, ValueError):
+            raise OperacionInvalida(f"Operación {posicion}: se requieren producto_id y cantidad enteros")
+        if cantidad < 0:
+            raise OperacionInvalida(f"Operación {posicion}: la cantidad no puede ser negativa")
+        cantidades[producto_id] = cantidad
+    return cantidades
+
+
+def _productos_lote(cantidades, mayorista=False):
+    """
+    {producto_id: (stock, precio)} de todos los productos del lote en una consulta
+
+    Raises:
+        OperacionInvalida: si algún producto no existe o no tiene stock suficiente
+    """
+    productos = {
+        producto_id: (stock, precio_mayorista if mayorista else precio)
+        for producto_id, stock, precio, precio_mayorista in Producto.objects.filter(
+            id__in=cantidades
+        ).values_list('id', 'stock', 'precio', 'precio_mayorista')
+    }
+    detalles = []
+    for producto_id, cantidad in cantidades.items():
+        if producto_id not in productos:
+            detalles.append({'producto_id': producto_id, 'error': 'Producto no encontrado'})
+        elif cantidad > productos[producto_id][0]:
+            detalles.append({'producto_id': producto_id, 'error': 'Stock insuficiente',
+                             'disponible': productos[producto_id][0]})
+    if detalles:
+        raise OperacionInvalida("Algunas operaciones no se pueden aplicar", detalles)
+    return productos
+
+
+def aplicar_operaciones(user, operaciones, mayorista=False):
+    """
+    Fija la cantidad de varios productos del carrito activo de una vez
+
+    Args:
+        operaciones: [{'producto_id': 3, 'cantidad': 2}, ...]; cantidad 0 quita el producto
+        mayorista: usar precio_mayorista (clientes empresa)
+
+    Returns:
+        dict: contenido() del carrito después de aplicar el lote
+
+    Raises:
+        OperacionInvalida: si alguna operación no es válida nada se aplica
+    """
+    cantidades = _validar_operaciones(operaciones)
+    with transaction.atomic():
+        productos = _productos_lote(cantidades, mayorista)
+        carrito = carrito_activo(user)
+        quitar = [producto_id for producto_id, cantidad in cantidades.items() if cantidad == 0]
+        fijar = [
+            CarritoItem(carrito=carrito, producto_id=producto_id, cantidad=cantidad, precio=productos[producto_id][1])
+            for producto_id, cantidad in cantidades.items() if cantidad
+        ]
+        if quitar:
+            CarritoItem.objects.filter(carrito=carrito, producto_id__in=quitar).delete()
+        if fijar:
+            CarritoItem.objects.bulk_create(
+                fijar, update_conflicts=True,
+                unique_fields=['carrito', 'producto'], update_fields=['cantidad', 'precio'],
+            )
+            invalidar_carrito(carrito.id)
+    return contenido(carrito.id)
+
+
+# ================================
+# Resumen cacheado (header)
+# ================================
+
+def _clave_resumen(user_id):
+    return f"carrito:resumen:u{user_id}"
+
+
+@receiver(post_save, sender=Carrito)
+@receiver(post_delete, sender=Carrito)
+def _carrito_modificado(sender, instance, **kwargs):
+    # Un carrito nuevo o desactivado cambia cuál es el carrito activo del usuario
+    cache.delete(_clave_resumen(instance.user_id))
+
+
+def resumen(user):
+    """
+    Resumen del carrito activo: {'carrito_id', 'items', 'unidades', 'subtotal', 'peso'}
+
+    Con cache vigente no hace consultas; si no, una sola (carrito LEFT JOIN ítems).
+    """
+    user_id = getattr(user, 'pk', user)
+    clave = _clave_resumen(user_id)
+    datos = cache.get(clave)
+    if datos is not None and (
+        datos['carrito_id'] is None or datos['version'] == version_carrito(datos['carrito_id'])
+    ):
+        return datos
+
+    filas = list(Carrito.objects.filter(user_id=user_id, is_active=True).values_list(
+        'id', 'items__cantidad', 'items__precio', 'items__producto__peso'
+    ))
+    items = [(cantidad, precio, peso) for _, cantidad, precio, peso in filas if cantidad is not None]
+    carrito_id = filas[0][0] if filas else None
+    datos = {
+        'carrito_id': carrito_id,
+        'version': version_carrito(carrito_id) if carrito_id else None,
+        'items': len(items),
+        'unidades': sum(cantidad for cantidad, _, _ in items),
+        'subtotal': sum(cantidad * precio for cantidad, precio, _ in items),
+        'peso': round(float(sum(cantidad * (peso or 0) for cantidad, _, peso in items)), 2),
+    }
+    cache.set(clave, datos, RESUMEN_TIMEOUT)
+    return datos
+
+
+# ================================
+# Carrito de invitado (sesión)
+# ================================
+
+def _carrito_sesion(session):
+    """{producto_id: cantidad} guardado en la sesión (las claves JSON son str)"""
+    return {int(producto_id): cantidad for producto_id, cantidad in session.get(CLAVE_SESION, {}).items()}
+
+
+def _guardar_sesion(session, cantidades):
+    if cantidades:
+        session[CLAVE_SESION] = {str(producto_id): cantidad for producto_id, cantidad in cantidades.items()}
+    else:
+        session.pop(CLAVE_SESION, None)
+
+
+def contenido_sesion(session):
+    """Igual que contenido() pero para el carrito de la sesión (una consulta de productos)"""
+    cantidades = _carrito_sesion(session)
+    productos = {
+        producto_id: (nombre, precio)
+        for producto_id, nombre, precio in Producto.objects.filter(
+            id__in=cantidades
+        ).values_list('id', 'nombre', 'precio')
+    } if cantidades else {}
+    items = [
+        {'producto': productos[producto_id][0], 'producto_id': producto_id,
+         'cantidad': cantidad, 'precio': productos[producto_id][1]}
+        for producto_id, cantidad in cantidades.items() if producto_id in productos
+    ]
+    return {
+        'carrito': items,
+        'cantidad_total': sum(item['cantidad'] for item in items),
+        'subtotal': sum(item['precio'] * item['cantidad'] for item in items),
+    }
+
+
+def unidades_sesion(session):
+    """Unidades del carrito de la sesión, sin consultar la base de datos"""
+    return sum(_carrito_sesion(session).values())
+
+
+def agregar_sesion(session, producto_id, cantidad, maximo=None):
+    """agregar_item() para el carrito de la sesión; devuelve CREADO, ACTUALIZADO o SIN_STOCK"""
+    cantidades = _carrito_sesion(session)
+    actual = cantidades.get(producto_id, 0)
+    if maximo is not None and actual + cantidad > maximo:
+        return SIN_STOCK
+    cantidades[producto_id] = actual + cantidad
+    _guardar_sesion(session, cantidades)
+    return ACTUALIZADO if actual else CREADO
+
+
+def aplicar_operaciones_sesion(session, operaciones):
+    """
+    aplicar_operaciones() para el carrito de la sesión
+
+    Returns:
+        dict: contenido_sesion() después de aplicar el lote
+
+    Raises:
+        OperacionInvalida: si alguna operación no es válida nada se aplica
+    """
+    cambios = _validar_operaciones(operaciones)
+    _productos_lote(cambios)
+    cantidades = _carrito_sesion(session)
+    for producto_id, cantidad in cambios.items():
+        if cantidad:
+            cantidades[producto_id] = cantidad
+        else:
+            cantidades.pop(producto_id, None)
+    _guardar_sesion(session, cantidades)
+    return contenido_sesion(session)
+
+
+def fusionar_sesion(session, user):
+    """
+    Suma el carrito de la sesión al carrito activo del usuario y lo borra de la sesión
+
+    Cada producto queda con la cantidad del carrito más la de la sesión, sin
+    superar el stock; los productos que ya no existen o sin stock se descartan.
+    Hace un número fijo de consultas (carrito, ítems actuales, productos y un
+    INSERT ... ON CONFLICT DO UPDATE) sin importar cuántos productos traiga.
+
+    Returns:
+        int: productos fusionados
+    """
+    cantidades = _carrito_sesion(session)
+    if not cantidades:
+        return 0
+    mayorista = hasattr(user, 'perfilusuario') and user.perfilusuario.empresa
+    with transaction.atomic():
+        carrito = carrito_activo(user)
+        actuales = dict(CarritoItem.objects.filter(
+            carrito=carrito, producto_id__in=cantidades
+        ).values_list('producto_id', 'cantidad'))
+        items = []
+        for producto_id, stock, precio, precio_mayorista in Producto.objects.filter(
+            id__in=cantidades, stock__gt=0
+        ).values_list('id', 'stock', 'precio', 'precio_mayorista'):
+            items.append(CarritoItem(
+                carrito=carrito, producto_id=producto_id,
+                cantidad=min(actuales.get(producto_id, 0) + cantidades[producto_id], stock),
+                precio=precio_mayorista if mayorista else precio,
+            ))
+        if items:
+            CarritoItem.objects.bulk_create(
+                items, update_conflicts=True,
+                unique_fields=['carrito', 'producto'], update_fields=['cantidad', 'precio'],
+            )
+            invalidar_carrito(carrito.id)
+    _guardar_sesion(session, {})
+    logger.info(f"🛒 Carrito de invitado fusionado para {user}: {len(items)} productos")
+    return len(items)
+
+
+@receiver(user_logged_in)
+def _fusionar_al_iniciar_sesion(sender, request, user, **kwargs):
+    # login() conserva los datos de la sesión anónima al rotar la clave
+    if request is not None and hasattr(request, 'session'):
+        fusionar_sesion(request.session, user)
@@ -1,14 +1,28 @@
-import requests
+import time
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 
 # Configuración de logging
 logger = logging.getLogger(__name__)
 
 from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from .http_client import obtener_cliente
+from .cotizaciones import cotizar_con_cache
+from .envios import calcular_perfil
 API_KEY = settings.CHILEXPRESS_API_KEY
+# URL base de la API (apuntar a `manage.py upstreams_falsos` para pruebas offline)
+BASE_URL = getattr(settings, 'CHILEXPRESS_BASE_URL', 'https://testservices.wschilexpress.com').rstrip('/')
 
-# Modo simulación para desarrollo (cambiar a False en producción)
-MODO_SIMULACION = True
+# Cotizaciones en paralelo: hilos compartidos por todo el proceso (acotado)
+COTIZACION_MAX_PARALELO = getattr(settings, 'CHILEXPRESS_COTIZACION_PARALELO', 8)
+COTIZACION_TIMEOUT_LOTE = getattr(settings, 'CHILEXPRESS_COTIZACION_TIMEOUT', 8)
+_pool_cotizaciones = ThreadPoolExecutor(max_workers=COTIZACION_MAX_PARALELO, thread_name_prefix='cotizacion')
+
+# Modo simulación para desarrollo (CHILEXPRESS_SIMULACION=False en producción)
+MODO_SIMULACION = getattr(settings, 'CHILEXPRESS_SIMULACION', True)
 
 # Códigos de comuna más comunes para referencia
 CODIGOS_COMUNAS_COMUNES = {
@@ -26,11 +40,11 @@ CODIGOS_COMUNAS_COMUNES = {
 
 def obtener_regiones():
     """Obtiene todas las regiones disponibles desde Chilexpress"""
-    url = "https://testservices.wschilexpress.com/georeference/api/v1.0/regions"
+    url = f"{BASE_URL}/georeference/api/v1.0/regions"
     headers = {"Ocp-Apim-Subscription-Key": API_KEY}
     
     try:
-        response = requests.get(url, headers=headers)
+        response = obtener_cliente('chilexpress').get(url, headers=headers)
         if response.status_code == 200:
             return response.json().get('regions', [])
         else:
@@ -40,11 +54,11 @@ def obtener_regiones():
 
 def obtener_comunas_por_region(region_id):
     """Obtiene las comunas de una región específica"""
-    url = f"https://testservices.wschilexpress.com/georeference/api/v1.0/coverage-areas?RegionCode={region_id}&type=0"
+    url = f"{BASE_URL}/georeference/api/v1.0/coverage-areas?RegionCode={region_id}&type=0"
     headers = {"Ocp-Apim-Subscription-Key": API_KEY}
     
     try:
-        response = requests.get(url, headers=headers)
+        response = obtener_cliente('chilexpress').get(url, headers=headers)
         if response.status_code == 200:
             return response.json().get('coverageAreas', [])
         else:
@@ -52,132 +66,365 @@ def obtener_comunas_por_region(region_id):
     except Exception as e:
         raise Exception(f"Error conectando con Chilexpress: {str(e)}")
 
+# ================================
+# Caché de geografía (regiones / comunas)
+# ================================
+# La geografía de Chilexpress cambia muy pocas veces al año. Se guarda en el
+# cache de Django y en la tabla GeografiaChilexpress (stale-while-revalidate):
+# - Dato fresco: se responde desde cache
+# - Dato vencido: se responde igual y se refresca en segundo plano
+# - Chilexpress caído: se sigue respondiendo desde el snapshot
+GEO_TTL_FRESCO = getattr(settings, 'CHILEXPRESS_GEO_TTL', 7 * 24 * 3600)
+GEO_CACHE_TIMEOUT = 30 * 24 * 3600
+
+
+class RegionDesconocida(ValueError):
+    """El id de región no está en la lista de regiones de Chilexpress"""
+
+
+def _clave_cache_geo(clave):
+    return f"chilexpress:geo:{clave}"
+
+
+def _cargador_geo(clave):
+    """Función que consulta la API para una clave de geografía"""
+    if clave == 'regiones':
+        return obtener_regiones
+    region_id = clave.split(':', 1)[1]
+    return lambda: obtener_comunas_por_region(region_id)
+
+
+def guardar_geografia(clave, datos):
+    """Persiste un snapshot en la BD y en el cache"""
+    from .models import GeografiaChilexpress
+    ahora = timezone.now()
+    GeografiaChilexpress.objects.update_or_create(
+        clave=clave, defaults={'datos': datos, 'actualizado': ahora}
+    )
+    cache.set(
+        _clave_cache_geo(clave),
+        {'datos': datos, 'actualizado': ahora.timestamp()},
+        GEO_CACHE_TIMEOUT
+    )
+
+
+def refrescar_geografia(clave):
+    """Consulta la API y actualiza el snapshot; si falla se conserva el anterior"""
+    try:
+        datos = _cargador_geo(clave)()
+        if datos:
+            guardar_geografia(clave, datos)
+            logger.info(f"🗺️ Geografía Chilexpress actualizada: {clave} ({len(datos)})")
+        return datos
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo refrescar {clave} desde Chilexpress: {e}")
+        return None
+    finally:
+        cache.delete(_clave_cache_geo(clave) + ':refrescando')
+
+
+def _refrescar_en_segundo_plano(clave):
+    # cache.add es atómico: solo un proceso/hilo lanza el refresco
+    if cache.add(_clave_cache_geo(clave) + ':refrescando', True, 300):
+        threading.Thread(target=refrescar_geografia, args=(clave,), daemon=True).start()
+
+
+def obtener_geografia(clave):
+    """
+    Retorna los datos de geografía para `clave` ('regiones' o 'comunas:<region>')
+
+    Orden: cache -> snapshot en BD -> API en vivo (solo si no hay snapshot)
+    """
+    entrada = cache.get(_clave_cache_geo(clave))
+
+    if entrada is None:
+        from .models import GeografiaChilexpress
+        snapshot = GeografiaChilexpress.objects.filter(clave=clave).first()
+        if snapshot is None:
+            # Primera vez: no hay respaldo, hay que ir a la API. Una respuesta
+            # vacía no se guarda como snapshot
+            datos = _cargador_geo(clave)()
+            if datos:
+                guardar_geografia(clave, datos)
+            return datos
+        entrada = {'datos': snapshot.datos, 'actualizado': snapshot.actualizado.timestamp()}
+        cache.set(_clave_cache_geo(clave), entrada, GEO_CACHE_TIMEOUT)
+
+    if time.time() - entrada['actualizado'] > GEO_TTL_FRESCO:
+        _refrescar_en_segundo_plano(clave)
+    return entrada['datos']
+
+
+def regiones_cacheadas():
+    """Regiones de Chilexpress desde el cache/snapshot local"""
+    return obtener_geografia('regiones')
+
+
+def comunas_cacheadas(region_id):
+    """
+    Comunas de una región desde el cache/snapshot local
+
+    Solo se consultan regiones de regiones_cacheadas(): un id cualquiera
+    (la URL es pública) no llega a la API ni crea filas de snapshot.
+
+    Raises:
+        RegionDesconocida: si `region_id` no es una región de Chilexpress
+    """
+    if region_id not in {region.get('regionId') for region in regiones_cacheadas()}:
+        raise RegionDesconocida(f"Región desconocida: {region_id}")
+    return obtener_geografia(f'comunas:{region_id}')
+
+
+def sincronizar_geografia():
+    """
+    Descarga regiones y comunas de todas las regiones
+
+    Returns:
+        dict: {'regiones': int, 'comunas': int, 'errores': list}
+    """
+    resultado = {'regiones': 0, 'comunas': 0, 'errores': []}
+    regiones = refrescar_geografia('regiones')
+    if regiones is None:
+        resultado['errores'].append('regiones')
+        return resultado
+
+    resultado['regiones'] = len(regiones)
+    for region in regiones:
+        region_id = region.get('regionId')
+        comunas = refrescar_geografia(f'comunas:{region_id}')
+        if comunas is None:
+            resultado['errores'].append(region_id)
+        else:
+            resultado['comunas'] += len(comunas)
+    return resultado
+
 def calcular_tarifas_envio(carrito_items, comuna_destino, subtotal):
     """
-    Calcula las tarifas de envío basándose en los productos del carrito
-    Adaptado de tu código JavaScript
+    Calcula las tarifas de envío a partir de ítems en forma de dict
+    (cantidad, peso, largo, ancho, alto). Para carritos guardados usar
+    cotizar_perfil(perfil_envio(carrito), ...)
     """
-    # Calcular dimensiones del paquete
-    
-    total_peso = 0
-    max_alto = 0
-    max_ancho = 0
-    total_largo = 0
-    
-    for item in carrito_items:
-        cantidad = item.get('cantidad', 1)
-        peso = float(item.get('peso', 0))
-        largo = item.get('largo', 0)
-        ancho = item.get('ancho', 0)
-        alto = item.get('alto', 0)
+    filas = [
+        (item.get('cantidad', 1), 0, item.get('peso', 0), item.get('largo', 0), item.get('ancho', 0), item.get('alto', 0))
+        for item in carrito_items
+    ]
+    return cotizar_perfil(calcular_perfil(filas), comuna_destino, subtotal)
+
+def cotizar_perfil(perfil, comuna_destino, subtotal):
+    """Cotiza un perfil de envío (ver envios.py) hacia la comuna de destino"""
+    resultado = cotizar_destinos(perfil, [comuna_destino], subtotal)[0]
+    if not resultado['success']:
+        raise Exception(f"Error calculando tarifas: {resultado['error']}")
+    return resultado['opciones']
 
-        total_peso += peso * cantidad
-        total_largo += largo * cantidad
-        max_ancho = max(max_ancho, ancho)
-        max_alto = max(max_alto, alto)
+def cotizar_destinos(perfil, destinos, subtotal, timeout=None):
+    """
+    Cotiza un perfil hacia varias comunas en paralelo
+    
+    Todas las combinaciones destino x paquete se envían al pool a la vez, así
+    el lote demora lo que la cotización más lenta y no la suma de todas. Lo que
+    no termina dentro de `timeout` se informa como error sin bloquear el resto.
     
+    Returns:
+        list[dict]: por destino (en el orden recibido) {'comuna_destino', 'success',
+        'opciones'} o {'comuna_destino', 'success': False, 'error'}
+    """
     # Validar dimensiones
-    if total_peso == 0 or total_largo == 0 or max_ancho == 0 or max_alto == 0:
+    if not perfil['valido']:
         raise Exception("Las dimensiones del paquete no son válidas")
     
-    # Preparar datos para la API
-    datos_envio = {
+    # El valor declarado se reparte entre los bultos
+    paquetes = perfil['paquetes']
+    valor_por_paquete = int(subtotal) // len(paquetes)
+    destinos = list(dict.fromkeys(destinos))  # sin duplicados, mismo orden
+    
+    futuros = {
+        destino: [
+            _pool_cotizaciones.submit(
+                cotizar_con_cache, _datos_rating(paquete, destino, valor_por_paquete), cotizar_tarifas
+            )
+            for paquete in paquetes
+        ]
+        for destino in destinos
+    }
+    wait(
+        [futuro for lista in futuros.values() for futuro in lista],
+        timeout=COTIZACION_TIMEOUT_LOTE if timeout is None else timeout
+    )
+    
+    resultados = []
+    for destino in destinos:
+        lista = futuros[destino]
+        if not all(futuro.done() for futuro in lista):
+            error = "Tiempo de espera agotado"
+        else:
+            errores = [futuro.exception() for futuro in lista if futuro.exception()]
+            error = str(errores[0]) if errores else None
+        
+        if error:
+            logger.warning(f"⚠️ Cotización a {destino} sin resultado: {error}")
+            resultados.append({'comuna_destino': destino, 'success': False, 'error': error})
+        else:
+            resultados.append({
+                'comuna_destino': destino,
+                'success': True,
+                'opciones': combinar_cotizaciones([futuro.result() for futuro in lista])
+            })
+    return resultados
+
+def _datos_rating(paquete, comuna_destino, valor_declarado):
+    """Payload de la API de rating para un paquete"""
+    return {
         "originCountyCode": obtener_codigo_origen(),  # Santiago Centro
         "destinationCountyCode": comuna_destino,
         "package": {
-            "weight": round(total_peso, 2),
-            "height": round(max_alto, 2),
-            "width": round(max_ancho, 2),
-            "length": round(total_largo, 2)
+            "weight": round(paquete['peso'], 2),
+            "height": round(paquete['alto'], 2),
+            "width": round(paquete['ancho'], 2),
+            "length": round(paquete['largo'], 2)
         },
         "productType": 3,
         "contentType": 1,
-        "declaredWorth": str(int(subtotal)),
+        "declaredWorth": str(int(valor_declarado)),
         "deliveryTime": 0
     }
+
+def combinar_cotizaciones(cotizaciones):
+    """
+    Suma las tarifas de varios paquetes por servicio; solo se ofrecen los
+    servicios disponibles para todos los paquetes
+    """
+    if len(cotizaciones) == 1:
+        return cotizaciones[0]
     
-    url = "https://testservices.wschilexpress.com/rating/api/v1.0/rates/courier"
+    totales = {}
+    for opciones in cotizaciones:
+        for opcion in opciones:
+            totales.setdefault(opcion['descripcion'], []).append(opcion['precio'])
+    
+    return [
+        {
+            'descripcion': descripcion,
+            'precio': sum(precios),
+            'precio_formateado': f"${sum(precios):,}".replace(',', '.')
+        }
+        for descripcion, precios in totales.items()
+        if len(precios) == len(cotizaciones)
+    ]
+
+def cotizar_tarifas(datos_envio):
+    """Consulta la API de rating de Chilexpress (sin cache)"""
+    url = f"{BASE_URL}/rating/api/v1.0/rates/courier"
     headers = {
         "Content-Type": "application/json",
         "Ocp-Apim-Subscription-Key": API_KEY
     }
     
-    try:
-        response = requests.post(url, headers=headers, json=datos_envio)
-        if response.status_code == 200:
-            data = response.json()
-            opciones = data.get('data', {}).get('courierServiceOptions', [])
-            
-            # Formatear opciones para el frontend
-            opciones_formateadas = []
-            for opcion in opciones:
-                opciones_formateadas.append({
-                    'descripcion': opcion.get('serviceDescription', ''),
-                    'precio': int(opcion.get('serviceValue', 0)),
-                    'precio_formateado': f"${int(opcion.get('serviceValue', 0)):,}".replace(',', '.')
-                })
-            
-            return opciones_formateadas
-        else:
-            raise Exception(f"Error en API Chilexpress: {response.status_code} - {response.text}")
-    except Exception as e:
-        raise Exception(f"Error calculando tarifas: {str(e)}")
+    response = obtener_cliente('chilexpress').post(url, headers=headers, json=datos_envio)
+    if response.status_code == 200:
+        data = response.json()
+        opciones = data.get('data', {}).get('courierServiceOptions', [])
+        
+        # Formatear opciones para el frontend
+        opciones_formateadas = []
+        for opcion in opciones:
+            opciones_formateadas.append({
+                'descripcion': opcion.get('serviceDescription', ''),
+                'precio': int(opcion.get('serviceValue', 0)),
+                'precio_formateado': f"${int(opcion.get('serviceValue', 0)):,}".replace(',', '.')
+            })
+        
+        return opciones_formateadas
+    else:
+        raise Exception(f"Error en API Chilexpress: {response.status_code} - {response.text}")
 
 def generar_envio_chilexpress(pedido):
     """
     Función para generar orden de transporte en Chilexpress
-    Nota: Esta función requiere configuración específica de producción
+    Nota: Esta función requiere configuración específica de producción (CHILEXPRESS_TCC)
     """
-    # Por ahora, simular una respuesta exitosa para desarrollo
-    # En producción, esta función debería usar las credenciales reales de Chilexpress
-    
     if not pedido.envio_domicilio:
         raise Exception("Este pedido es para retiro en tienda, no requiere envío")
     
     if not all([pedido.codigo_comuna_chilexpress, pedido.peso_total]):
         raise Exception("Faltan datos necesarios para generar el envío")
     
-    # Simulación para desarrollo (comentar en producción)
-    import random
-    ot_simulada = f"CX{random.randint(100000, 999999)}"
-    
-    return {
-        "transport_order_number": ot_simulada,
-        "label_url": f"https://etiquetas.chilexpress.cl/{ot_simulada}.pdf",
-        "status": "created"
-    }
+    if MODO_SIMULACION:
+        import random
+        ot_simulada = f"CX{random.randint(100000, 999999)}"
+        return {
+            "transport_order_number": ot_simulada,
+            "label_url": f"https://etiquetas.chilexpress.cl/{ot_simulada}.pdf",
+            "status": "created"
+        }
     
-    # Código real para producción (descomentar cuando tengas credenciales):
-    """
-    api_key = API_KEY
-    url = "https://api.chilexpress.cl/v1/transport-orders"  # URL de producción
-
+    url = f"{BASE_URL}/transport-orders/api/v1.0/transport-orders"
     headers = {
-        "x-api-key": api_key,
-        "Content-Type": "application/json"
+        "Content-Type": "application/json",
+        "Ocp-Apim-Subscription-Key": API_KEY
     }
-
+    # Una pieza por paquete del plan cotizado; los pedidos anteriores al plan
+    # guardado viajan como un solo paquete con las medidas del Pedido
+    paquetes = pedido.paquetes or [{
+        'peso': float(pedido.peso_total),
+        'largo': pedido.largo or 20,
+        'ancho': pedido.ancho or 15,
+        'alto': pedido.alto or 10,
+    }]
     payload = {
-        "client_tcc": "TU_TCC_REAL",  # Necesitas el TCC real de producción
+        "client_tcc": getattr(settings, 'CHILEXPRESS_TCC', ''),
         "reference": str(pedido.order_id),
         "origin_commune_code": "13101",  # Santiago Centro
         "destination_commune_code": pedido.codigo_comuna_chilexpress,
-        "package": {
-            "weight": float(pedido.peso_total),
-            "length": pedido.largo or 20,
-            "width": pedido.ancho or 15,
-            "height": pedido.alto or 10
-        },
+        "packages": [
+            {
+                "weight": float(paquete['peso']),
+                "length": paquete['largo'],
+                "width": paquete['ancho'],
+                "height": paquete['alto'],
+            }
+            for paquete in paquetes
+        ],
         "content_description": f"Pedido #{pedido.order_id} - Autoparts"
     }
+    
+    response = obtener_cliente('chilexpress').post(url, headers=headers, json=payload)
+    if response.status_code in (200, 201):
+        detalle = (response.json().get('data', {}).get('detail') or [{}])[0]
+        return {
+            "transport_order_number": str(detalle.get('transportOrderNumber', '')),
+            "label_url": detalle.get('labelUrl'),
+            "status": "created"
+        }
+    raise Exception(f"Error al generar envío: {response.status_code} - {response.text}")
 
-    response = requests.post(url, headers=headers, json=payload)
-
-    if response.status_code == 201:
-        return response.json()
-    else:
-        raise Exception(f"Error al generar envío: {response.status_code} - {response.text}")
+def consultar_tracking(ot_codigo, referencia=None):
     """
+    Consulta el estado de una orden de transporte en Chilexpress
+    
+    Returns:
+        str: descripción del estado informada por Chilexpress (ej: 'EN TRANSITO')
+    """
+    if MODO_SIMULACION:
+        # Sin credenciales de producción no hay tracking real: la OT sigue en tránsito
+        return 'EN TRANSITO'
+    
+    url = f"{BASE_URL}/transport-orders/api/v1.0/tracking"
+    headers = {
+        "Content-Type": "application/json",
+        "Ocp-Apim-Subscription-Key": API_KEY
+    }
+    payload = {
+        "reference": referencia or ot_codigo,
+        "transportOrderNumber": int(ot_codigo) if str(ot_codigo).isdigit() else ot_codigo,
+        "showTrackingEvents": 0
+    }
+    
+    response = obtener_cliente('chilexpress').post(url, headers=headers, json=payload)
+    if response.status_code == 200:
+        datos = response.json().get('data', {}).get('transportOrderData', {})
+        return datos.get('status', '')
+    raise Exception(f"Error consultando tracking: {response.status_code} - {response.text}")
 
 def obtener_codigo_origen():
     """
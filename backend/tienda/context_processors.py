@@ -5,6 +5,8 @@ Context processors para AutoParts
 Agregan información adicional a todos los templates
 """
 
+from django.utils.functional import SimpleLazyObject
+
 def user_permissions(request):
     """
     Agrega información de permisos del usuario a todos los templates
@@ -28,3 +30,21 @@ def user_permissions(request):
             pass
     
     return context
+
+
+def carrito_resumen(request):
+    """
+    Resumen del carrito activo para el contador del header
+
+    Se lee del cache (tienda/carrito.py) y solo si el template lo usa, así
+    el header ya no necesita pedir /carrito/contador/ al cargar la página.
+    Para invitados se cuentan las unidades del carrito de la sesión.
+    """
+    if not request.user.is_authenticated:
+        from .carrito import unidades_sesion
+        unidades = unidades_sesion(request.session) if hasattr(request, 'session') else 0
+        # Sin unidades en la sesión el header consulta el contador (puede haber login por token)
+        return {'carrito_resumen': {'unidades': unidades} if unidades else None}
+
+    from .carrito import resumen
+    return {'carrito_resumen': SimpleLazyObject(lambda: resumen(request.user))}
@@ -0,0 +1,191 @@
+"""
+Caché de cotizaciones de envío para AutoParts
+=============================================
+
+Las tarifas de Chilexpress dependen del origen, el destino, el paquete y el
+valor declarado. Para reutilizar cotizaciones entre carritos parecidos, el
+paquete se normaliza a "buckets" (se redondea siempre hacia arriba, así la
+tarifa cotizada nunca es menor a la real) y el resultado se guarda en el cache
+de Django con TTL.
+
+Coalescing: si llegan varias cotizaciones idénticas a la vez, solo una llega
+a Chilexpress y las demás esperan su resultado:
+- Dentro del proceso: un Event por clave en vuelo
+- Entre procesos: un lock en el cache (cache.add) y espera con sondeo
+
+Las estadísticas (hits / misses / coalesced) se guardan en el cache y se
+consultan con estadisticas_cotizaciones().
+"""
+
+import math
+import time
+import hashlib
+import logging
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+COTIZACION_TTL = getattr(settings, 'CHILEXPRESS_COTIZACION_TTL', 6 * 3600)
+ESPERA_LOCK = 10  # segundos máximos esperando la cotización de otro proceso
+
+# Tamaño de los buckets
+PESO_BUCKET_KG = 0.5
+DIMENSION_BUCKET_CM = 5
+VALOR_BUCKET_CLP = 10000
+
+PREFIJO = 'chilexpress:cotizacion'
+CONTADORES = ('hits', 'misses', 'coalesced')
+
+
+def _techo(valor, paso):
+    """Redondea hacia arriba al múltiplo de `paso` (mínimo un paso)"""
+    return max(paso, math.ceil(float(valor) / paso) * paso)
+
+
+def normalizar_envio(datos_envio):
+    """
+    Lleva un payload de rating de Chilexpress a sus buckets
+
+    Returns:
+        dict: payload con peso, dimensiones y valor declarado redondeados
+    """
+    paquete = datos_envio['package']
+    normalizado = dict(datos_envio)
+    normalizado['package'] = {
+        'weight': round(_techo(paquete['weight'], PESO_BUCKET_KG), 2),
+        'height': int(_techo(paquete['height'], DIMENSION_BUCKET_CM)),
+        'width': int(_techo(paquete['width'], DIMENSION_BUCKET_CM)),
+        'length': int(_techo(paquete['length'], DIMENSION_BUCKET_CM)),
+    }
+    normalizado['declaredWorth'] = str(int(_techo(int(datos_envio.get('declaredWorth') or 0), VALOR_BUCKET_CLP)))
+    return normalizado
+
+
+def clave_cotizacion(normalizado):
+    """Clave de cache para un payload ya normalizado"""
+    paquete = normalizado['package']
+    partes = (
+        normalizado['originCountyCode'],
+        normalizado['destinationCountyCode'],
+        paquete['weight'], paquete['height'], paquete['width'], paquete['length'],
+        normalizado['declaredWorth'],
+        normalizado.get('productType'), normalizado.get('contentType'),
+    )
+    resumen = hashlib.sha1(':'.join(map(str, partes)).encode()).hexdigest()
+    return f"{PREFIJO}:{resumen}"
+
+
+def _contar(nombre):
+    clave = f"{PREFIJO}:stats:{nombre}"
+    # add + incr: incr falla si la clave no existe (o expiró)
+    cache.add(clave, 0, None)
+    try:
+        cache.incr(clave)
+    except ValueError:
+        cache.set(clave, 1, None)
+
+
+def estadisticas_cotizaciones():
+    """
+    Returns:
+        dict: contadores y tasa de aciertos del cache de cotizaciones
+    """
+    valores = {nombre: cache.get(f"{PREFIJO}:stats:{nombre}", 0) for nombre in CONTADORES}
+    total = sum(valores.values())
+    valores['total'] = total
+    valores['hit_rate'] = round((valores['hits'] + valores['coalesced']) / total, 4) if total else 0.0
+    return valores
+
+
+def reiniciar_estadisticas():
+    cache.delete_many([f"{PREFIJO}:stats:{nombre}" for nombre in CONTADORES])
+
+
+class _Vuelo:
+    """Cotización en curso dentro de este proceso"""
+
+    def __init__(self):
+        self.evento = threading.Event()
+        self.resultado = None
+        self.error = None
+
+
+_en_vuelo = {}
+_en_vuelo_lock = threading.Lock()
+
+
+def cotizar_con_cache(datos_envio, cotizar):
+    """
+    Retorna la cotización para `datos_envio`, usando el cache cuando es posible
+
+    Args:
+        datos_envio: payload de rating de Chilexpress
+        cotizar: función(payload_normalizado) que consulta la API
+
+    Returns:
+        list: opciones de envío
+    """
+    normalizado = normalizar_envio(datos_envio)
+    clave = clave_cotizacion(normalizado)
+
+    resultado = cache.get(clave)
+    if resultado is not None:
+        _contar('hits')
+        return resultado
+
+    # Coalescing dentro del proceso
+    with _en_vuelo_lock:
+        vuelo = _en_vuelo.get(clave)
+        lider = vuelo is None
+        if lider:
+            vuelo = _en_vuelo[clave] = _Vuelo()
+
+    if not lider:
+        vuelo.evento.wait(ESPERA_LOCK)
+        if vuelo.resultado is not None:
+            _contar('coalesced')
+            return vuelo.resultado
+        if vuelo.error is not None:
+            raise vuelo.error
+        # El líder demoró demasiado: cotizar por cuenta propia
+        _contar('misses')
+        return cotizar(normalizado)
+
+    try:
+        vuelo.resultado = _cotizar_entre_procesos(clave, normalizado, cotizar)
+        return vuelo.resultado
+    except Exception as e:
+        vuelo.error = e
+        raise
+    finally:
+        vuelo.evento.set()
+        with _en_vuelo_lock:
+            _en_vuelo.pop(clave, None)
+
+
+def _cotizar_entre_procesos(clave, normalizado, cotizar):
+    """Solo un proceso consulta la API por clave; los demás esperan el cache"""
+    lock = f"{clave}:lock"
+    propio = cache.add(lock, True, ESPERA_LOCK)
+    if not propio:
+        limite = time.monotonic() + ESPERA_LOCK
+        while time.monotonic() < limite:
+            time.sleep(0.05)
+            resultado = cache.get(clave)
+            if resultado is not None:
+                _contar('coalesced')
+                return resultado
+            if cache.get(lock) is None:
+                break
+
+    _contar('misses')
+    try:
+        resultado = cotizar(normalizado)
+        cache.set(clave, resultado, COTIZACION_TTL)
+        return resultado
+    finally:
+        if propio:
+            cache.delete(lock)
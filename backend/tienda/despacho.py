@@ -0,0 +1,220 @@
+"""
+Despacho diario: OTs y etiquetas de Chilexpress por lote
+========================================================
+
+Para la corrida de despacho, bodega necesita la orden de transporte (OT) y
+la etiqueta de todos los pedidos en 'preparacion' de una sola vez:
+- Antes de llamar a Chilexpress cada pedido se reclama con un UPDATE
+  condicional (estado_envio='generando:<epoch>:<lote>'): si el comando y la
+  API corren a la vez, cada pedido queda en un solo lote y no se pagan dos
+  OTs. Los pedidos que fallan (o sin número de OT) se liberan con su
+  estado_envio anterior; si la corrida muere antes (timeout del worker), la
+  siguiente libera los reclamos con más de RECLAMO_MINUTOS minutos
+- Las OTs se piden a Chilexpress en paralelo, con un máximo de peticiones
+  por segundo para no gatillar el rate limit del proveedor
+- ot_codigo, etiqueta_url y estado_envio se guardan con un solo bulk_update
+- Se genera un único PDF con todas las etiquetas (una página de 10x15 cm
+  por pedido) listo para imprimir, guardado con pdf_storage
+"""
+
+import io
+import time
+import uuid
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db.models import Q
+from reportlab.graphics.barcode import code128
+from reportlab.lib.units import mm
+from reportlab.pdfgen import canvas
+
+from .chilexpress import generar_envio_chilexpress
+from .http_client import LimitadorTasa
+from .models import Pedido
+from .pdf_storage import guardar_pdf
+
+logger = logging.getLogger(__name__)
+
+OT_MAX_PARALELO = getattr(settings, 'CHILEXPRESS_OT_PARALELO', 4)
+OT_MAX_POR_SEGUNDO = getattr(settings, 'CHILEXPRESS_OT_POR_SEGUNDO', 5)
+RECLAMO_MINUTOS = getattr(settings, 'CHILEXPRESS_OT_RECLAMO_MINUTOS', 30)
+
+DIRECTORIO_ETIQUETAS = 'etiquetas'
+ESTADO_GENERANDO = 'generando'
+SIN_OT = Q(ot_codigo__isnull=True) | Q(ot_codigo='')
+TAMANO_ETIQUETA = (100 * mm, 150 * mm)
+
+
+def pedidos_por_despachar(order_ids=None):
+    """Pedidos a domicilio en preparación que aún no tienen OT"""
+    pedidos = Pedido.objects.filter(
+        SIN_OT, estado='preparacion', envio_domicilio=True
+    ).exclude(estado_envio__startswith=ESTADO_GENERANDO)
+    if order_ids:
+        pedidos = pedidos.filter(order_id__in=order_ids)
+    return pedidos.order_by('fecha')
+
+
+def _prefijo_reclamo(epoch):
+    # Epoch con ancho fijo: el orden de los textos es el orden de las fechas
+    return f"{ESTADO_GENERANDO}:{int(epoch):010d}"
+
+
+def liberar_reclamados(minutos=RECLAMO_MINUTOS):
+    """
+    Libera los pedidos reclamados hace más de `minutos` que siguen sin OT
+
+    Quedan así cuando la corrida que los reclamó murió antes de su finally.
+
+    Returns:
+        int: pedidos liberados
+    """
+    liberados = Pedido.objects.filter(
+        SIN_OT,
+        estado_envio__startswith=f"{ESTADO_GENERANDO}:",
+        estado_envio__lt=_prefijo_reclamo(time.time() - minutos * 60),
+    ).update(estado_envio=None)
+    if liberados:
+        logger.warning(f"⚠️ {liberados} pedidos con reclamo vencido liberados para reintentar la OT")
+    return liberados
+
+
+def reclamar_pedidos(pedidos):
+    """
+    Marca los pedidos como 'generando:<lote>' con un solo UPDATE condicional
+
+    Solo quedan con nuestro lote los que siguen sin OT y sin otro lote; el
+    resto ya lo tomó otra corrida.
+
+    Returns:
+        list[Pedido]: pedidos reclamados (con el estado_envio previo en memoria)
+    """
+    pedidos = list(pedidos)
+    if not pedidos:
+        return []
+    lote = f"{_prefijo_reclamo(time.time())}:{uuid.uuid4().hex}"
+    Pedido.objects.filter(SIN_OT, id__in=[pedido.id for pedido in pedidos]).exclude(
+        estado_envio__startswith=ESTADO_GENERANDO
+    ).update(estado_envio=lote)
+    reclamados = set(Pedido.objects.filter(estado_envio=lote).values_list('id', flat=True))
+    return [pedido for pedido in pedidos if pedido.id in reclamados]
+
+
+def generar_ots_lote(pedidos, max_paralelo=OT_MAX_PARALELO, max_por_segundo=OT_MAX_POR_SEGUNDO):
+    """
+    Reclama los pedidos y genera sus OTs en paralelo, guardándolas en bloque
+
+    Returns:
+        dict: {'generados': [Pedido], 'errores': [{'order_id', 'error'}]}
+    """
+    pedidos = reclamar_pedidos(pedidos)
+    limitador = LimitadorTasa(max_por_segundo)
+
+    def generar(pedido):
+        limitador.esperar()
+        return generar_envio_chilexpress(pedido)
+
+    generados, errores = [], []
+    try:
+        with ThreadPoolExecutor(max_workers=max_paralelo, thread_name_prefix='ot') as pool:
+            futuros = [(pedido, pool.submit(generar, pedido)) for pedido in pedidos]
+            for pedido, futuro in futuros:
+                try:
+                    resultado = futuro.result()
+                    if not resultado.get('transport_order_number'):
+                        raise ValueError('Chilexpress no devolvió número de OT')
+                except Exception as e:
+                    logger.warning(f"⚠️ No se pudo generar la OT del pedido {pedido.order_id}: {e}")
+                    errores.append({'order_id': pedido.order_id, 'error': str(e)})
+                    continue
+                pedido.ot_codigo = resultado['transport_order_number']
+                pedido.etiqueta_url = resultado.get('label_url')
+                pedido.estado_envio = 'generado'
+                generados.append(pedido)
+    finally:
+        Pedido.objects.bulk_update(generados, ['ot_codigo', 'etiqueta_url', 'estado_envio'])
+        # Liberar el reclamo de los que no obtuvieron OT (vuelven a su estado_envio anterior)
+        Pedido.objects.bulk_update([pedido for pedido in pedidos if not pedido.ot_codigo], ['estado_envio'])
+    logger.info(f"🚚 OTs generadas: {len(generados)} | errores: {len(errores)}")
+    return {'generados': generados, 'errores': errores}
+
+
+def _dibujar_etiqueta(lienzo, pedido):
+    ancho, alto = TAMANO_ETIQUETA
+    margen = 6 * mm
+
+    lienzo.setFont('Helvetica-Bold', 16)
+    lienzo.drawString(margen, alto - 14 * mm, 'CHILEXPRESS')
+    lienzo.setFont('Helvetica', 9)
+    lienzo.drawRightString(ancho - margen, alto - 14 * mm, f"Pedido {pedido.order_id}")
+
+    codigo = code128.Code128(pedido.ot_codigo or '', barHeight=22 * mm, barWidth=0.45 * mm)
+    codigo.drawOn(lienzo, (ancho - codigo.width) / 2, alto - 44 * mm)
+    lienzo.setFont('Helvetica-Bold', 14)
+    lienzo.drawCentredString(ancho / 2, alto - 51 * mm, f"OT {pedido.ot_codigo}")
+
+    lienzo.setFont('Helvetica-Bold', 10)
+    lienzo.drawString(margen, alto - 64 * mm, 'DESTINATARIO')
+    lienzo.setFont('Helvetica', 10)
+    lineas = [
+        pedido.email,
+        pedido.direccion or '',
+        f"{pedido.comuna or ''} ({pedido.codigo_comuna_chilexpress or ''})",
+        pedido.region or '',
+    ]
+    for i, linea in enumerate(lineas):
+        lienzo.drawString(margen, alto - (71 + i * 6) * mm, linea[:55])
+
+    lienzo.setFont('Helvetica-Bold', 10)
+    lienzo.drawString(margen, alto - 102 * mm, 'PAQUETE')
+    lienzo.setFont('Helvetica', 10)
+    lienzo.drawString(margen, alto - 109 * mm, f"Peso: {pedido.peso_total or 0} kg")
+    lienzo.drawString(margen, alto - 115 * mm, f"Medidas: {pedido.largo or 0}x{pedido.ancho or 0}x{pedido.alto or 0} cm")
+    lienzo.drawString(margen, alto - 121 * mm, f"Bultos: {len(pedido.paquetes or []) or 1}")
+
+    lienzo.setFont('Helvetica', 8)
+    lienzo.drawString(margen, 8 * mm, 'Remitente: AutoParts Chile - Santiago Centro')
+    lienzo.showPage()
+
+
+def generar_etiquetas_pdf(pedidos):
+    """
+    Une las etiquetas de los pedidos en un solo PDF para imprimir
+
+    Returns:
+        dict: {'sha256', 'pdf_path', 'creado', 'paginas'} o None si no hay pedidos con OT
+    """
+    pedidos = [pedido for pedido in pedidos if pedido.ot_codigo]
+    if not pedidos:
+        return None
+
+    buffer = io.BytesIO()
+    # invariant: mismo lote -> mismo PDF -> mismo hash (no se duplica en disco)
+    lienzo = canvas.Canvas(buffer, pagesize=TAMANO_ETIQUETA, invariant=1)
+    lienzo.setTitle('Etiquetas de despacho AutoParts')
+    for pedido in pedidos:
+        _dibujar_etiqueta(lienzo, pedido)
+    lienzo.save()
+
+    resultado = guardar_pdf(buffer.getvalue(), DIRECTORIO_ETIQUETAS)
+    resultado['paginas'] = len(pedidos)
+    return resultado
+
+
+def despachar_lote(order_ids=None, **opciones):
+    """
+    Corrida completa: OTs para los pedidos pendientes + PDF de etiquetas
+
+    Returns:
+        dict: {'generados': int, 'errores': list, 'etiquetas': dict|None}
+    """
+    liberar_reclamados()
+    resultado = generar_ots_lote(pedidos_por_despachar(order_ids), **opciones)
+    etiquetas = generar_etiquetas_pdf(resultado['generados'])
+    return {
+        'generados': len(resultado['generados']),
+        'order_ids': [pedido.order_id for pedido in resultado['generados']],
+        'errores': resultado['errores'],
+        'etiquetas': etiquetas,
+    }
@@ -0,0 +1,232 @@
+"""
+Cola de emails salientes (outbox) para AutoParts
+================================================
+
+Los request handlers solo encolan emails en la tabla EmailOutbox. El envío lo
+hace un worker (comando `enviar_outbox`) que:
+- Reclama lotes de emails pendientes
+- Reutiliza UNA conexión autenticada (get_connection) para todo el lote
+- Respeta un máximo de emails por segundo y por conexión del proveedor
+- Reintenta fallos transitorios con backoff exponencial
+- Registra el estado de entrega de cada email
+"""
+
+import time
+import uuid
+import socket
+import smtplib
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.utils import timezone
+from django.utils.html import strip_tags
+
+from .models import EmailOutbox
+from .pdf_storage import crear_adjunto_pdf
+from .http_client import LimitadorTasa
+
+logger = logging.getLogger(__name__)
+
+# Configuración (sobrescribible en settings.py)
+TAMANO_LOTE = getattr(settings, 'EMAIL_OUTBOX_TAMANO_LOTE', 200)
+MAX_POR_SEGUNDO = getattr(settings, 'EMAIL_OUTBOX_MAX_POR_SEGUNDO', 0)  # 0 = sin límite
+MAX_POR_CONEXION = getattr(settings, 'EMAIL_OUTBOX_MAX_POR_CONEXION', 100)
+MAX_INTENTOS = getattr(settings, 'EMAIL_OUTBOX_MAX_INTENTOS', 5)
+BACKOFF_BASE = getattr(settings, 'EMAIL_OUTBOX_BACKOFF_SEGUNDOS', 60)
+
+# Errores de red que dejan la conexión inutilizable
+ERRORES_CONEXION = (
+    smtplib.SMTPServerDisconnected,
+    socket.timeout,
+    ConnectionError,
+)
+
+# Errores que justifican reintentar más tarde: solo fallas de red/SMTP. Otros
+# OSError (p. ej. FileNotFoundError de un adjunto que ya no existe) no se
+# arreglan reintentando y el email queda 'fallido' al primer intento
+ERRORES_TRANSITORIOS = ERRORES_CONEXION + (
+    socket.gaierror,
+    smtplib.SMTPConnectError,
+)
+
+
+def encolar_email(destinatario, asunto, cuerpo_html, cuerpo_texto='', adjunto_path=None,
+                  adjunto_nombre=None, pedido=None, reply_to=None):
+    """
+    Agrega un email a la cola de salida
+
+    Returns:
+        EmailOutbox: registro creado
+    """
+    email = EmailOutbox.objects.create(
+        destinatario=destinatario,
+        asunto=asunto,
+        cuerpo_html=cuerpo_html,
+        cuerpo_texto=cuerpo_texto or strip_tags(cuerpo_html),
+        adjunto_path=adjunto_path,
+        adjunto_nombre=adjunto_nombre,
+        pedido=pedido,
+        reply_to=reply_to,
+    )
+    logger.info(f"📨 Email encolado para {destinatario}: {asunto}")
+
+    if getattr(settings, 'EMAIL_OUTBOX_PROCESAR_AL_ENCOLAR', False):
+        # Desarrollo: vaciar la cola en segundo plano apenas se confirme la transacción
+        transaction.on_commit(procesar_en_segundo_plano)
+
+    return email
+
+
+def procesar_en_segundo_plano():
+    """Lanza procesar_outbox() en un hilo para no bloquear el request"""
+    hilo = threading.Thread(target=procesar_outbox, name='email-outbox', daemon=True)
+    hilo.start()
+    return hilo
+
+
+def reclamar_lote(tamano=TAMANO_LOTE):
+    """
+    Marca como 'enviando' un lote de emails pendientes y vencidos
+
+    El UPDATE condicionado por estado evita que dos workers tomen el mismo
+    email: solo las filas que sigan 'pendiente' quedan con nuestro lote.
+
+    Returns:
+        list[EmailOutbox]: emails reclamados por este worker
+    """
+    ahora = timezone.now()
+    ids = list(
+        EmailOutbox.objects
+        .filter(estado='pendiente', proximo_intento__lte=ahora)
+        .order_by('proximo_intento', 'id')
+        .values_list('id', flat=True)[:tamano]
+    )
+    if not ids:
+        return []
+
+    lote = uuid.uuid4().hex
+    EmailOutbox.objects.filter(id__in=ids, estado='pendiente').update(
+        estado='enviando', lote=lote, proximo_intento=ahora
+    )
+    return list(EmailOutbox.objects.filter(lote=lote, estado='enviando').order_by('id'))
+
+
+def construir_mensaje(email, connection=None):
+    """Convierte un registro EmailOutbox en EmailMultiAlternatives"""
+    mensaje = EmailMultiAlternatives(
+        subject=email.asunto,
+        body=email.cuerpo_texto or strip_tags(email.cuerpo_html),
+        from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', 'ventas@autoparts.cl'),
+        to=[email.destinatario],
+        reply_to=[email.reply_to] if email.reply_to else None,
+        connection=connection,
+    )
+    if email.cuerpo_html:
+        mensaje.attach_alternative(email.cuerpo_html, 'text/html')
+
+    if email.adjunto_path:
+        mensaje.attach(crear_adjunto_pdf(email.adjunto_path, email.adjunto_nombre or 'documento.pdf'))
+
+    return mensaje
+
+
+def _es_transitorio(error):
+    """Errores 4xx de SMTP y fallas de red se reintentan; 5xx son definitivos"""
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= codigo < 500 for codigo, _ in error.recipients.values())
+    return isinstance(error, ERRORES_TRANSITORIOS)
+
+
+def procesar_outbox(tamano_lote=TAMANO_LOTE, max_por_segundo=MAX_POR_SEGUNDO,
+                    max_por_conexion=MAX_POR_CONEXION, backend=None):
+    """
+    Envía un lote de emails pendientes reutilizando una conexión SMTP
+
+    Returns:
+        dict: {'enviados': int, 'reintentos': int, 'fallidos': int}
+    """
+    emails = reclamar_lote(tamano_lote)
+    resultado = {'enviados': 0, 'reintentos': 0, 'fallidos': 0}
+    if not emails:
+        return resultado
+
+    backend = backend or getattr(settings, 'EMAIL_OUTBOX_BACKEND', None)
+    connection = get_connection(backend=backend)
+    limitador = LimitadorTasa(max_por_segundo)
+    enviados_en_conexion = 0
+    enviados, reintentos, fallidos = [], [], []
+
+    try:
+        connection.open()
+        for email in emails:
+            # Algunos proveedores cortan la sesión tras N mensajes: reconectar antes
+            if max_por_conexion and enviados_en_conexion >= max_por_conexion:
+                connection.close()
+                connection.open()
+                enviados_en_conexion = 0
+
+            limitador.esperar()
+            email.intentos += 1
+            try:
+                connection.send_messages([construir_mensaje(email, connection)])
+                enviados_en_conexion += 1
+                email.estado = 'enviado'
+                email.enviado_en = timezone.now()
+                email.ultimo_error = None
+                enviados.append(email)
+            except Exception as e:
+                email.ultimo_error = str(e)
+                if _es_transitorio(e) and email.intentos < MAX_INTENTOS:
+                    email.estado = 'pendiente'
+                    email.proximo_intento = timezone.now() + timedelta(
+                        seconds=BACKOFF_BASE * (2 ** (email.intentos - 1))
+                    )
+                    reintentos.append(email)
+                else:
+                    email.estado = 'fallido'
+                    fallidos.append(email)
+                logger.warning(f"⚠️ Error enviando email {email.id} a {email.destinatario}: {e}")
+
+                # La conexión puede haber quedado inutilizable
+                if isinstance(e, ERRORES_CONEXION):
+                    connection.close()
+                    connection.open()
+                    enviados_en_conexion = 0
+    except Exception as e:
+        # No se pudo abrir la conexión: devolver lo no procesado a la cola
+        logger.error(f"❌ Error con la conexión de email: {e}")
+        procesados = {email.id for email in enviados + reintentos + fallidos}
+        for email in emails:
+            if email.id not in procesados:
+                email.estado = 'pendiente'
+                email.ultimo_error = str(e)
+                email.proximo_intento = timezone.now() + timedelta(seconds=BACKOFF_BASE)
+                reintentos.append(email)
+    finally:
+        connection.close()
+
+    EmailOutbox.objects.bulk_update(
+        enviados + reintentos + fallidos,
+        ['estado', 'intentos', 'proximo_intento', 'ultimo_error', 'enviado_en']
+    )
+
+    resultado.update(enviados=len(enviados), reintentos=len(reintentos), fallidos=len(fallidos))
+    logger.info(f"📬 Outbox procesado: {resultado}")
+    return resultado
+
+
+def liberar_reclamados(antiguedad_minutos=15):
+    """Devuelve a 'pendiente' emails que quedaron 'enviando' por un worker caído
+
+    Al reclamar un lote, proximo_intento se fija a la hora del reclamo.
+    """
+    limite = timezone.now() - timedelta(minutes=antiguedad_minutos)
+    return EmailOutbox.objects.filter(estado='enviando', proximo_intento__lte=limite).update(
+        estado='pendiente', lote=None
+    )
@@ -0,0 +1,74 @@
+"""
+Plantillas de email precompiladas para AutoParts
+================================================
+
+Los cuerpos de los emails se renderizan desde tienda/templates/emails/ con un
+Engine propio que usa el loader cacheado: cada plantilla se compila una sola
+vez por proceso y los envíos siguientes solo pagan el render.
+
+Cada email tiene dos variantes:
+- <nombre>.html: HTML con estilos ya en línea (los clientes de correo ignoran <style>)
+- <nombre>.txt: texto plano para la alternativa text/plain
+"""
+
+import os
+import logging
+
+from django.conf import settings
+from django.template import Context, Engine, TemplateDoesNotExist
+
+logger = logging.getLogger(__name__)
+
+DIRECTORIO_PLANTILLAS = os.path.join(os.path.dirname(__file__), 'templates')
+
+# Engine independiente de TEMPLATES: sin context processors y siempre cacheado
+motor_emails = Engine(
+    dirs=[DIRECTORIO_PLANTILLAS],
+    loaders=[
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+        ]),
+    ],
+    libraries={'custom_filters': 'tienda.templatetags.custom_filters'},
+    debug=False,
+)
+
+
+def renderizar_email(nombre, contexto):
+    """
+    Renderiza las variantes HTML y texto de un email
+
+    Args:
+        nombre: nombre base de la plantilla (ej: 'comprobante')
+        contexto: dict con las variables de la plantilla
+
+    Returns:
+        tuple: (html, texto). texto es '' si no existe la variante .txt
+    """
+    html = motor_emails.get_template(f'emails/{nombre}.html').render(Context(contexto))
+    try:
+        texto = motor_emails.get_template(f'emails/{nombre}.txt').render(Context(contexto))
+    except TemplateDoesNotExist:
+        texto = ''
+    return html, texto.strip()
+
+
+def contexto_comprobante(pedido, cliente_email, numero_comprobante, nombre_cliente='Cliente'):
+    """Variables comunes del email de comprobante"""
+    return {
+        'nombre_cliente': nombre_cliente,
+        'numero_comprobante': numero_comprobante,
+        'order_id': pedido.order_id,
+        'monto': pedido.monto,
+        'items': list(pedido.items.all()) if pedido.pk else [],
+        'cliente_email': cliente_email,
+        'empresa_nombre': 'AutoParts',
+        'empresa_url': 'https://autoparts.cl',
+        'soporte_email': getattr(settings, 'SOPORTE_EMAIL', 'soporte@autoparts.cl'),
+    }
+
+
+def limpiar_cache():
+    """Descarta las plantillas compiladas (ej: tras editar archivos en caliente)"""
+    for loader in motor_emails.template_loaders:
+        loader.reset()
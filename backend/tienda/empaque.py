@@ -0,0 +1,243 @@
+"""
+Planificador de empaque para envíos de AutoParts
+================================================
+
+Decide en qué cajas estándar va un carrito, en vez de poner los productos
+"uno tras otro" (sumar largos), que con diez filtros pequeños arma un paquete
+de dos metros.
+
+Algoritmo (heurístico, pensado para correr en milisegundos):
+- Cada unidad se coloca con First Fit Decreasing por volumen
+- Dentro de una caja se usa empaque 3D por espacios libres (guillotina):
+  al colocar una unidad, el espacio que ocupaba se divide en tres cuboides
+  libres y se prueban las 6 orientaciones de la unidad
+- Se evalúan varios planes (todo en un tipo de caja, mezcla de cajas con
+  reducción al tamaño mínimo) y se elige el de menor costo estimado
+- Un producto que no cabe en ninguna caja viaja como paquete propio
+
+Costo estimado: suma por paquete del peso cobrable (máx. entre peso real y
+volumétrico) más un recargo fijo por paquete, que es como cobra Chilexpress.
+
+Las cajas se configuran en settings.EMPAQUE_CAJAS (ver CAJAS_ESTANDAR).
+Un producto sin peso o sin medidas positivas no se puede planificar
+(DimensionesInvalidas).
+"""
+
+import bisect
+import itertools
+import logging
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Medidas interiores en cm, pesos en kg
+CAJAS_ESTANDAR = [
+    {'nombre': 'XS', 'largo': 20, 'ancho': 15, 'alto': 10, 'peso_max': 3, 'peso_caja': 0.10},
+    {'nombre': 'S', 'largo': 30, 'ancho': 20, 'alto': 15, 'peso_max': 5, 'peso_caja': 0.20},
+    {'nombre': 'M', 'largo': 40, 'ancho': 30, 'alto': 20, 'peso_max': 10, 'peso_caja': 0.35},
+    {'nombre': 'L', 'largo': 50, 'ancho': 40, 'alto': 30, 'peso_max': 20, 'peso_caja': 0.55},
+    {'nombre': 'XL', 'largo': 60, 'ancho': 50, 'alto': 40, 'peso_max': 30, 'peso_caja': 0.80},
+]
+
+DIVISOR_VOLUMETRICO = 4000        # cm³ por kg cobrable (Chilexpress)
+RECARGO_POR_PAQUETE_KG = 1.0      # costo fijo aproximado de cada bulto extra
+LARGO_MAXIMO_CM = 100             # sobre esto el courier cobra sobredimensión o rechaza
+
+
+class DimensionesInvalidas(ValueError):
+    """Un producto del carrito no tiene peso o medidas positivas"""
+
+
+def cajas_configuradas():
+    """Cajas disponibles, ordenadas de menor a mayor volumen"""
+    cajas = getattr(settings, 'EMPAQUE_CAJAS', None) or CAJAS_ESTANDAR
+    return sorted(cajas, key=lambda c: c['largo'] * c['ancho'] * c['alto'])
+
+
+def _rotaciones(dims):
+    return tuple(set(itertools.permutations(dims)))
+
+
+def _orientacion(rotaciones, espacio):
+    """Primera rotación que cabe en `espacio`, o None"""
+    for rotada in rotaciones:
+        if rotada[0] <= espacio[0] and rotada[1] <= espacio[1] and rotada[2] <= espacio[2]:
+            return rotada
+    return None
+
+
+class _CajaAbierta:
+    """Caja en proceso de llenado con sus espacios libres"""
+
+    def __init__(self, caja):
+        self.caja = caja
+        largo, ancho, alto = caja['largo'], caja['ancho'], caja['alto']
+        # Espacios libres como (volumen, largo, ancho, alto), ordenados por volumen
+        self.espacios = [(largo * ancho * alto, largo, ancho, alto)]
+        self.peso = caja.get('peso_caja', 0)
+        self.unidades = []
+
+    @property
+    def volumen_libre_max(self):
+        return self.espacios[-1][0] if self.espacios else 0
+
+    def colocar(self, unidad):
+        if self.peso + unidad['peso'] > self.caja['peso_max']:
+            return False
+        # Best fit: empezar por el espacio más chico que alcanza en volumen
+        inicio = bisect.bisect_left(self.espacios, (unidad['volumen'],))
+        for i in range(inicio, len(self.espacios)):
+            _, largo, ancho, alto = self.espacios[i]
+            rotada = _orientacion(unidad['rotaciones'], (largo, ancho, alto))
+            if rotada is None:
+                continue
+            l, a, h = rotada
+            # Guillotina: lo que sobra a la derecha, al frente y encima
+            nuevos = (
+                (largo - l, ancho, alto),
+                (l, ancho - a, alto),
+                (l, a, alto - h),
+            )
+            del self.espacios[i]
+            for e in nuevos:
+                if e[0] > 0 and e[1] > 0 and e[2] > 0:
+                    bisect.insort(self.espacios, (e[0] * e[1] * e[2],) + e)
+            self.peso += unidad['peso']
+            self.unidades.append(unidad)
+            return True
+        return False
+
+
+def _cabe_en(unidad, caja):
+    return (
+        unidad['peso'] + caja.get('peso_caja', 0) <= caja['peso_max']
+        and _orientacion(unidad['rotaciones'], (caja['largo'], caja['ancho'], caja['alto'])) is not None
+    )
+
+
+def _llenar(unidades, cajas):
+    """
+    First Fit Decreasing: cada unidad va a la primera caja abierta donde
+    cabe; si no cabe en ninguna se abre la caja más chica que la admite
+
+    Returns:
+        tuple: (cajas abiertas, unidades que no caben en ninguna caja)
+    """
+    abiertas, cerradas, sueltas = [], [], []
+    volumen_minimo = min(unidad['volumen'] for unidad in unidades)
+    for unidad in unidades:
+        if any(abierta.colocar(unidad) for abierta in abiertas):
+            continue
+        for caja in cajas:
+            if _cabe_en(unidad, caja):
+                nueva = _CajaAbierta(caja)
+                nueva.colocar(unidad)
+                abiertas.append(nueva)
+                break
+        else:
+            sueltas.append(unidad)
+        # Cerrar cajas donde ya no cabe ni la unidad más chica
+        if len(abiertas) > 1:
+            cerradas.extend(a for a in abiertas if a.volumen_libre_max < volumen_minimo)
+            abiertas = [a for a in abiertas if a.volumen_libre_max >= volumen_minimo]
+    return cerradas + abiertas, sueltas
+
+
+def _reducir(abiertas, cajas):
+    """Pasa el contenido de cada caja a la caja más chica donde todavía cabe"""
+    reducidas = []
+    for abierta in abiertas:
+        mejor = abierta
+        for caja in cajas:
+            if caja is abierta.caja:
+                break
+            prueba = _CajaAbierta(caja)
+            if all(prueba.colocar(unidad) for unidad in abierta.unidades):
+                mejor = prueba
+                break
+        reducidas.append(mejor)
+    return reducidas
+
+
+def peso_cobrable(paquete):
+    volumetrico = paquete['largo'] * paquete['ancho'] * paquete['alto'] / DIVISOR_VOLUMETRICO
+    return max(paquete['peso'], volumetrico)
+
+
+def costo_estimado(paquetes):
+    """Costo relativo de un plan (kg cobrables + recargo por bulto)"""
+    return sum(peso_cobrable(p) + RECARGO_POR_PAQUETE_KG for p in paquetes)
+
+
+def _a_paquetes(abiertas, sueltas):
+    paquetes = [
+        {
+            'caja': abierta.caja['nombre'],
+            'largo': abierta.caja['largo'],
+            'ancho': abierta.caja['ancho'],
+            'alto': abierta.caja['alto'],
+            'peso': round(abierta.peso, 2),
+            'unidades': len(abierta.unidades),
+        }
+        for abierta in abiertas
+    ]
+    for unidad in sueltas:
+        largo, ancho, alto = sorted(unidad['dims'], reverse=True)
+        if largo > LARGO_MAXIMO_CM:
+            logger.warning(f"⚠️ Producto de {largo} cm supera el largo máximo del courier")
+        paquetes.append({
+            'caja': None, 'largo': largo, 'ancho': ancho, 'alto': alto,
+            'peso': round(unidad['peso'], 2), 'unidades': 1,
+        })
+    return paquetes
+
+
+def planificar_empaque(lineas, cajas=None):
+    """
+    Arma el plan de empaque más barato para un conjunto de líneas
+
+    Args:
+        lineas: iterable de (cantidad, peso, largo, ancho, alto) por producto
+        cajas: lista de cajas (por defecto cajas_configuradas())
+
+    Returns:
+        list[dict]: paquetes con caja, largo, ancho, alto, peso y unidades
+
+    Raises:
+        DimensionesInvalidas: si algún producto no tiene peso o medidas positivas
+    """
+    cajas = cajas or cajas_configuradas()
+    unidades = []
+    for cantidad, peso, largo, ancho, alto in lineas:
+        dims = (largo or 0, ancho or 0, alto or 0)
+        if not (peso or 0) > 0 or min(dims) <= 0:
+            raise DimensionesInvalidas(f"Producto con dimensiones no válidas: {peso} kg, {largo}x{ancho}x{alto} cm")
+        unidad = {
+            'peso': float(peso or 0),
+            'dims': dims,
+            'volumen': dims[0] * dims[1] * dims[2],
+            'rotaciones': _rotaciones(dims),
+        }
+        unidades.extend([unidad] * int(cantidad))
+    if not unidades:
+        return []
+
+    unidades.sort(key=lambda u: u['volumen'], reverse=True)
+
+    # Plan mixto: FFD sobre todas las cajas y luego reducir cada una
+    abiertas, sueltas = _llenar(unidades, cajas)
+    mejor = _a_paquetes(_reducir(abiertas, cajas), sueltas)
+    mejor_costo = costo_estimado(mejor)
+
+    # Planes de un solo tipo de caja (a veces menos bultos grandes salen más baratos)
+    for caja in cajas:
+        abiertas, sueltas_caja = _llenar(unidades, [caja])
+        if len(sueltas_caja) > len(sueltas):
+            continue
+        plan = _a_paquetes(abiertas, sueltas_caja)
+        costo = costo_estimado(plan)
+        if costo < mejor_costo:
+            mejor, mejor_costo = plan, costo
+
+    return mejor
@@ -0,0 +1,115 @@
+"""
+Perfil de envío del carrito para AutoParts
+==========================================
+
+Único lugar donde se calculan peso y dimensiones del paquete de un carrito.
+Lo usan la cotización de Chilexpress y la creación de pedidos, siempre con
+los datos de Producto (peso/largo/ancho/alto) y nunca con medidas enviadas
+por el cliente.
+
+Los productos se reparten en cajas estándar con el planificador de
+empaque.py. El perfil incluye la lista de paquetes; peso_total es el peso
+real a despachar (productos + cajas) y largo/ancho/alto son las medidas del
+paquete más grande. El Pedido guarda la lista de paquetes y la OT de
+Chilexpress se crea con una pieza por paquete, igual que la cotización.
+Si algún producto no tiene peso o medidas positivas el perfil no es válido.
+
+El perfil se memoiza en el cache por versión de carrito. La versión se
+incrementa cada vez que cambia un CarritoItem (señales post_save/post_delete)
+y vive en el cache compartido (settings.CACHES), así un cambio hecho en un
+worker invalida el perfil memoizado en todos.
+"""
+
+import time
+import logging
+
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import CarritoItem
+from .empaque import planificar_empaque, DimensionesInvalidas
+
+logger = logging.getLogger(__name__)
+
+PERFIL_TIMEOUT = 24 * 3600
+
+
+def _clave_version(carrito_id):
+    return f"carrito:{carrito_id}:version"
+
+
+def _version_nueva():
+    # Si el cache expulsa la clave, la versión reinicia en un valor que ningún
+    # perfil memoizado puede tener (partir de 1 otra vez serviría uno viejo)
+    return time.time_ns()
+
+
+def version_carrito(carrito_id):
+    """Versión actual del carrito (cambia con cada modificación de ítems)"""
+    return cache.get_or_set(_clave_version(carrito_id), _version_nueva, None)
+
+
+def invalidar_carrito(carrito_id):
+    """Incrementa la versión del carrito; los valores memoizados quedan obsoletos"""
+    try:
+        cache.incr(_clave_version(carrito_id))
+    except ValueError:
+        cache.set(_clave_version(carrito_id), _version_nueva(), None)
+
+
+@receiver(post_save, sender=CarritoItem)
+@receiver(post_delete, sender=CarritoItem)
+def _carrito_item_modificado(sender, instance, **kwargs):
+    invalidar_carrito(instance.carrito_id)
+
+
+def calcular_perfil(filas):
+    """
+    Calcula el plan de envío a partir de filas (cantidad, precio, peso, largo, ancho, alto)
+
+    Returns:
+        dict: paquetes, peso_total, largo, ancho, alto, subtotal, cantidad_items y valido
+    """
+    filas = list(filas)
+    try:
+        paquetes = planificar_empaque(
+            (cantidad, peso, largo, ancho, alto) for cantidad, _, peso, largo, ancho, alto in filas
+        )
+    except DimensionesInvalidas as e:
+        logger.warning(f"⚠️ {e}")
+        paquetes = []
+    mayor = max(paquetes, key=lambda p: p['largo'] * p['ancho'] * p['alto'], default=None)
+
+    perfil = {
+        'paquetes': paquetes,
+        'peso_total': round(sum(p['peso'] for p in paquetes), 2),
+        'largo': mayor['largo'] if mayor else 0,
+        'ancho': mayor['ancho'] if mayor else 0,
+        'alto': mayor['alto'] if mayor else 0,
+        'subtotal': sum((precio or 0) * cantidad for cantidad, precio, *_ in filas),
+        'cantidad_items': sum(cantidad for cantidad, *_ in filas),
+    }
+    perfil['valido'] = bool(paquetes) and all(
+        p['peso'] > 0 and p['largo'] > 0 and p['ancho'] > 0 and p['alto'] > 0 for p in paquetes
+    )
+    return perfil
+
+
+def perfil_envio(carrito):
+    """
+    Perfil de envío del carrito, leído en una sola consulta y memoizado
+
+    Args:
+        carrito: instancia de Carrito (o su id)
+    """
+    carrito_id = getattr(carrito, 'id', carrito)
+    clave = f"envio:perfil:{carrito_id}:v{version_carrito(carrito_id)}"
+    perfil = cache.get(clave)
+    if perfil is None:
+        filas = CarritoItem.objects.filter(carrito_id=carrito_id).values_list(
+            'cantidad', 'precio', 'producto__peso', 'producto__largo', 'producto__ancho', 'producto__alto'
+        )
+        perfil = calcular_perfil(filas)
+        cache.set(clave, perfil, PERFIL_TIMEOUT)
+    return perfil
@@ -8,6 +8,8 @@ from django.conf import settings
 from datetime import datetime
 from decimal import Decimal
 
+from .http_client import obtener_cliente
+
 logger = logging.getLogger(__name__)
 
 # Configuración de LibreDTE (Chile - SII)
@@ -39,10 +41,11 @@ class TributiAPI:
         }
         
         try:
+            cliente = obtener_cliente('tributi')
             if method == 'POST':
-                response = requests.post(url, json=data, headers=headers, timeout=30)
+                response = cliente.post(url, json=data, headers=headers)
             else:
-                response = requests.get(url, headers=headers, timeout=30)
+                response = cliente.get(url, headers=headers)
             
             response.raise_for_status()
             return response.json()
@@ -264,13 +267,13 @@ def generar_factura_simple_pdf(pedido, productos):
         from reportlab.lib.units import inch
         from reportlab.lib import colors
         from io import BytesIO
-        import os
+        from django.utils import timezone
         
         # Crear buffer para el PDF
         buffer = BytesIO()
         
         # Crear documento
-        doc = SimpleDocTemplate(buffer, pagesize=letter)
+        doc = SimpleDocTemplate(buffer, pagesize=letter, invariant=True)
         styles = getSampleStyleSheet()
         story = []
         
@@ -289,7 +292,7 @@ def generar_factura_simple_pdf(pedido, productos):
         # Información del pedido
         info_data = [
             ['Pedido #:', pedido.order_id],
-            ['Fecha:', datetime.now().strftime('%d/%m/%Y')],
+            ['Fecha:', timezone.localtime(pedido.fecha).strftime('%d/%m/%Y')],
             ['Cliente:', pedido.email],
             ['Total:', f"${pedido.monto:,}"]
         ]
@@ -339,27 +342,19 @@ def generar_factura_simple_pdf(pedido, productos):
         # Construir PDF
         doc.build(story)
         
-        # Guardar archivo
-        pdf_content = buffer.getvalue()
+        # Guardar archivo por hash de contenido (sin duplicados al regenerar)
+        from .pdf_storage import guardar_pdf, ruta_absoluta
+        almacenado = guardar_pdf(buffer.getvalue())
         buffer.close()
         
-        # Guardar en media
-        filename = f"factura_{pedido.order_id}.pdf"
-        filepath = os.path.join(settings.MEDIA_ROOT, 'facturas', filename)
-        
-        # Crear directorio si no existe
-        os.makedirs(os.path.dirname(filepath), exist_ok=True)
-        
-        with open(filepath, 'wb') as f:
-            f.write(pdf_content)
-        
         # URL del archivo
-        pdf_url = f"{settings.MEDIA_URL}facturas/{filename}"
+        pdf_url = f"{settings.MEDIA_URL}{almacenado['pdf_path']}"
         
         return {
             'success': True,
             'pdf_url': pdf_url,
-            'filepath': filepath,
+            'filepath': ruta_absoluta(almacenado['pdf_path']),
+            'pdf_sha256': almacenado['sha256'],
             'tipo': 'comprobante_simple'
         }
         
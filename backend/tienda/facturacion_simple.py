@@ -8,8 +8,12 @@ Perfecto para desarrollo y testing.
 
 import os
 import logging
-from datetime import datetime
+from io import BytesIO
 from django.conf import settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .pdf_storage import guardar_pdf
 
 logger = logging.getLogger(__name__)
 
@@ -49,17 +53,11 @@ class ComprobanteSimple:
             }
         
         try:
-            # Crear nombre del archivo
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f"comprobante_{pedido.order_id}_{timestamp}.pdf"
-            filepath = os.path.join('facturas', filename)
-            
-            # Crear directorio si no existe
-            full_path = os.path.join(settings.MEDIA_ROOT, filepath)
-            os.makedirs(os.path.dirname(full_path), exist_ok=True)
-            
-            # Crear PDF
-            doc = SimpleDocTemplate(full_path, pagesize=A4)
+            # Crear PDF en memoria. invariant=True evita que ReportLab incruste
+            # fecha de creación e ID aleatorios, de modo que el mismo pedido
+            # produce siempre los mismos bytes y se deduplica en disco.
+            buffer = BytesIO()
+            doc = SimpleDocTemplate(buffer, pagesize=A4, invariant=True)
             story = []
             styles = getSampleStyleSheet()
             
@@ -85,9 +83,10 @@ class ComprobanteSimple:
             story.append(Paragraph(empresa_text, styles['Normal']))
             story.append(Spacer(1, 20))
             
-            # Información del comprobante
-            numero_comp = f"COMP-{timestamp}"
-            fecha_actual = datetime.now().strftime('%d/%m/%Y %H:%M')
+            # Información del comprobante (derivada del pedido, no de la hora actual)
+            numero_comp = f"COMP-{pedido.order_id}"
+            fecha_pedido = getattr(pedido, 'fecha', None) or timezone.now()
+            fecha_actual = timezone.localtime(fecha_pedido).strftime('%d/%m/%Y %H:%M')
             
             info_text = f"""
             <b>Número de Comprobante:</b> {numero_comp}<br/>
@@ -207,19 +206,22 @@ class ComprobanteSimple:
             """
             story.append(Paragraph(nota_text, styles['Normal']))
             
-            # Generar el PDF
+            # Generar el PDF y guardarlo por hash de contenido
             doc.build(story)
+            almacenado = guardar_pdf(buffer.getvalue())
+            buffer.close()
             
-            # URL del archivo
-            pdf_url = f"{settings.MEDIA_URL}{filepath}"
+            # URL de descarga (sirve el archivo con ETag/Range)
+            pdf_url = reverse('descargar-comprobante', args=[pedido.order_id])
             
-            logger.info(f"Comprobante generado: {pdf_url}")
+            logger.info(f"Comprobante generado: {almacenado['pdf_path']}")
             
             return {
                 'success': True,
                 'numero_documento': numero_comp,
                 'pdf_url': pdf_url,
-                'pdf_path': filepath
+                'pdf_path': almacenado['pdf_path'],
+                'pdf_sha256': almacenado['sha256']
             }
             
         except Exception as e:
@@ -272,10 +274,14 @@ def enviar_factura_por_email(pedido, pdf_url):
     """Enviar comprobante por email usando el nuevo sistema"""
     try:
         from .email_manager_hibrido import enviar_comprobante_automatico
+        from .pdf_storage import ruta_absoluta, ruta_relativa
         import os
         
-        # Construir ruta del archivo desde URL
-        if pdf_url.startswith(settings.MEDIA_URL):
+        # Construir ruta del archivo: primero desde el hash almacenado en la factura
+        factura = getattr(pedido, 'factura', None)
+        if factura is not None and factura.pdf_sha256:
+            pdf_path = ruta_absoluta(ruta_relativa(factura.pdf_sha256))
+        elif pdf_url.startswith(settings.MEDIA_URL):
             pdf_path = pdf_url.replace(settings.MEDIA_URL, settings.MEDIA_ROOT + '/')
         else:
             pdf_path = os.path.join(settings.MEDIA_ROOT, pdf_url)
@@ -0,0 +1,234 @@
+"""
+Cliente HTTP saliente compartido para AutoParts
+===============================================
+
+Todas las llamadas a servicios externos (Chilexpress, CarAPI, Tributi,
+Transbank) pasan por un ClienteHTTP por upstream que agrega:
+- requests.Session con pool de conexiones keep-alive por host
+- Timeouts de conexión y lectura siempre definidos
+- Reintentos con backoff exponencial + jitter (solo métodos idempotentes)
+- Circuit breaker: tras N fallos seguidos se corta el tráfico al upstream
+  durante un tiempo, en vez de dejar workers de gunicorn esperando
+
+Uso:
+    from .http_client import obtener_cliente
+    response = obtener_cliente('chilexpress').get(url, headers=headers)
+
+Configuración por upstream en settings.HTTP_UPSTREAMS (ver UPSTREAMS_POR_DEFECTO).
+"""
+
+import time
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+UPSTREAMS_POR_DEFECTO = {
+    'chilexpress': {'timeout_conexion': 3, 'timeout_lectura': 10},
+    'carapi': {'timeout_conexion': 3, 'timeout_lectura': 10},
+    'tributi': {'timeout_conexion': 5, 'timeout_lectura': 30},
+    # Transbank no reintenta: crear/confirmar transacciones no es idempotente
+    'transbank': {'timeout_conexion': 5, 'timeout_lectura': 30, 'reintentos': 0},
+}
+
+CONFIG_BASE = {
+    'timeout_conexion': 3,
+    'timeout_lectura': 10,
+    'reintentos': 2,
+    'backoff': 0.3,            # segundos: 0.3, 0.6, 1.2...
+    'jitter': 0.2,             # segundos aleatorios extra por reintento
+    'pool': 10,                # conexiones keep-alive por host
+    'umbral_fallos': 5,        # fallos seguidos para abrir el circuito
+    'tiempo_abierto': 30,      # segundos antes de dejar pasar una petición de prueba
+}
+
+ESTADOS_REINTENTABLES = (502, 503, 504)
+
+
+class CircuitoAbierto(requests.exceptions.ConnectionError):
+    """El upstream está marcado como caído; la petición no se envía"""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker simple y thread-safe
+
+    cerrado -> (umbral_fallos fallos seguidos) -> abierto
+    abierto -> (pasa tiempo_abierto) -> semiabierto: deja pasar una petición
+    semiabierto -> éxito: cerrado | fallo: abierto
+    """
+
+    def __init__(self, nombre, umbral_fallos=5, tiempo_abierto=30):
+        self.nombre = nombre
+        self.umbral_fallos = umbral_fallos
+        self.tiempo_abierto = tiempo_abierto
+        self.fallos = 0
+        self.abierto_desde = None
+        self.prueba_en_curso = False
+        self._lock = threading.Lock()
+
+    @property
+    def estado(self):
+        if self.abierto_desde is None:
+            return 'cerrado'
+        if time.monotonic() - self.abierto_desde >= self.tiempo_abierto:
+            return 'semiabierto'
+        return 'abierto'
+
+    def permitir(self):
+        """Retorna True si la petición puede enviarse"""
+        with self._lock:
+            estado = self.estado
+            if estado == 'cerrado':
+                return True
+            if estado == 'semiabierto' and not self.prueba_en_curso:
+                self.prueba_en_curso = True
+                return True
+            return False
+
+    def registrar_exito(self):
+        with self._lock:
+            if self.abierto_desde is not None:
+                logger.info(f"✅ Circuito {self.nombre} cerrado nuevamente")
+            self.fallos = 0
+            self.abierto_desde = None
+            self.prueba_en_curso = False
+
+    def registrar_fallo(self):
+        with self._lock:
+            self.fallos += 1
+            if self.prueba_en_curso or self.fallos >= self.umbral_fallos:
+                if self.abierto_desde is None or self.prueba_en_curso:
+                    logger.warning(f"⚠️ Circuito {self.nombre} abierto tras {self.fallos} fallos")
+                self.abierto_desde = time.monotonic()
+            self.prueba_en_curso = False
+
+
+class LimitadorTasa:
+    """Limita el ritmo a N operaciones por segundo (seguro entre hilos)"""
+
+    def __init__(self, max_por_segundo):
+        self.intervalo = 1.0 / max_por_segundo if max_por_segundo else 0
+        self.siguiente = time.monotonic()
+        self._lock = threading.Lock()
+
+    def esperar(self):
+        if not self.intervalo:
+            return
+        with self._lock:
+            ahora = time.monotonic()
+            turno = max(ahora, self.siguiente)
+            self.siguiente = turno + self.intervalo
+        if turno > ahora:
+            time.sleep(turno - ahora)
+
+
+class ClienteHTTP:
+    """Sesión HTTP con pool, timeouts, reintentos y circuit breaker para un upstream"""
+
+    def __init__(self, nombre, **config):
+        self.nombre = nombre
+        self.config = {**CONFIG_BASE, **config}
+        self.timeout = (self.config['timeout_conexion'], self.config['timeout_lectura'])
+        self.breaker = CircuitBreaker(nombre, self.config['umbral_fallos'], self.config['tiempo_abierto'])
+
+        reintentos = Retry(
+            total=self.config['reintentos'],
+            connect=self.config['reintentos'],
+            read=self.config['reintentos'],
+            status=self.config['reintentos'],
+            status_forcelist=ESTADOS_REINTENTABLES,
+            allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,  # POST no se reintenta tras enviarse
+            backoff_factor=self.config['backoff'],
+            backoff_jitter=self.config['jitter'],
+            raise_on_status=False,
+        )
+        adaptador = HTTPAdapter(
+            pool_connections=self.config['pool'],
+            pool_maxsize=self.config['pool'],
+            max_retries=reintentos,
+        )
+        self.session = requests.Session()
+        self.session.mount('https://', adaptador)
+        self.session.mount('http://', adaptador)
+
+    def request(self, method, url, **kwargs):
+        if not self.breaker.permitir():
+            raise CircuitoAbierto(f"Servicio {self.nombre} no disponible temporalmente")
+
+        kwargs.setdefault('timeout', self.timeout)
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except requests.RequestException:
+            self.breaker.registrar_fallo()
+            raise
+
+        if response.status_code >= 500:
+            self.breaker.registrar_fallo()
+        else:
+            self.breaker.registrar_exito()
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+
+_clientes = {}
+_clientes_lock = threading.Lock()
+
+
+def configuracion_upstream(nombre):
+    """Configuración efectiva de un upstream (defaults + settings.HTTP_UPSTREAMS)"""
+    personalizada = getattr(settings, 'HTTP_UPSTREAMS', {}).get(nombre, {})
+    return {**UPSTREAMS_POR_DEFECTO.get(nombre, {}), **personalizada}
+
+
+def obtener_cliente(nombre):
+    """Retorna el ClienteHTTP compartido del upstream (uno por proceso)"""
+    cliente = _clientes.get(nombre)
+    if cliente is None:
+        with _clientes_lock:
+            cliente = _clientes.get(nombre)
+            if cliente is None:
+                cliente = ClienteHTTP(nombre, **configuracion_upstream(nombre))
+                _clientes[nombre] = cliente
+    return cliente
+
+
+def timeout_de(nombre):
+    """Tupla (conexión, lectura) configurada para un upstream"""
+    return obtener_cliente(nombre).timeout
+
+
+def instalar_en_transbank(base_url=None):
+    """
+    Hace que el SDK de Transbank use el cliente compartido
+
+    transbank.common.request_service llama a requests.post/get/put/delete a
+    nivel de módulo (sin Session, timeout por defecto de 600 s). Reemplazar
+    ese `requests` por nuestro ClienteHTTP le da pool de conexiones y
+    circuit breaker sin tocar el SDK.
+
+    Con base_url (o settings.TRANSBANK_BASE_URL) todas las llamadas del SDK
+    van a ese host en vez de webpay3g/webpay3gint, ej. `manage.py upstreams_falsos`.
+    """
+    from transbank.common import request_service
+    request_service.requests = obtener_cliente('transbank')
+
+    base_url = base_url or getattr(settings, 'TRANSBANK_BASE_URL', None)
+    if base_url:
+        request_service.RequestService.host = classmethod(lambda cls, options: base_url.rstrip('/'))
@@ -0,0 +1,370 @@
+"""
+Importación masiva de productos (CSV / XLSX)
+============================================
+
+Carga listas de precios de proveedores (decenas de miles de líneas) sin
+pasar por ProductoAPIView fila a fila:
+- El archivo se lee en streaming (csv.reader / openpyxl read_only) y se
+  procesa por bloques de TAMANO_BLOQUE filas
+- Cada bloque se valida en Python; las filas con errores se reportan y se
+  omiten, el resto se guarda
+- Categoria y Marca se resuelven por nombre con un diccionario en memoria
+  (categorías desconocidas son error; marcas desconocidas se crean)
+- Producto se inserta o actualiza por `sku` con un solo bulk_create
+  (update_conflicts) por bloque, más las marcas (M2M) y compatibilidades
+
+Columnas (encabezado obligatorio, sin importar mayúsculas/tildes):
+    sku, nombre, precio, stock, categoria, peso, largo, ancho, alto
+    opcionales: precio_mayorista, descripcion, marcas ("Bosch|Valeo"),
+    compatibilidades ("Toyota:Corolla:2010-2015; Nissan:Versa")
+
+Uso:
+    python manage.py importar_productos lista.csv --reporte errores.csv
+"""
+
+import io
+import re
+import csv
+import time
+import logging
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+
+from .indice_vehiculos import normalizar
+from .inventario import registrar_diferencias
+from .models import Producto, Categoria, Marca, CompatibilidadVehiculo
+
+logger = logging.getLogger(__name__)
+
+TAMANO_BLOQUE = 1000
+COLUMNAS_OBLIGATORIAS = ('sku', 'nombre', 'precio', 'stock', 'categoria', 'peso', 'largo', 'ancho', 'alto')
+CAMPOS_ACTUALIZABLES = [
+    'nombre', 'precio', 'precio_mayorista', 'descripcion', 'stock',
+    'categoria', 'peso', 'largo', 'ancho', 'alto',
+]
+PESO_MAXIMO = Decimal('999.99')  # DecimalField(max_digits=5, decimal_places=2)
+
+
+class ErrorImportacion(ValueError):
+    """El archivo no se puede importar (formato o encabezado inválido)"""
+
+
+# ================================
+# Lectura en streaming
+# ================================
+
+def _clave_columna(nombre):
+    return normalizar(str(nombre or '')).replace(' ', '_')
+
+
+def _filas_csv(archivo):
+    # Archivos binarios (UploadedFile, open(..., 'rb')) se decodifican al vuelo
+    if 'b' in getattr(archivo, 'mode', 'b'):
+        texto = io.TextIOWrapper(archivo, encoding='utf-8-sig', newline='')
+    else:
+        texto = archivo
+    muestra = texto.read(4096)
+    texto.seek(0)
+    try:
+        dialecto = csv.Sniffer().sniff(muestra, delimiters=',;\t')
+    except csv.Error:
+        dialecto = csv.excel
+    lector = csv.reader(texto, dialecto)
+    encabezado = [_clave_columna(columna) for columna in next(lector, [])]
+    for valores in lector:
+        if any(valor.strip() for valor in valores):
+            yield dict(zip(encabezado, valores))
+        else:
+            yield None
+
+
+def _filas_xlsx(archivo):
+    try:
+        import openpyxl
+    except ImportError:
+        raise ErrorImportacion("Para importar .xlsx se necesita openpyxl (pip install openpyxl)")
+    libro = openpyxl.load_workbook(archivo, read_only=True, data_only=True)
+    try:
+        filas = libro.active.iter_rows(values_only=True)
+        encabezado = [_clave_columna(columna) for columna in next(filas, ())]
+        for valores in filas:
+            if any(valor not in (None, '') for valor in valores):
+                yield {clave: '' if valor is None else str(valor) for clave, valor in zip(encabezado, valores)}
+            else:
+                yield None
+    finally:
+        libro.close()
+
+
+def leer_filas(archivo, nombre):
+    """Itera las filas del archivo como dicts (None para filas vacías)"""
+    if nombre.lower().endswith(('.xlsx', '.xlsm')):
+        return _filas_xlsx(archivo)
+    if nombre.lower().endswith(('.csv', '.txt')):
+        return _filas_csv(archivo)
+    raise ErrorImportacion("Formato no soportado: use .csv o .xlsx")
+
+
+# ================================
+# Validación
+# ================================
+
+def _entero(valor, campo, errores, minimo=0):
+    texto = str(valor).strip().replace('$', '').replace(' ', '')
+    if re.fullmatch(r'\d{1,3}(\.\d{3})+', texto):
+        texto = texto.replace('.', '')  # separador de miles: 12.990
+    try:
+        numero = Decimal(texto.replace(',', '.'))
+    except InvalidOperation:
+        numero = None
+    if numero is None or not numero.is_finite() or numero != numero.to_integral_value():
+        errores.append(f"{campo}: '{valor}' no es un número entero")
+        return None
+    if numero < minimo:
+        errores.append(f"{campo}: debe ser mayor o igual a {minimo}")
+        return None
+    return int(numero)
+
+
+def _peso(valor, errores):
+    try:
+        peso = Decimal(str(valor).strip().replace(',', '.')).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        errores.append(f"peso: '{valor}' no es un número")
+        return None
+    if not peso.is_finite() or not Decimal('0') < peso <= PESO_MAXIMO:
+        errores.append(f"peso: debe estar entre 0.01 y {PESO_MAXIMO} kg")
+        return None
+    return peso
+
+
+def _compatibilidades(texto, errores):
+    """'Toyota:Corolla:2010-2015; Nissan:Versa' -> [{'marca_nombre', 'modelo_nombre', 'año_desde', 'año_hasta'}]"""
+    resultado = []
+    for entrada in filter(None, (parte.strip() for parte in texto.split(';'))):
+        partes = [parte.strip() for parte in entrada.split(':')]
+        if len(partes) < 2 or not partes[0] or not partes[1]:
+            errores.append(f"compatibilidades: '{entrada}' debe ser Marca:Modelo[:desde-hasta]")
+            continue
+        desde = hasta = None
+        if len(partes) > 2 and partes[2]:
+            años = partes[2].split('-')
+            try:
+                desde = int(años[0])
+                hasta = int(años[1]) if len(años) > 1 and años[1] else None
+            except ValueError:
+                errores.append(f"compatibilidades: años inválidos en '{entrada}'")
+                continue
+        resultado.append({'marca_nombre': partes[0], 'modelo_nombre': partes[1], 'año_desde': desde, 'año_hasta': hasta})
+    return resultado
+
+
+def validar_fila(fila, categorias):
+    """
+    Valida y convierte una fila del archivo
+
+    Returns:
+        tuple: (datos, errores); datos es None si la fila tiene errores
+    """
+    errores = []
+    valor = lambda campo: (fila.get(campo) or '').strip()
+
+    faltantes = [campo for campo in COLUMNAS_OBLIGATORIAS if not valor(campo)]
+    if faltantes:
+        return None, [f"faltan: {', '.join(faltantes)}"]
+
+    sku, nombre = valor('sku'), valor('nombre')
+    if len(sku) > 50:
+        errores.append('sku: máximo 50 caracteres')
+    if len(nombre) > 100:
+        errores.append('nombre: máximo 100 caracteres')
+    descripcion = valor('descripcion') or nombre
+    if len(descripcion) > 500:
+        errores.append('descripcion: máximo 500 caracteres')
+
+    precio = _entero(valor('precio'), 'precio', errores, minimo=1)
+    precio_mayorista = _entero(valor('precio_mayorista'), 'precio_mayorista', errores, minimo=1) if valor('precio_mayorista') else precio
+    stock = _entero(valor('stock'), 'stock', errores)
+    peso = _peso(valor('peso'), errores)
+    medidas = {campo: _entero(valor(campo), campo, errores, minimo=1) for campo in ('largo', 'ancho', 'alto')}
+
+    categoria = categorias.get(normalizar(valor('categoria')))
+    if categoria is None:
+        errores.append(f"categoria: '{valor('categoria')}' no existe")
+
+    marcas = [marca.strip() for marca in valor('marcas').split('|') if marca.strip()]
+    compatibilidades = _compatibilidades(valor('compatibilidades'), errores)
+
+    if errores:
+        return None, errores
+    return {
+        'sku': sku,
+        'nombre': nombre,
+        'descripcion': descripcion,
+        'precio': precio,
+        'precio_mayorista': precio_mayorista,
+        'stock': stock,
+        'peso': peso,
+        'categoria_id': categoria,
+        'marcas': marcas,
+        'compatibilidades': compatibilidades,
+        **medidas,
+    }, []
+
+
+# ================================
+# Escritura por bloques
+# ================================
+
+class _Catalogos:
+    """Diccionarios nombre normalizado -> id, cargados una vez por importación"""
+
+    def __init__(self):
+        self.categorias = {normalizar(nombre): id for id, nombre in Categoria.objects.values_list('id', 'nombre')}
+        self.marcas = {}
+        for marca_id, nombre in Marca.objects.order_by('-id').values_list('id', 'nombre'):
+            self.marcas[normalizar(nombre)] = marca_id
+
+    def ids_marcas(self, nombres):
+        """Ids de las marcas por nombre, creando en bloque las que falten"""
+        faltantes = {normalizar(nombre): nombre for nombre in nombres if normalizar(nombre) not in self.marcas}
+        if faltantes:
+            Marca.objects.bulk_create([Marca(nombre=nombre, descripcion='') for nombre in faltantes.values()])
+            for marca_id, nombre in Marca.objects.filter(nombre__in=faltantes.values()).values_list('id', 'nombre'):
+                self.marcas[normalizar(nombre)] = marca_id
+        return self.marcas
+
+
+def _guardar_bloque(filas, catalogos, referencia=''):
+    """
+    Inserta o actualiza un bloque de filas válidas (ya sin SKUs repetidos)
+
+    Los cambios de stock quedan en el libro de inventario como 'importacion'.
+
+    Returns:
+        tuple: (creados, actualizados)
+    """
+    skus = [fila['sku'] for fila in filas]
+    existentes = dict(Producto.objects.filter(sku__in=skus).values_list('sku', 'stock'))
+
+    Producto.objects.bulk_create(
+        [Producto(**{campo: valor for campo, valor in fila.items() if campo not in ('marcas', 'compatibilidades')})
+         for fila in filas],
+        update_conflicts=True,
+        unique_fields=['sku'],
+        update_fields=CAMPOS_ACTUALIZABLES,
+    )
+    ids = dict(Producto.objects.filter(sku__in=skus).values_list('sku', 'id'))
+    registrar_diferencias(
+        {ids[sku]: stock for sku, stock in existentes.items()},
+        {ids[fila['sku']]: fila['stock'] for fila in filas},
+        'importacion', referencia,
+    )
+
+    # Marcas (M2M): se reemplazan solo en los productos que traen la columna con datos
+    con_marcas = [fila for fila in filas if fila['marcas']]
+    if con_marcas:
+        marcas = catalogos.ids_marcas({marca for fila in con_marcas for marca in fila['marcas']})
+        Relacion = Producto.marca.through
+        Relacion.objects.filter(producto_id__in=[ids[fila['sku']] for fila in con_marcas]).delete()
+        Relacion.objects.bulk_create([
+            Relacion(producto_id=ids[fila['sku']], marca_id=marca_id)
+            for fila in con_marcas
+            for marca_id in {marcas[normalizar(marca)] for marca in fila['marcas']}
+        ])
+
+    # Compatibilidades: mismo criterio, resolviendo todos los modelos del bloque de una vez
+    con_compatibilidades = [fila for fila in filas if fila['compatibilidades']]
+    if con_compatibilidades:
+        from .serializers import ProductoSerializer
+        modelos = ProductoSerializer._resolver_modelos([
+            (comp['marca_nombre'], comp['modelo_nombre'], comp['año_desde'], comp['año_hasta'], '')
+            for fila in con_compatibilidades for comp in fila['compatibilidades']
+        ])
+        CompatibilidadVehiculo.objects.filter(
+            producto_id__in=[ids[fila['sku']] for fila in con_compatibilidades]
+        ).delete()
+        nuevas = {}
+        for fila in con_compatibilidades:
+            for comp in fila['compatibilidades']:
+                modelo = modelos[(comp['marca_nombre'], comp['modelo_nombre'])]
+                clave = (ids[fila['sku']], modelo.id, comp['año_desde'], comp['año_hasta'])
+                nuevas.setdefault(clave, CompatibilidadVehiculo(
+                    producto_id=clave[0], modelo_vehiculo=modelo,
+                    año_desde=comp['año_desde'], año_hasta=comp['año_hasta'],
+                ))
+        CompatibilidadVehiculo.objects.bulk_create(nuevas.values(), batch_size=500)
+
+    return len(filas) - len(existentes), len(existentes)
+
+
+def importar_productos(archivo, nombre, solo_validar=False, tamano_bloque=TAMANO_BLOQUE):
+    """
+    Importa productos desde un CSV/XLSX
+
+    Args:
+        archivo: archivo binario abierto (o UploadedFile)
+        nombre: nombre del archivo (define el formato por la extensión)
+        solo_validar: valida todo sin escribir en la base de datos
+
+    Returns:
+        dict: {'filas', 'creados', 'actualizados', 'errores': [{'fila', 'sku', 'errores'}],
+               'segundos', 'filas_por_segundo'}
+    """
+    inicio = time.perf_counter()
+    catalogos = _Catalogos()
+    resumen = {'filas': 0, 'creados': 0, 'actualizados': 0, 'errores': []}
+
+    filas = leer_filas(archivo, nombre)
+    bloque, skus_vistos = [], set()
+    verificar_encabezado = True
+
+    def guardar(bloque):
+        if solo_validar or not bloque:
+            return
+        with transaction.atomic():
+            creados, actualizados = _guardar_bloque(bloque, catalogos, nombre)
+        resumen['creados'] += creados
+        resumen['actualizados'] += actualizados
+
+    for numero, fila in enumerate(filas, start=2):  # la fila 1 es el encabezado
+        if fila is None:
+            continue
+        if verificar_encabezado:
+            faltantes = [columna for columna in COLUMNAS_OBLIGATORIAS if columna not in fila]
+            if faltantes:
+                raise ErrorImportacion(f"Faltan columnas en el encabezado: {', '.join(faltantes)}")
+            verificar_encabezado = False
+
+        resumen['filas'] += 1
+        datos, errores = validar_fila(fila, catalogos.categorias)
+        if datos and datos['sku'] in skus_vistos:
+            datos, errores = None, ['sku repetido en el archivo']
+        if errores:
+            resumen['errores'].append({'fila': numero, 'sku': (fila.get('sku') or '').strip(), 'errores': errores})
+            continue
+
+        skus_vistos.add(datos['sku'])
+        bloque.append(datos)
+        if len(bloque) >= tamano_bloque:
+            guardar(bloque)
+            bloque = []
+    guardar(bloque)
+
+    resumen['segundos'] = round(time.perf_counter() - inicio, 3)
+    resumen['filas_por_segundo'] = round(resumen['filas'] / resumen['segundos']) if resumen['segundos'] else 0
+    logger.info(
+        f"📦 Importación {nombre}: {resumen['filas']} filas, {resumen['creados']} creados, "
+        f"{resumen['actualizados']} actualizados, {len(resumen['errores'])} con errores "
+        f"({resumen['filas_por_segundo']} filas/s)"
+    )
+    return resumen
+
+
+def escribir_reporte_errores(errores, destino):
+    """Escribe el reporte de errores por fila como CSV"""
+    escritor = csv.writer(destino)
+    escritor.writerow(['fila', 'sku', 'errores'])
+    for error in errores:
+        escritor.writerow([error['fila'], error['sku'], ' | '.join(error['errores'])])
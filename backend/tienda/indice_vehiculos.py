@@ -0,0 +1,160 @@
+"""
+Índice en memoria para autocompletar marcas y modelos de vehículos
+==================================================================
+
+Cada proceso mantiene un arreglo ordenado de claves normalizadas (sin tildes,
+minúsculas) y responde prefijos con bisect, sin tocar la base de datos:
+- "toy"            -> marca Toyota y sus modelos
+- "cor"            -> modelos que empiezan con "cor" (Corolla...)
+- "toyota cor"     -> modelos de Toyota que empiezan con "cor"
+- "corolla 2015"   -> solo modelos fabricados ese año
+
+El índice se reconstruye cuando cambia su versión: vehiculos.version_catalogo()
+(cache compartido) más una huella de la BD (cantidad y máximo id de marcas y
+modelos activos), que también ve cambios sin señales hechos por otro proceso.
+La versión se revisa a lo más cada INDICE_VEHICULOS_REVISION segundos, así que
+entre revisiones las búsquedas no tocan la BD ni el cache; un cambio hecho con
+señales en este mismo proceso fuerza la revisión en la siguiente búsqueda.
+"""
+
+import re
+import time
+import bisect
+import logging
+import threading
+import unicodedata
+
+from django.conf import settings
+from django.db.models import Count, Max, Q
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import MarcaVehiculo, ModeloVehiculo
+from .vehiculos import version_catalogo
+
+logger = logging.getLogger(__name__)
+
+REVISION_SEGUNDOS = getattr(settings, 'INDICE_VEHICULOS_REVISION', 30)
+LIMITE_POR_DEFECTO = 10
+LIMITE_MAXIMO = 50
+PATRON_AÑO = re.compile(r'\b(19[5-9]\d|20\d\d)\b')
+
+
+def normalizar(texto):
+    """'  Peugeót 208 ' -> 'peugeot 208'"""
+    descompuesto = unicodedata.normalize('NFKD', texto or '')
+    sin_tildes = ''.join(c for c in descompuesto if not unicodedata.combining(c))
+    return ' '.join(sin_tildes.lower().split())
+
+
+class IndiceVehiculos:
+    """Arreglo ordenado de (clave, posición) sobre marcas y modelos activos"""
+
+    def __init__(self, marcas, modelos, version=None):
+        self.version = version
+        # Entradas: ('marca', id, marca, None, None, None) / ('modelo', id, marca, modelo, desde, hasta)
+        self.entradas = []
+        claves = []
+        for marca_id, nombre in marcas:
+            claves.append((normalizar(nombre), len(self.entradas)))
+            self.entradas.append(('marca', marca_id, nombre, None, None, None))
+        for modelo_id, nombre, marca, desde, hasta in modelos:
+            posicion = len(self.entradas)
+            claves.append((normalizar(nombre), posicion))
+            claves.append((normalizar(f'{marca} {nombre}'), posicion))
+            self.entradas.append(('modelo', modelo_id, marca, nombre, desde, hasta))
+        claves.sort()
+        self.claves = [clave for clave, _ in claves]
+        self.posiciones = [posicion for _, posicion in claves]
+
+    @classmethod
+    def desde_bd(cls, version=None):
+        marcas = MarcaVehiculo.objects.filter(activa=True).values_list('id', 'nombre')
+        modelos = ModeloVehiculo.objects.filter(activo=True, marca_vehiculo__activa=True).values_list(
+            'id', 'nombre', 'marca_vehiculo__nombre', 'año_inicio', 'año_fin'
+        )
+        return cls(list(marcas), list(modelos), version)
+
+    def buscar(self, consulta, limite=LIMITE_POR_DEFECTO):
+        """
+        Marcas y modelos cuyo nombre (o "marca modelo") empieza con la consulta
+
+        Returns:
+            list: dicts {'tipo', 'id', 'marca', 'modelo', 'año_inicio', 'año_fin', 'texto'}
+        """
+        texto = normalizar(consulta)
+        año = None
+        coincidencia = PATRON_AÑO.search(texto)
+        if coincidencia:
+            año = int(coincidencia.group(1))
+            texto = ' '.join(PATRON_AÑO.sub(' ', texto).split())
+        if not texto:
+            return []
+
+        resultados, vistos = [], set()
+        inicio = bisect.bisect_left(self.claves, texto)
+        for i in range(inicio, len(self.claves)):
+            if not self.claves[i].startswith(texto) or len(resultados) >= limite:
+                break
+            posicion = self.posiciones[i]
+            if posicion in vistos:
+                continue
+            vistos.add(posicion)
+            tipo, entrada_id, marca, modelo, desde, hasta = self.entradas[posicion]
+            if año is not None and (tipo == 'marca' or año < desde or (hasta is not None and año > hasta)):
+                continue
+            resultados.append({
+                'tipo': tipo,
+                'id': entrada_id,
+                'marca': marca,
+                'modelo': modelo,
+                'año_inicio': desde,
+                'año_fin': hasta,
+                'texto': f'{marca} {modelo}' if modelo else marca,
+            })
+        return resultados
+
+
+_indice = None
+_revisado = 0.0  # time.monotonic() de la última revisión de versión
+_lock = threading.Lock()
+
+
+def huella_catalogo():
+    """(cantidad, máximo id) de marcas y de modelos activos: cambia con altas, bajas y bulk_create"""
+    activas = Q(activa=True)
+    marcas = MarcaVehiculo.objects.aggregate(n=Count('id', filter=activas), ultimo=Max('id'))
+    modelos = ModeloVehiculo.objects.filter(activo=True, marca_vehiculo__activa=True).aggregate(
+        n=Count('id'), ultimo=Max('id')
+    )
+    return marcas['n'], marcas['ultimo'], modelos['n'], modelos['ultimo']
+
+
+@receiver(post_save, sender=MarcaVehiculo)
+@receiver(post_delete, sender=MarcaVehiculo)
+@receiver(post_save, sender=ModeloVehiculo)
+@receiver(post_delete, sender=ModeloVehiculo)
+def _catalogo_modificado(sender, **kwargs):
+    # Cambio hecho en este proceso: revisar la versión en la próxima búsqueda
+    global _revisado
+    _revisado = 0.0
+
+
+def obtener_indice():
+    """Índice del proceso; revisa la versión cada REVISION_SEGUNDOS y se reconstruye si cambió"""
+    global _indice, _revisado
+    indice = _indice
+    if indice is not None and time.monotonic() - _revisado < REVISION_SEGUNDOS:
+        return indice
+    with _lock:
+        if _indice is None or time.monotonic() - _revisado >= REVISION_SEGUNDOS:
+            version = (version_catalogo(), huella_catalogo())
+            if _indice is None or _indice.version != version:
+                _indice = IndiceVehiculos.desde_bd(version)
+                logger.info(f"🔎 Índice de vehículos reconstruido ({len(_indice.entradas)} entradas)")
+            _revisado = time.monotonic()
+        return _indice
+
+
+def autocompletar(consulta, limite=LIMITE_POR_DEFECTO):
+    return obtener_indice().buscar(consulta, max(1, min(limite, LIMITE_MAXIMO)))
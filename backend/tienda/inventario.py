@@ -0,0 +1,221 @@
+"""
+Libro de inventario (movimientos y snapshots de stock)
+======================================================
+
+Producto.stock sigue siendo el saldo que usan las vistas; cada cambio deja
+además una fila en MovimientoStock (solo se agregan, nunca se editan):
+- venta:        pago_exitoso descuenta con un UPDATE condicional (stock >= cantidad)
+- devolucion:   un pedido pagado que pasa a 'cancelado' repone su stock
+- ajuste:       ProductoSerializer, admin, ajustes masivos (precios.py), conciliación
+- importacion:  importar_productos (importacion.py)
+- inicial:      saldo de partida (migración 0040 y productos nuevos)
+
+Los movimientos de operaciones masivas se escriben con bulk_create a partir
+de la diferencia antes/después (`registrar_diferencias`).
+
+Cada movimiento refresca además las alertas de bajo stock de los productos
+involucrados (reposicion.py).
+
+`snapshot_stock` guarda periódicamente el saldo del libro por producto; el
+stock en una fecha se calcula como el último snapshot anterior más la suma de
+los movimientos posteriores, sin recorrer todo el historial. `conciliar_stock`
+compara ese saldo con Producto.stock.
+
+Uso:
+    python manage.py snapshot_stock
+    python manage.py conciliar_stock --corregir
+"""
+
+import logging
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import transaction
+from django.db.models import F, Q, OuterRef, Subquery, Sum, Value, IntegerField, DateTimeField
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Producto, MovimientoStock, SnapshotStock
+from .reposicion import actualizar_alertas
+
+logger = logging.getLogger(__name__)
+
+TAMANO_LOTE = 1000
+# Un snapshot se toma un poco en el pasado para incluir transacciones que aún no confirman
+MARGEN_SNAPSHOT = timedelta(minutes=1)
+INICIO = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def _usuario(usuario):
+    return usuario if usuario is not None and usuario.is_authenticated else None
+
+
+def registrar_movimientos(movimientos):
+    """
+    Inserta en bloque los movimientos con cantidad distinta de cero
+
+    Args:
+        movimientos: iterable de MovimientoStock sin guardar
+    """
+    movimientos = [movimiento for movimiento in movimientos if movimiento.cantidad]
+    MovimientoStock.objects.bulk_create(movimientos, batch_size=TAMANO_LOTE)
+    return len(movimientos)
+
+
+def registrar_diferencias(antes, despues, tipo, referencia='', usuario=None):
+    """
+    Un movimiento por producto cuyo stock cambió
+
+    También refresca las alertas de bajo stock de todos los productos de
+    `despues` (el punto de reorden pudo cambiar aunque el stock no).
+
+    Args:
+        antes, despues: {producto_id: stock}; un id ausente en `antes` cuenta como 0
+    """
+    usuario = _usuario(usuario)
+    registrados = registrar_movimientos(
+        MovimientoStock(
+            producto_id=producto_id,
+            tipo=tipo,
+            cantidad=stock - antes.get(producto_id, 0),
+            referencia=referencia[:100],
+            usuario=usuario,
+        )
+        for producto_id, stock in despues.items()
+    )
+    actualizar_alertas(despues)
+    return registrados
+
+
+def descontar_stock(producto, cantidad, referencia='', usuario=None):
+    """
+    Descuenta una venta si alcanza el stock (UPDATE condicional, sin carreras)
+
+    Returns:
+        bool: False si no había stock suficiente
+    """
+    with transaction.atomic():
+        descontado = Producto.objects.filter(pk=producto.pk, stock__gte=cantidad).update(
+            stock=F('stock') - cantidad
+        )
+        if not descontado:
+            return False
+        MovimientoStock.objects.create(
+            producto=producto, tipo='venta', cantidad=-cantidad,
+            referencia=referencia[:100], usuario=_usuario(usuario),
+        )
+        actualizar_alertas([producto.pk])
+    producto.refresh_from_db(fields=['stock'])
+    return True
+
+
+def reponer_pedido(pedido, usuario=None):
+    """
+    Devuelve al stock los ítems de un pedido cancelado (una sola vez por pedido)
+
+    Returns:
+        int: movimientos de devolución registrados
+    """
+    with transaction.atomic():
+        if MovimientoStock.objects.filter(tipo='devolucion', referencia=pedido.order_id).exists():
+            return 0
+        # Se repone exactamente lo que se descontó como venta para este pedido
+        cantidades = {
+            producto_id: -total
+            for producto_id, total in MovimientoStock.objects.filter(tipo='venta', referencia=pedido.order_id)
+            .order_by().values('producto').annotate(total=Sum('cantidad')).values_list('producto', 'total')
+            if total
+        }
+        for producto_id, cantidad in cantidades.items():
+            Producto.objects.filter(pk=producto_id).update(stock=F('stock') + cantidad)
+        registradas = registrar_diferencias({}, cantidades, 'devolucion', pedido.order_id, usuario)
+    logger.info(f"↩️ Pedido {pedido.order_id}: {registradas} productos repuestos al stock")
+    return registradas
+
+
+# ================================
+# Saldos: snapshot + movimientos
+# ================================
+
+def saldos(fecha=None, productos=None):
+    """
+    Productos anotados con el saldo del libro en `fecha` (None = ahora)
+
+    Anotaciones: fecha_snapshot, stock_snapshot (None si no hay snapshot previo),
+    delta (suma de movimientos posteriores al snapshot) y saldo_libro.
+    """
+    productos = Producto.objects.all() if productos is None else productos
+    snapshots = SnapshotStock.objects.filter(producto=OuterRef('pk')).order_by('-fecha')
+    movimientos = MovimientoStock.objects.filter(producto=OuterRef('pk'), fecha__gt=OuterRef('fecha_snapshot'))
+    if fecha is not None:
+        snapshots = snapshots.filter(fecha__lte=fecha)
+        movimientos = movimientos.filter(fecha__lte=fecha)
+    delta = movimientos.order_by().values('producto').annotate(total=Sum('cantidad')).values('total')
+
+    return productos.annotate(
+        stock_snapshot=Subquery(snapshots.values('stock')[:1], output_field=IntegerField()),
+        fecha_snapshot=Coalesce(
+            Subquery(snapshots.values('fecha')[:1]), Value(INICIO), output_field=DateTimeField()
+        ),
+        delta=Subquery(delta, output_field=IntegerField()),
+    ).annotate(
+        saldo_libro=Coalesce(F('stock_snapshot'), 0) + Coalesce(F('delta'), 0),
+    )
+
+
+def stock_en(fecha, producto_ids=None):
+    """{producto_id: stock} según el libro de inventario en una fecha"""
+    productos = Producto.objects.all()
+    if producto_ids is not None:
+        productos = productos.filter(id__in=producto_ids)
+    return dict(saldos(fecha, productos).values_list('id', 'saldo_libro'))
+
+
+def tomar_snapshot(fecha=None):
+    """
+    Guarda el saldo del libro de los productos que tuvieron movimientos desde su último snapshot
+
+    Returns:
+        int: snapshots creados
+    """
+    fecha = fecha or timezone.now() - MARGEN_SNAPSHOT
+    cambiados = saldos(fecha).filter(
+        Q(delta__isnull=False) | Q(stock_snapshot__isnull=True)
+    ).values_list('id', 'saldo_libro')
+    creados = 0
+    lote = []
+    for producto_id, saldo in cambiados.iterator(chunk_size=TAMANO_LOTE):
+        lote.append(SnapshotStock(producto_id=producto_id, stock=saldo, fecha=fecha))
+        if len(lote) >= TAMANO_LOTE:
+            creados += len(SnapshotStock.objects.bulk_create(lote, ignore_conflicts=True))
+            lote = []
+    creados += len(SnapshotStock.objects.bulk_create(lote, ignore_conflicts=True))
+    logger.info(f"📸 Snapshot de stock ({fecha:%d/%m/%Y %H:%M}): {creados} productos")
+    return creados
+
+
+def conciliar(corregir=False, usuario=None):
+    """
+    Productos cuyo Producto.stock no coincide con el saldo del libro
+
+    Args:
+        corregir: registra un movimiento 'ajuste' por la diferencia (Producto.stock manda)
+
+    Returns:
+        list: [{'id', 'nombre', 'stock', 'libro', 'diferencia'}]
+    """
+    diferencias = [
+        {'id': producto_id, 'nombre': nombre, 'stock': stock, 'libro': libro, 'diferencia': stock - libro}
+        for producto_id, nombre, stock, libro in saldos()
+        .exclude(saldo_libro=F('stock'))
+        .order_by('id')
+        .values_list('id', 'nombre', 'stock', 'saldo_libro')
+    ]
+    if corregir and diferencias:
+        registrar_diferencias(
+            {fila['id']: fila['libro'] for fila in diferencias},
+            {fila['id']: fila['stock'] for fila in diferencias},
+            'ajuste', 'conciliacion', usuario,
+        )
+    if diferencias:
+        logger.warning(f"⚠️ Conciliación de stock: {len(diferencias)} productos con diferencias")
+    return diferencias
@@ -0,0 +1,197 @@
+"""
+Limpieza de datos antiguos por lotes
+====================================
+
+Borra lo que ya no se usa y solo hace crecer las tablas que recorren las
+vistas y los reportes:
+- carritos:  Carrito inactivos (ya comprados) con sus ítems, pasada la retención.
+             pago_exitoso reutiliza el último carrito inactivo solo durante el pago
+- sesiones:  filas de django_session vencidas
+- pedidos:   pedidos 'pendiente' que nunca se pagaron, sin factura ni stock
+             descontado (sin movimientos 'venta' en el libro de inventario)
+- pdfs:      archivos de media/facturas sin Factura, Pedido ni email por enviar
+             que los use, y temporales .tmp de escrituras interrumpidas
+
+Cada tabla se recorre por clave primaria (keyset: pk > último id del lote
+anterior, sin OFFSET) en lotes de LIMPIEZA_LOTE filas. Cada lote se borra en
+su propia transacción y entre lotes se espera LIMPIEZA_PAUSA segundos, así los
+bloqueos son cortos y se puede correr en horario de atención, tanto en SQLite
+como en Postgres.
+
+Uso:
+    python manage.py limpiar_datos --simular
+    python manage.py limpiar_datos --solo carritos sesiones --lote 200 --pausa 1
+"""
+
+import os
+import re
+import time
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Carrito, CarritoItem, Pedido, Factura, EmailOutbox, MovimientoStock
+from .pdf_storage import DIRECTORIO_PDF
+
+logger = logging.getLogger(__name__)
+
+DIAS_CARRITOS = getattr(settings, 'LIMPIEZA_DIAS_CARRITOS', 30)
+DIAS_PEDIDOS = getattr(settings, 'LIMPIEZA_DIAS_PEDIDOS', 30)
+DIAS_ARCHIVOS = getattr(settings, 'LIMPIEZA_DIAS_ARCHIVOS', 7)
+TAMANO_LOTE = getattr(settings, 'LIMPIEZA_LOTE', 500)
+PAUSA = getattr(settings, 'LIMPIEZA_PAUSA', 0.5)
+
+TAREAS = ('carritos', 'sesiones', 'pedidos', 'pdfs')
+
+PDF_HASH_RE = re.compile(r'^([0-9a-f]{64})\.pdf$')
+PDF_COMPROBANTE_RE = re.compile(r'^comprobante_([A-Z0-9]+)_')
+
+
+def _por_lotes(queryset, borrar, lote, pausa, simular):
+    """
+    Recorre `queryset` por pk en bloques de `lote` y llama a borrar(ids) en una transacción por bloque
+
+    Returns:
+        int: filas procesadas (o que se procesarían con `simular`)
+    """
+    total, ultimo = 0, None
+    while True:
+        bloque = queryset if ultimo is None else queryset.filter(pk__gt=ultimo)
+        ids = list(bloque.order_by('pk').values_list('pk', flat=True)[:lote])
+        if not ids:
+            break
+        if not simular:
+            with transaction.atomic():
+                borrar(ids)
+        total += len(ids)
+        ultimo = ids[-1]
+        if len(ids) < lote:
+            break
+        if not simular and pausa:
+            time.sleep(pausa)
+    return total
+
+
+def limpiar_carritos(dias=DIAS_CARRITOS, lote=TAMANO_LOTE, pausa=PAUSA, simular=False):
+    """Carritos inactivos creados hace más de `dias` días, con sus ítems"""
+    limite = timezone.now() - timedelta(days=dias)
+
+    def borrar(ids):
+        CarritoItem.objects.filter(carrito_id__in=ids).delete()
+        Carrito.objects.filter(id__in=ids).delete()
+
+    return _por_lotes(Carrito.objects.filter(is_active=False, creado__lt=limite), borrar, lote, pausa, simular)
+
+
+def limpiar_sesiones(lote=TAMANO_LOTE, pausa=PAUSA, simular=False):
+    """Sesiones vencidas (equivale a clearsessions, pero por lotes)"""
+    return _por_lotes(
+        Session.objects.filter(expire_date__lt=timezone.now()),
+        lambda ids: Session.objects.filter(session_key__in=ids).delete(),
+        lote, pausa, simular,
+    )
+
+
+def limpiar_pedidos_pendientes(dias=DIAS_PEDIDOS, lote=TAMANO_LOTE, pausa=PAUSA, simular=False):
+    """Pedidos 'pendiente' de hace más de `dias` días sin factura ni stock descontado, con sus ítems"""
+    limite = timezone.now() - timedelta(days=dias)
+    pedidos = Pedido.objects.filter(estado='pendiente', fecha__lt=limite, factura__isnull=True).exclude(
+        order_id__in=MovimientoStock.objects.filter(tipo='venta').values('referencia')
+    )
+    return _por_lotes(pedidos, lambda ids: Pedido.objects.filter(id__in=ids).delete(), lote, pausa, simular)
+
+
+def _pdfs_candidatos(directorio, limite):
+    """(ruta, clave) de los archivos modificados antes de `limite`; clave = ('sha'|'pedido'|'tmp', valor)"""
+    for raiz, _, archivos in os.walk(directorio):
+        for nombre in archivos:
+            ruta = os.path.join(raiz, nombre)
+            try:
+                if os.path.getmtime(ruta) >= limite:
+                    continue
+            except OSError:
+                continue
+            if nombre.endswith('.tmp'):
+                yield ruta, ('tmp', None)
+            elif PDF_HASH_RE.match(nombre):
+                yield ruta, ('sha', PDF_HASH_RE.match(nombre).group(1))
+            elif PDF_COMPROBANTE_RE.match(nombre):
+                yield ruta, ('pedido', PDF_COMPROBANTE_RE.match(nombre).group(1))
+
+
+def _pdfs_huerfanos(bloque):
+    """Rutas del bloque que ninguna Factura, Pedido ni email pendiente usa (3 consultas)"""
+    shas = [valor for _, (tipo, valor) in bloque if tipo == 'sha']
+    pedidos = [valor for _, (tipo, valor) in bloque if tipo == 'pedido']
+    usados_sha = set(Factura.objects.filter(pdf_sha256__in=shas).values_list('pdf_sha256', flat=True)) if shas else set()
+    usados_pedido = set(Pedido.objects.filter(order_id__in=pedidos).values_list('order_id', flat=True)) if pedidos else set()
+    adjuntos = set(EmailOutbox.objects.filter(
+        estado__in=('pendiente', 'enviando'), adjunto_path__in=[ruta for ruta, _ in bloque]
+    ).values_list('adjunto_path', flat=True))
+    return [
+        ruta for ruta, (tipo, valor) in bloque
+        if ruta not in adjuntos
+        and not (tipo == 'sha' and valor in usados_sha)
+        and not (tipo == 'pedido' and valor in usados_pedido)
+    ]
+
+
+def limpiar_pdfs(dias=DIAS_ARCHIVOS, lote=TAMANO_LOTE, pausa=PAUSA, simular=False):
+    """
+    Comprobantes huérfanos en MEDIA_ROOT/facturas modificados hace más de `dias` días
+
+    El margen evita borrar un PDF recién generado cuya Factura aún no se guarda.
+    """
+    directorio = os.path.join(settings.MEDIA_ROOT, DIRECTORIO_PDF)
+    limite = time.time() - dias * 24 * 3600
+    total, bloque = 0, []
+
+    def procesar(bloque):
+        huerfanos = _pdfs_huerfanos(bloque)
+        if not simular:
+            for ruta in huerfanos:
+                try:
+                    os.remove(ruta)
+                except FileNotFoundError:
+                    pass
+        return len(huerfanos)
+
+    for candidato in _pdfs_candidatos(directorio, limite):
+        bloque.append(candidato)
+        if len(bloque) >= lote:
+            total += procesar(bloque)
+            bloque = []
+            if not simular and pausa:
+                time.sleep(pausa)
+    if bloque:
+        total += procesar(bloque)
+    return total
+
+
+def limpiar(tareas=TAREAS, simular=False, lote=TAMANO_LOTE, pausa=PAUSA, dias_carritos=DIAS_CARRITOS,
+            dias_pedidos=DIAS_PEDIDOS, dias_archivos=DIAS_ARCHIVOS):
+    """
+    Ejecuta las tareas indicadas en orden
+
+    Returns:
+        dict: {tarea: filas o archivos borrados (o que se borrarían con `simular`)}
+    """
+    funciones = {
+        'carritos': lambda: limpiar_carritos(dias_carritos, lote, pausa, simular),
+        'sesiones': lambda: limpiar_sesiones(lote, pausa, simular),
+        'pedidos': lambda: limpiar_pedidos_pendientes(dias_pedidos, lote, pausa, simular),
+        'pdfs': lambda: limpiar_pdfs(dias_archivos, lote, pausa, simular),
+    }
+    resultado = {}
+    for tarea in tareas:
+        inicio = time.perf_counter()
+        resultado[tarea] = funciones[tarea]()
+        logger.info(
+            f"🧹 Limpieza {tarea}: {resultado[tarea]} {'por borrar' if simular else 'borrados'} "
+            f"en {time.perf_counter() - inicio:.1f} s"
+        )
+    return resultado
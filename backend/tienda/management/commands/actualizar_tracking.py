@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tienda.seguimiento import (
+    actualizar_tracking, TRACKING_TAMANO_LOTE, TRACKING_MAX_PARALELO, TRACKING_MAX_POR_SEGUNDO
+)
+
+
+class Command(BaseCommand):
+    help = 'Actualiza el estado de envío de los pedidos con OT en tránsito'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=TRACKING_TAMANO_LOTE, help='Pedidos por lote')
+        parser.add_argument('--paralelo', type=int, default=TRACKING_MAX_PARALELO, help='Consultas simultáneas')
+        parser.add_argument('--por-segundo', type=float, default=TRACKING_MAX_POR_SEGUNDO, help='Máximo de consultas por segundo')
+        parser.add_argument('--loop', action='store_true', help='Repetir indefinidamente')
+        parser.add_argument('--intervalo', type=int, default=900, help='Segundos entre corridas con --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            resumen = actualizar_tracking(
+                tamano_lote=options['lote'],
+                max_paralelo=options['paralelo'],
+                max_por_segundo=options['por_segundo'],
+            )
+            self.stdout.write(self.style.SUCCESS(
+                f"✓ Consultados: {resumen['consultados']} | "
+                f"Actualizados: {resumen['actualizados']} | "
+                f"Errores: {resumen['errores']}"
+            ))
+            if not options['loop']:
+                break
+            time.sleep(options['intervalo'])
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tienda.benchmarks import SUITES
+
+
+class Command(BaseCommand):
+    help = 'Ejecuta los micro-benchmarks de tienda/benchmarks.py'
+
+    def add_arguments(self, parser):
+        parser.add_argument('suites', nargs='*', help=f"Suites a ejecutar ({', '.join(SUITES)})")
+
+    def handle(self, *args, **options):
+        nombres = options['suites'] or list(SUITES)
+        desconocidas = [nombre for nombre in nombres if nombre not in SUITES]
+        if desconocidas:
+            raise CommandError(f"Suites desconocidas: {', '.join(desconocidas)}")
+
+        for nombre in nombres:
+            self.stdout.write(self.style.SUCCESS(f'\n▶ {nombre}'))
+            for fila in SUITES[nombre]():
+                self.stdout.write(f"  {fila['caso']:<60} n={fila['n']:<6} {fila['ms_por_op']:.3f} ms/op")
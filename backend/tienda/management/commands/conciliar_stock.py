@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from tienda.inventario import conciliar
+
+
+class Command(BaseCommand):
+    help = 'Compara Producto.stock con el saldo del libro de inventario (snapshot + movimientos)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corregir', action='store_true',
+                            help="Registrar un movimiento 'ajuste' por cada diferencia")
+        parser.add_argument('--max', type=int, default=50, help='Diferencias a listar')
+
+    def handle(self, *args, **options):
+        diferencias = conciliar(corregir=options['corregir'])
+        if not diferencias:
+            self.stdout.write(self.style.SUCCESS('✓ El libro de inventario coincide con Producto.stock'))
+            return
+
+        for fila in diferencias[:options['max']]:
+            self.stdout.write(
+                f"  #{fila['id']} {fila['nombre']}: stock {fila['stock']} | libro {fila['libro']} "
+                f"({fila['diferencia']:+d})"
+            )
+        if len(diferencias) > options['max']:
+            self.stdout.write(f"  ... y {len(diferencias) - options['max']} más")
+
+        if options['corregir']:
+            self.stdout.write(self.style.SUCCESS(f"✓ {len(diferencias)} diferencias registradas como ajuste"))
+        else:
+            self.stdout.write(self.style.WARNING(
+                f"⚠️ {len(diferencias)} productos con diferencias (usar --corregir para registrarlas)"
+            ))
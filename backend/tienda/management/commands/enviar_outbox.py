@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tienda.email_outbox import procesar_outbox, liberar_reclamados, TAMANO_LOTE
+
+
+class Command(BaseCommand):
+    help = 'Envía los emails pendientes del outbox reutilizando una conexión SMTP por lote'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=TAMANO_LOTE, help='Emails por lote')
+        parser.add_argument('--loop', action='store_true', help='Procesar continuamente')
+        parser.add_argument('--intervalo', type=float, default=5, help='Segundos de espera cuando la cola está vacía')
+
+    def handle(self, *args, **options):
+        liberados = liberar_reclamados()
+        if liberados:
+            self.stdout.write(f'• {liberados} emails reclamados por un worker anterior vuelven a la cola')
+
+        while True:
+            resultado = procesar_outbox(tamano_lote=options['lote'])
+            if any(resultado.values()):
+                self.stdout.write(self.style.SUCCESS(
+                    f"✓ Enviados: {resultado['enviados']} | "
+                    f"Reintentos: {resultado['reintentos']} | "
+                    f"Fallidos: {resultado['fallidos']}"
+                ))
+
+            if not options['loop']:
+                break
+            # Lote incompleto = cola vacía: esperar antes de volver a consultar
+            if sum(resultado.values()) < options['lote']:
+                time.sleep(options['intervalo'])
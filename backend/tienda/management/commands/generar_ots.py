@@ -0,0 +1,35 @@
+import shutil
+
+from django.core.management.base import BaseCommand
+
+from tienda.despacho import despachar_lote, OT_MAX_PARALELO, OT_MAX_POR_SEGUNDO
+from tienda.pdf_storage import ruta_absoluta
+
+
+class Command(BaseCommand):
+    help = 'Genera OTs de Chilexpress y un PDF de etiquetas para los pedidos en preparación'
+
+    def add_arguments(self, parser):
+        parser.add_argument('order_ids', nargs='*', help='Limitar a estos pedidos')
+        parser.add_argument('--paralelo', type=int, default=OT_MAX_PARALELO, help='Peticiones simultáneas')
+        parser.add_argument('--por-segundo', type=float, default=OT_MAX_POR_SEGUNDO, help='Máximo de OTs por segundo')
+        parser.add_argument('--salida', help='Copiar el PDF de etiquetas a esta ruta')
+
+    def handle(self, *args, **options):
+        resultado = despachar_lote(
+            options['order_ids'] or None,
+            max_paralelo=options['paralelo'],
+            max_por_segundo=options['por_segundo'],
+        )
+
+        for error in resultado['errores']:
+            self.stdout.write(self.style.WARNING(f"• {error['order_id']}: {error['error']}"))
+        self.stdout.write(self.style.SUCCESS(f"✓ OTs generadas: {resultado['generados']}"))
+
+        etiquetas = resultado['etiquetas']
+        if etiquetas:
+            ruta = ruta_absoluta(etiquetas['pdf_path'])
+            if options['salida']:
+                shutil.copyfile(ruta, options['salida'])
+                ruta = options['salida']
+            self.stdout.write(f"✓ Etiquetas ({etiquetas['paginas']} páginas): {ruta}")
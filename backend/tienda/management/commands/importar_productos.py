@@ -0,0 +1,46 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tienda.importacion import importar_productos, escribir_reporte_errores, ErrorImportacion, TAMANO_BLOQUE
+
+
+class Command(BaseCommand):
+    help = 'Importa o actualiza productos por SKU desde un archivo CSV o XLSX'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help='Ruta del .csv o .xlsx')
+        parser.add_argument('--validar', action='store_true', help='Solo validar, sin guardar')
+        parser.add_argument('--bloque', type=int, default=TAMANO_BLOQUE, help='Filas por bloque')
+        parser.add_argument('--reporte', help='Ruta del CSV con los errores por fila')
+
+    def handle(self, *args, **options):
+        ruta = options['archivo']
+        if not os.path.exists(ruta):
+            raise CommandError(f"No existe el archivo {ruta}")
+
+        try:
+            with open(ruta, 'rb') as archivo:
+                resumen = importar_productos(
+                    archivo, os.path.basename(ruta),
+                    solo_validar=options['validar'], tamano_bloque=options['bloque'],
+                )
+        except ErrorImportacion as e:
+            raise CommandError(str(e))
+
+        errores = resumen['errores']
+        if errores and options['reporte']:
+            with open(options['reporte'], 'w', newline='', encoding='utf-8') as destino:
+                escribir_reporte_errores(errores, destino)
+            self.stdout.write(self.style.WARNING(f"• Reporte de errores en {options['reporte']}"))
+        else:
+            for error in errores[:20]:
+                self.stdout.write(self.style.WARNING(f"• Fila {error['fila']} ({error['sku']}): {' | '.join(error['errores'])}"))
+            if len(errores) > 20:
+                self.stdout.write(self.style.WARNING(f"• ... y {len(errores) - 20} filas más (use --reporte)"))
+
+        modo = 'Validadas' if options['validar'] else 'Importadas'
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {modo} {resumen['filas']} filas en {resumen['segundos']} s ({resumen['filas_por_segundo']} filas/s) | "
+            f"Creados: {resumen['creados']} | Actualizados: {resumen['actualizados']} | Con errores: {len(errores)}"
+        ))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from tienda import limpieza
+
+
+class Command(BaseCommand):
+    help = 'Borra por lotes carritos inactivos, sesiones vencidas, pedidos pendientes antiguos y PDFs huérfanos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--solo', nargs='+', choices=limpieza.TAREAS, default=list(limpieza.TAREAS),
+                            help='Tareas a ejecutar (por defecto todas)')
+        parser.add_argument('--simular', action='store_true', help='Solo contar, sin borrar')
+        parser.add_argument('--lote', type=int, default=limpieza.TAMANO_LOTE, help='Filas o archivos por lote')
+        parser.add_argument('--pausa', type=float, default=limpieza.PAUSA, help='Segundos de espera entre lotes')
+        parser.add_argument('--dias-carritos', type=int, default=limpieza.DIAS_CARRITOS,
+                            help='Retención de carritos inactivos')
+        parser.add_argument('--dias-pedidos', type=int, default=limpieza.DIAS_PEDIDOS,
+                            help='Retención de pedidos pendientes sin pagar')
+        parser.add_argument('--dias-archivos', type=int, default=limpieza.DIAS_ARCHIVOS,
+                            help='Antigüedad mínima de un PDF huérfano')
+
+    def handle(self, *args, **options):
+        resultado = limpieza.limpiar(
+            tareas=options['solo'],
+            simular=options['simular'],
+            lote=max(options['lote'], 1),
+            pausa=options['pausa'],
+            dias_carritos=options['dias_carritos'],
+            dias_pedidos=options['dias_pedidos'],
+            dias_archivos=options['dias_archivos'],
+        )
+        verbo = 'por borrar' if options['simular'] else 'borrados'
+        for tarea, cantidad in resultado.items():
+            self.stdout.write(f"  {tarea}: {cantidad} {verbo}")
+        self.stdout.write(self.style.SUCCESS(f"✓ Limpieza terminada: {sum(resultado.values())} {verbo}"))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tienda.vehiculos import sincronizar_carapi
+
+
+class Command(BaseCommand):
+    help = 'Copia marcas y modelos de CarAPI a MarcaVehiculo / ModeloVehiculo'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--marca', action='append', dest='marcas', help='Sincronizar solo esta marca (repetible)')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Sincronizando vehículos desde CarAPI...')
+        try:
+            resumen = sincronizar_carapi(marcas=options['marcas'])
+        except Exception as e:
+            raise CommandError(f"Sincronización cancelada, no se modificaron las tablas: {e}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ Marcas: {resumen['marcas_creadas']} nuevas, {resumen['marcas_actualizadas']} actualizadas | "
+            f"Modelos: {resumen['modelos_creados']} nuevos, {resumen['modelos_actualizados']} actualizados"
+        ))
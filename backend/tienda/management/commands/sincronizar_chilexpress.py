@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from tienda.chilexpress import sincronizar_geografia
+
+
+class Command(BaseCommand):
+    help = 'Descarga regiones y comunas de Chilexpress al snapshot local (GeografiaChilexpress)'
+
+    def handle(self, *args, **options):
+        self.stdout.write('Sincronizando geografía de Chilexpress...')
+        resultado = sincronizar_geografia()
+
+        if resultado['errores']:
+            self.stdout.write(self.style.WARNING(
+                f"• Sin respuesta para: {', '.join(map(str, resultado['errores']))} (se conserva el snapshot anterior)"
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ Regiones: {resultado['regiones']} | Comunas: {resultado['comunas']}"
+        ))
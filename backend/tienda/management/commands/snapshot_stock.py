@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tienda.inventario import tomar_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Guarda el saldo del libro de inventario por producto (SnapshotStock)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Repetir indefinidamente')
+        parser.add_argument('--intervalo', type=int, default=24 * 3600, help='Segundos entre snapshots con --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            creados = tomar_snapshot()
+            self.stdout.write(self.style.SUCCESS(f"✓ Snapshots creados: {creados}"))
+            if not options['loop']:
+                break
+            time.sleep(options['intervalo'])
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from tienda.upstreams_falsos import ServidorFalso
+
+
+class Command(BaseCommand):
+    help = 'Levanta Chilexpress, Transbank y CarAPI falsos para pruebas de carga sin red'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--puerto', type=int, default=8099)
+        parser.add_argument('--latencia', type=int, default=50, help='Milisegundos de demora base')
+        parser.add_argument('--jitter', type=int, default=20, help='Milisegundos aleatorios extra')
+        parser.add_argument('--tasa-error', type=float, default=0.0, help='Probabilidad de responder 503 (0-1)')
+        parser.add_argument('--semilla', type=int, default=None)
+
+    def handle(self, *args, **options):
+        servidor = ServidorFalso(
+            (options['host'], options['puerto']),
+            latencia_ms=options['latencia'],
+            jitter_ms=options['jitter'],
+            tasa_error=options['tasa_error'],
+            semilla=options['semilla'],
+        )
+        self.stdout.write(self.style.SUCCESS(f"✓ Upstreams falsos en {servidor.url}"))
+        self.stdout.write(f"  CHILEXPRESS_BASE_URL={servidor.url}/chilexpress")
+        self.stdout.write("  CHILEXPRESS_SIMULACION=False")
+        self.stdout.write(f"  TRANSBANK_BASE_URL={servidor.url}/transbank")
+        self.stdout.write(f"  CARAPI_BASE_URL={servidor.url}/carapi/api")
+        try:
+            servidor.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            servidor.server_close()
+            self.stdout.write(f"\n{servidor.peticiones} peticiones atendidas")
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0034_pedido_costo_envio'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='factura',
+            name='pdf_sha256',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+    ]
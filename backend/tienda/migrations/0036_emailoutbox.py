@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:57
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0035_factura_pdf_sha256'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('destinatario', models.EmailField(max_length=254)),
+                ('asunto', models.CharField(max_length=255)),
+                ('cuerpo_html', models.TextField(blank=True, default='')),
+                ('cuerpo_texto', models.TextField(blank=True, default='')),
+                ('reply_to', models.EmailField(blank=True, max_length=254, null=True)),
+                ('adjunto_path', models.CharField(blank=True, max_length=500, null=True)),
+                ('adjunto_nombre', models.CharField(blank=True, max_length=255, null=True)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('enviando', 'Enviando'), ('enviado', 'Enviado'), ('fallido', 'Fallido')], default='pendiente', max_length=20)),
+                ('intentos', models.PositiveIntegerField(default=0)),
+                ('proximo_intento', models.DateTimeField(default=django.utils.timezone.now)),
+                ('lote', models.CharField(blank=True, max_length=32, null=True)),
+                ('ultimo_error', models.TextField(blank=True, null=True)),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('enviado_en', models.DateTimeField(blank=True, null=True)),
+                ('pedido', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='emails', to='tienda.pedido')),
+            ],
+            options={
+                'verbose_name': 'Email saliente',
+                'verbose_name_plural': 'Emails salientes',
+                'ordering': ['creado'],
+                'indexes': [models.Index(fields=['estado', 'proximo_intento'], name='tienda_emai_estado_1a2e2c_idx')],
+            },
+        ),
+    ]
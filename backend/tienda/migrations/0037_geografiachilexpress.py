@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:00
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0036_emailoutbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeografiaChilexpress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=50, unique=True)),
+                ('datos', models.JSONField(default=list)),
+                ('actualizado', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Geografía Chilexpress',
+                'verbose_name_plural': 'Geografía Chilexpress',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0037_geografiachilexpress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='sku',
+            field=models.CharField(blank=True, max_length=50, null=True, unique=True),
+        ),
+    ]
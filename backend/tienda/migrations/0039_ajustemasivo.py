@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0038_producto_sku'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AjusteMasivo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reglas', models.JSONField(default=list)),
+                ('filas_afectadas', models.JSONField(default=list)),
+                ('duracion_ms', models.PositiveIntegerField(default=0)),
+                ('fecha', models.DateTimeField(auto_now_add=True)),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Ajuste masivo',
+                'verbose_name_plural': 'Ajustes masivos',
+                'ordering': ['-fecha'],
+            },
+        ),
+    ]
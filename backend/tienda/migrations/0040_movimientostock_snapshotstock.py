@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:19
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def saldos_iniciales(apps, schema_editor):
+    """El libro parte con el stock actual de cada producto como movimiento 'inicial'"""
+    Producto = apps.get_model('tienda', 'Producto')
+    MovimientoStock = apps.get_model('tienda', 'MovimientoStock')
+    MovimientoStock.objects.bulk_create(
+        [
+            MovimientoStock(producto_id=producto_id, tipo='inicial', cantidad=stock, referencia='migracion')
+            for producto_id, stock in Producto.objects.values_list('id', 'stock').iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0039_ajustemasivo'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovimientoStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('inicial', 'Saldo inicial'), ('venta', 'Venta'), ('devolucion', 'Devolución'), ('ajuste', 'Ajuste'), ('importacion', 'Importación')], max_length=20)),
+                ('cantidad', models.IntegerField()),
+                ('referencia', models.CharField(blank=True, default='', max_length=100)),
+                ('fecha', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movimientos_stock', to='tienda.producto')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Movimiento de stock',
+                'verbose_name_plural': 'Movimientos de stock',
+                'ordering': ['-fecha', '-id'],
+                'indexes': [models.Index(fields=['producto', 'fecha'], name='tienda_movi_product_813315_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SnapshotStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stock', models.IntegerField()),
+                ('fecha', models.DateTimeField(db_index=True)),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots_stock', to='tienda.producto')),
+            ],
+            options={
+                'verbose_name': 'Snapshot de stock',
+                'verbose_name_plural': 'Snapshots de stock',
+                'ordering': ['-fecha'],
+                'unique_together': {('producto', 'fecha')},
+            },
+        ),
+        migrations.RunPython(saldos_iniciales, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:22
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def alertas_iniciales(apps, schema_editor):
+    """Única pasada completa: desde aquí las alertas se mantienen por producto"""
+    Producto = apps.get_model('tienda', 'Producto')
+    AlertaStock = apps.get_model('tienda', 'AlertaStock')
+    AlertaStock.objects.bulk_create(
+        [
+            AlertaStock(producto_id=producto_id, stock=stock, punto_reorden=punto_reorden)
+            for producto_id, stock, punto_reorden in Producto.objects.filter(
+                stock__lte=models.F('punto_reorden')
+            ).values_list('id', 'stock', 'punto_reorden').iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0040_movimientostock_snapshotstock'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='punto_reorden',
+            field=models.PositiveIntegerField(default=5),
+        ),
+        migrations.CreateModel(
+            name='AlertaStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stock', models.IntegerField()),
+                ('punto_reorden', models.PositiveIntegerField()),
+                ('desde', models.DateTimeField(default=django.utils.timezone.now)),
+                ('producto', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='alerta_stock', to='tienda.producto')),
+            ],
+            options={
+                'verbose_name': 'Alerta de stock',
+                'verbose_name_plural': 'Alertas de stock',
+                'ordering': ['stock'],
+            },
+        ),
+        migrations.RunPython(alertas_iniciales, migrations.RunPython.noop),
+    ]
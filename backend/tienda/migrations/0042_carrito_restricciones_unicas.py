@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:25
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def consolidar_carritos(apps, schema_editor):
+    """
+    Deja los datos existentes dentro de las restricciones nuevas:
+    - por usuario queda activo el carrito más reciente; los ítems de los demás se mueven a él
+    - los ítems repetidos de un producto se suman en uno solo
+    """
+    Carrito = apps.get_model('tienda', 'Carrito')
+    CarritoItem = apps.get_model('tienda', 'CarritoItem')
+
+    usuarios = (
+        Carrito.objects.filter(is_active=True).values('user').annotate(total=models.Count('id'))
+        .filter(total__gt=1).values_list('user', flat=True)
+    )
+    for user_id in list(usuarios):
+        ids = list(Carrito.objects.filter(user_id=user_id, is_active=True).order_by('-id').values_list('id', flat=True))
+        CarritoItem.objects.filter(carrito_id__in=ids[1:]).update(carrito_id=ids[0])
+        Carrito.objects.filter(id__in=ids[1:]).update(is_active=False)
+
+    repetidos = (
+        CarritoItem.objects.values('carrito', 'producto').annotate(total=models.Count('id'))
+        .filter(total__gt=1).values_list('carrito', 'producto')
+    )
+    for carrito_id, producto_id in list(repetidos):
+        items = list(CarritoItem.objects.filter(carrito_id=carrito_id, producto_id=producto_id).order_by('id'))
+        items[0].cantidad = sum(item.cantidad for item in items)
+        items[0].save(update_fields=['cantidad'])
+        CarritoItem.objects.filter(id__in=[item.id for item in items[1:]]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0041_producto_punto_reorden_alertastock'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(consolidar_carritos, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='carrito',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_active', True)), fields=('user',), name='carrito_activo_unico_por_usuario'),
+        ),
+        migrations.AddConstraint(
+            model_name='carritoitem',
+            constraint=models.UniqueConstraint(fields=('carrito', 'producto'), name='carrito_item_unico_por_producto'),
+        ),
+    ]
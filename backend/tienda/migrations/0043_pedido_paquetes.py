@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0042_carrito_restricciones_unicas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedido',
+            name='paquetes',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:05
+
+from django.core.management import call_command
+from django.db import migrations
+
+
+def crear_tabla_cache(apps, schema_editor):
+    """Tabla de DatabaseCache cuando settings.CACHES no usa Redis (no hace nada si ya existe)"""
+    call_command('createcachetable', database=schema_editor.connection.alias, verbosity=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0043_pedido_paquetes'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_tabla_cache, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,7 @@
 from django.contrib.auth.models import User
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 
 # Create your models here.
     
@@ -24,6 +25,8 @@ class Marca(models.Model):
 
 
 class Producto(models.Model):
+    # Código del proveedor; clave de las importaciones masivas (null = producto creado a mano)
+    sku = models.CharField(max_length=50, unique=True, null=True, blank=True)
     nombre = models.CharField(max_length=100)
     precio = models.PositiveIntegerField(default=1)
     precio_mayorista = models.PositiveIntegerField(default=1)
@@ -37,6 +40,8 @@ class Producto(models.Model):
     largo = models.PositiveIntegerField()
     ancho = models.PositiveIntegerField()
     alto = models.PositiveIntegerField()
+    # Con stock igual o menor aparece en AlertaStock (tienda/reposicion.py)
+    punto_reorden = models.PositiveIntegerField(default=5)
     
 
     def __str__(self):
@@ -135,6 +140,14 @@ class Carrito(models.Model):
 
     def __str__(self):
         return f"Carrito de {self.user.username} - Activo {self.is_active}"
+
+    class Meta:
+        constraints = [
+            # Un solo carrito activo por usuario (tienda/carrito.py)
+            models.UniqueConstraint(
+                fields=['user'], condition=models.Q(is_active=True), name='carrito_activo_unico_por_usuario'
+            ),
+        ]
     
 class CarritoItem(models.Model):
     carrito = models.ForeignKey(Carrito, related_name='items', on_delete=models.CASCADE)
@@ -147,6 +160,11 @@ class CarritoItem(models.Model):
     
     def subtotal(self):
         return self.precio * self.cantidad 
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['carrito', 'producto'], name='carrito_item_unico_por_producto'),
+        ]
     
 
 class PerfilUsuario(models.Model):
@@ -194,6 +212,7 @@ class Pedido(models.Model):
     ancho = models.PositiveIntegerField(blank=True, null=True)
     largo = models.PositiveIntegerField(blank=True, null=True)
     costo_envio = models.PositiveIntegerField(default=0, blank=True, null=True)  # Costo de envío si aplica
+    paquetes = models.JSONField(blank=True, null=True)  # Plan de empaque cotizado (envios.py), una pieza por paquete en la OT
     # Campos para seguimiento de Chilexpress
     ot_codigo = models.CharField(max_length=50, blank=True, null=True)  # Orden de transporte
     etiqueta_url = models.URLField(blank=True, null=True)  # URL de la etiqueta
@@ -261,6 +280,7 @@ class Factura(models.Model):
     # URLs y archivos
     pdf_url = models.URLField(blank=True, null=True)
     xml_url = models.URLField(blank=True, null=True)
+    pdf_sha256 = models.CharField(max_length=64, blank=True, null=True)  # Hash del PDF almacenado
     
     # Integración con Tributi
     tributi_id = models.CharField(max_length=50, blank=True, null=True)
@@ -287,4 +307,144 @@ class Factura(models.Model):
     class Meta:
         verbose_name = "Factura"
         verbose_name_plural = "Facturas"
-        ordering = ['-created_at']
\ No newline at end of file
+        ordering = ['-created_at']
+
+class EmailOutbox(models.Model):
+    """Cola de emails salientes, enviada por lotes por el comando enviar_outbox"""
+    ESTADOS = (
+        ('pendiente', 'Pendiente'),
+        ('enviando', 'Enviando'),
+        ('enviado', 'Enviado'),
+        ('fallido', 'Fallido'),
+    )
+
+    destinatario = models.EmailField()
+    asunto = models.CharField(max_length=255)
+    cuerpo_html = models.TextField(blank=True, default='')
+    cuerpo_texto = models.TextField(blank=True, default='')
+    reply_to = models.EmailField(blank=True, null=True)
+    adjunto_path = models.CharField(max_length=500, blank=True, null=True)  # Ruta absoluta del PDF
+    adjunto_nombre = models.CharField(max_length=255, blank=True, null=True)
+    pedido = models.ForeignKey(Pedido, on_delete=models.SET_NULL, null=True, blank=True, related_name='emails')
+
+    # Estado de entrega
+    estado = models.CharField(max_length=20, choices=ESTADOS, default='pendiente')
+    intentos = models.PositiveIntegerField(default=0)
+    proximo_intento = models.DateTimeField(default=timezone.now)
+    lote = models.CharField(max_length=32, blank=True, null=True)  # Worker que reclamó el email
+    ultimo_error = models.TextField(blank=True, null=True)
+
+    # Timestamps
+    creado = models.DateTimeField(auto_now_add=True)
+    enviado_en = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.asunto} -> {self.destinatario} ({self.estado})"
+
+    class Meta:
+        verbose_name = "Email saliente"
+        verbose_name_plural = "Emails salientes"
+        ordering = ['creado']
+        indexes = [
+            models.Index(fields=['estado', 'proximo_intento']),
+        ]
+
+
+class GeografiaChilexpress(models.Model):
+    """Snapshot local de regiones y comunas de Chilexpress (respaldo si la API cae)"""
+    clave = models.CharField(max_length=50, unique=True)  # 'regiones' o 'comunas:<region>'
+    datos = models.JSONField(default=list)
+    actualizado = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.clave} ({len(self.datos)} registros)"
+
+    class Meta:
+        verbose_name = "Geografía Chilexpress"
+        verbose_name_plural = "Geografía Chilexpress"
+
+
+class AjusteMasivo(models.Model):
+    """Auditoría de cada actualización masiva de precios/stock (tienda/precios.py)"""
+    usuario = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    reglas = models.JSONField(default=list)
+    filas_afectadas = models.JSONField(default=list)  # Filas actualizadas por cada regla
+    duracion_ms = models.PositiveIntegerField(default=0)
+    fecha = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Ajuste masivo #{self.pk} ({sum(self.filas_afectadas)} filas)"
+
+    class Meta:
+        verbose_name = "Ajuste masivo"
+        verbose_name_plural = "Ajustes masivos"
+        ordering = ['-fecha']
+
+
+class MovimientoStock(models.Model):
+    """
+    Libro de inventario: una fila por cada cambio de Producto.stock (solo se agregan filas)
+
+    stock en una fecha = último SnapshotStock anterior + suma de movimientos posteriores
+    (tienda/inventario.py)
+    """
+    TIPOS = (
+        ('inicial', 'Saldo inicial'),
+        ('venta', 'Venta'),
+        ('devolucion', 'Devolución'),
+        ('ajuste', 'Ajuste'),
+        ('importacion', 'Importación'),
+    )
+
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='movimientos_stock')
+    tipo = models.CharField(max_length=20, choices=TIPOS)
+    cantidad = models.IntegerField()  # Positiva = entra stock, negativa = sale
+    referencia = models.CharField(max_length=100, blank=True, default='')  # order_id, ajuste masivo, archivo...
+    usuario = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    fecha = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} {self.cantidad:+d} - {self.producto_id}"
+
+    class Meta:
+        verbose_name = "Movimiento de stock"
+        verbose_name_plural = "Movimientos de stock"
+        ordering = ['-fecha', '-id']
+        indexes = [models.Index(fields=['producto', 'fecha'])]
+
+
+class SnapshotStock(models.Model):
+    """Saldo del libro de inventario por producto en una fecha (python manage.py snapshot_stock)"""
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='snapshots_stock')
+    stock = models.IntegerField()
+    fecha = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.producto_id}: {self.stock} ({self.fecha:%d/%m/%Y %H:%M})"
+
+    class Meta:
+        verbose_name = "Snapshot de stock"
+        verbose_name_plural = "Snapshots de stock"
+        ordering = ['-fecha']
+        unique_together = ('producto', 'fecha')
+
+
+class AlertaStock(models.Model):
+    """
+    Productos con stock en o bajo su punto de reorden
+
+    Se mantiene al registrar cada movimiento de stock (inventario.py), solo para
+    los productos que cambiaron; no hay recorrido nocturno del catálogo.
+    """
+    producto = models.OneToOneField(Producto, on_delete=models.CASCADE, related_name='alerta_stock')
+    stock = models.IntegerField()
+    punto_reorden = models.PositiveIntegerField()
+    desde = models.DateTimeField(default=timezone.now)  # Primera vez que bajó del punto de reorden
+
+    def __str__(self):
+        return f"{self.producto_id}: {self.stock}/{self.punto_reorden}"
+
+    class Meta:
+        verbose_name = "Alerta de stock"
+        verbose_name_plural = "Alertas de stock"
+        ordering = ['stock']
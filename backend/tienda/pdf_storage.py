@@ -0,0 +1,210 @@
+"""
+Almacenamiento de PDFs direccionado por contenido
+=================================================
+
+Los comprobantes se guardan en MEDIA_ROOT/facturas/<aa>/<sha256>.pdf, donde el
+nombre del archivo es el hash SHA-256 de su contenido. Dos documentos idénticos
+terminan en el mismo archivo, por lo que regenerar un comprobante no deja
+duplicados en disco.
+
+Modos de entrega (settings.PDF_SERVE_MODE):
+- 'django': FileResponse con soporte de ETag y Range
+- 'x-accel-redirect': delega la entrega a Nginx (X-Accel-Redirect)
+- 'x-sendfile': delega la entrega a Apache/Lighttpd (X-Sendfile)
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+import logging
+from email.mime.application import MIMEApplication
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse, Http404
+
+logger = logging.getLogger(__name__)
+
+DIRECTORIO_PDF = 'facturas'
+
+# Tamaño de bloque para lectura/escritura
+TAMANO_BLOQUE = 64 * 1024
+
+RANGO_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def calcular_hash(contenido):
+    """Retorna el SHA-256 hexadecimal del contenido"""
+    return hashlib.sha256(contenido).hexdigest()
+
+
+def ruta_relativa(sha256, directorio=DIRECTORIO_PDF):
+    """Ruta relativa a MEDIA_ROOT para un hash dado"""
+    return os.path.join(directorio, sha256[:2], f"{sha256}.pdf")
+
+
+def ruta_absoluta(pdf_path):
+    """Convierte una ruta relativa a MEDIA_ROOT en ruta absoluta"""
+    return os.path.join(settings.MEDIA_ROOT, pdf_path)
+
+
+def guardar_pdf(contenido, directorio=DIRECTORIO_PDF):
+    """
+    Guarda un PDF usando su hash como nombre de archivo
+
+    Args:
+        contenido: bytes del PDF
+        directorio: subdirectorio de MEDIA_ROOT (facturas, etiquetas...)
+
+    Returns:
+        dict: {'sha256': str, 'pdf_path': str, 'creado': bool}
+    """
+    sha256 = calcular_hash(contenido)
+    pdf_path = ruta_relativa(sha256, directorio)
+    destino = ruta_absoluta(pdf_path)
+
+    if os.path.exists(destino):
+        logger.info(f"PDF ya existente reutilizado: {pdf_path}")
+        return {'sha256': sha256, 'pdf_path': pdf_path, 'creado': False}
+
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+
+    # Escritura atómica: archivo temporal en el mismo directorio + rename
+    fd, temporal = tempfile.mkstemp(dir=os.path.dirname(destino), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as archivo:
+            archivo.write(contenido)
+        os.replace(temporal, destino)
+    except Exception:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+
+    logger.info(f"PDF almacenado: {pdf_path}")
+    return {'sha256': sha256, 'pdf_path': pdf_path, 'creado': True}
+
+
+def leer_en_bloques(ruta, inicio=0, largo=None):
+    """Generador que lee un archivo por bloques desde `inicio`"""
+    with open(ruta, 'rb') as archivo:
+        archivo.seek(inicio)
+        restante = largo
+        while restante is None or restante > 0:
+            tamano = TAMANO_BLOQUE if restante is None else min(TAMANO_BLOQUE, restante)
+            bloque = archivo.read(tamano)
+            if not bloque:
+                break
+            if restante is not None:
+                restante -= len(bloque)
+            yield bloque
+
+
+def _parsear_rango(cabecera, tamano):
+    """
+    Interpreta una cabecera Range de un solo rango
+
+    Returns:
+        tuple (inicio, fin) inclusivo, None si se debe ignorar la cabecera,
+        o False si el rango no es satisfacible
+    """
+    coincidencia = RANGO_RE.match(cabecera.strip())
+    if not coincidencia:
+        # Rangos múltiples o sintaxis desconocida: se entrega el archivo completo
+        return None
+
+    inicio, fin = coincidencia.groups()
+    if inicio == '' and fin == '':
+        return None
+
+    if inicio == '':
+        # Sufijo: últimos N bytes
+        sufijo = int(fin)
+        if sufijo == 0:
+            return False
+        return max(tamano - sufijo, 0), tamano - 1
+
+    inicio = int(inicio)
+    fin = int(fin) if fin else tamano - 1
+    if inicio >= tamano or fin < inicio:
+        return False
+    return inicio, min(fin, tamano - 1)
+
+
+def respuesta_pdf(request, pdf_path, sha256, nombre_descarga):
+    """
+    Construye la respuesta HTTP para descargar un PDF almacenado
+
+    El hash del contenido se usa como ETag fuerte, así que el navegador puede
+    revalidar con If-None-Match y reanudar descargas con Range.
+    """
+    ruta = ruta_absoluta(pdf_path)
+    if not os.path.exists(ruta):
+        raise Http404("Documento no encontrado")
+
+    etag = f'"{sha256}"'
+    modo = getattr(settings, 'PDF_SERVE_MODE', 'django')
+
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponse(status=304)
+        response['ETag'] = etag
+        return response
+
+    if modo == 'x-accel-redirect':
+        prefijo = getattr(settings, 'PDF_X_ACCEL_PREFIX', '/protected-media/')
+        response = HttpResponse(content_type='application/pdf')
+        response['X-Accel-Redirect'] = f"{prefijo.rstrip('/')}/{pdf_path}"
+    elif modo == 'x-sendfile':
+        response = HttpResponse(content_type='application/pdf')
+        response['X-Sendfile'] = ruta
+    else:
+        tamano = os.path.getsize(ruta)
+        rango = None
+        cabecera_rango = request.headers.get('Range')
+        if cabecera_rango and request.headers.get('If-Range', etag) == etag:
+            rango = _parsear_rango(cabecera_rango, tamano)
+
+        if rango is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f"bytes */{tamano}"
+            return response
+
+        if rango:
+            inicio, fin = rango
+            largo = fin - inicio + 1
+            response = StreamingHttpResponse(
+                leer_en_bloques(ruta, inicio, largo),
+                status=206,
+                content_type='application/pdf'
+            )
+            response['Content-Range'] = f"bytes {inicio}-{fin}/{tamano}"
+            response['Content-Length'] = str(largo)
+        else:
+            response = FileResponse(open(ruta, 'rb'), content_type='application/pdf')
+
+        response['Accept-Ranges'] = 'bytes'
+
+    response['ETag'] = etag
+    response['Content-Disposition'] = f'inline; filename="{nombre_descarga}"'
+    # El contenido nunca cambia para un mismo hash, pero es un documento privado
+    response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
+
+
+def crear_adjunto_pdf(pdf_path, nombre_archivo):
+    """
+    Crea la parte MIME de un PDF
+
+    smtplib necesita el mensaje completo en memoria para enviarlo, así que el
+    archivo se lee de una vez; los comprobantes pesan pocos cientos de KB.
+
+    Args:
+        pdf_path: ruta absoluta al PDF
+        nombre_archivo: nombre con que se verá el adjunto
+
+    Returns:
+        MIMEApplication listo para EmailMessage.attach() o MIMEMultipart.attach()
+    """
+    with open(pdf_path, 'rb') as archivo:
+        adjunto = MIMEApplication(archivo.read(), _subtype='pdf')
+    adjunto.add_header('Content-Disposition', 'attachment', filename=nombre_archivo)
+    return adjunto
@@ -0,0 +1,200 @@
+"""
+Actualización masiva de precios y stock
+=======================================
+
+Aplica reglas sobre conjuntos de productos con un UPDATE por regla, en vez de
+editar producto por producto en ProductoDetalleAPIView:
+
+    [
+        {"campo": "precio", "operacion": "porcentaje", "valor": 7,
+         "filtro": {"categoria": "Frenos"}},
+        {"campo": "precio_mayorista", "operacion": "multiplicar", "valor": 0.85,
+         "base": "precio", "filtro": {"marca": "Bosch"}, "redondeo": 10}
+    ]
+
+- Operaciones: porcentaje (+/- %), sumar, multiplicar, fijar
+- `base` permite calcular un campo a partir de otro (mayorista = precio × 0.85)
+- Las reglas se aplican en orden dentro de una transacción: cada una ve el
+  resultado de las anteriores
+- `simular_ajuste()` muestra cuántas filas cambian y una muestra antes/después
+- Cada lote aplicado queda en AjusteMasivo
+- Las reglas de stock leen antes del UPDATE solo las filas que cambian y las
+  registran como movimientos 'ajuste' en el libro de inventario (inventario.py)
+"""
+
+import time
+import logging
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import F, Q, Value, ExpressionWrapper, FloatField, IntegerField
+from django.db.models.functions import Cast, Greatest, Round
+
+from .models import Producto, AjusteMasivo
+from .inventario import registrar_diferencias
+
+logger = logging.getLogger(__name__)
+
+CAMPOS = {'precio': 1, 'precio_mayorista': 1, 'stock': 0}  # campo -> mínimo permitido
+OPERACIONES = ('porcentaje', 'sumar', 'multiplicar', 'fijar')
+FILTROS = ('categoria', 'marca', 'ids', 'skus')
+MAX_REGLAS = 20
+TAMANO_MUESTRA = 10
+
+
+class ReglaInvalida(ValueError):
+    """La regla de ajuste no se puede aplicar"""
+
+
+def _numero(valor, campo):
+    try:
+        numero = Decimal(str(valor))
+    except InvalidOperation:
+        raise ReglaInvalida(f"{campo}: '{valor}' no es un número")
+    if not numero.is_finite():
+        raise ReglaInvalida(f"{campo}: '{valor}' no es un número")
+    return numero
+
+
+def validar_regla(regla, posicion=1):
+    """Normaliza una regla y lanza ReglaInvalida si no se puede aplicar"""
+    if not isinstance(regla, dict):
+        raise ReglaInvalida(f"Regla {posicion}: debe ser un objeto")
+    campo = regla.get('campo')
+    operacion = regla.get('operacion')
+    base = regla.get('base') or campo
+    if campo not in CAMPOS or base not in CAMPOS:
+        raise ReglaInvalida(f"Regla {posicion}: campo debe ser uno de {', '.join(CAMPOS)}")
+    if operacion not in OPERACIONES:
+        raise ReglaInvalida(f"Regla {posicion}: operacion debe ser una de {', '.join(OPERACIONES)}")
+
+    filtro = regla.get('filtro') or {}
+    desconocidos = set(filtro) - set(FILTROS)
+    if desconocidos:
+        raise ReglaInvalida(f"Regla {posicion}: filtros desconocidos: {', '.join(sorted(desconocidos))}")
+
+    redondeo = int(_numero(regla.get('redondeo') or 1, 'redondeo'))
+    if redondeo < 1:
+        raise ReglaInvalida(f"Regla {posicion}: redondeo debe ser 1 o más")
+
+    return {
+        'campo': campo,
+        'operacion': operacion,
+        'valor': _numero(regla.get('valor'), f"Regla {posicion}: valor"),
+        'base': base,
+        'filtro': filtro,
+        'redondeo': redondeo,
+    }
+
+
+def _queryset(filtro):
+    productos = Producto.objects.all()
+    condiciones = Q()
+    for clave, campo_id, campo_nombre in (
+        ('categoria', 'categoria_id', 'categoria__nombre__iexact'),
+        ('marca', 'marca__id', 'marca__nombre__iexact'),
+    ):
+        valor = filtro.get(clave)
+        if valor in (None, ''):
+            continue
+        if isinstance(valor, int) or str(valor).isdigit():
+            condiciones &= Q(**{campo_id: int(valor)})
+        else:
+            condiciones &= Q(**{campo_nombre: valor})
+    if filtro.get('ids'):
+        condiciones &= Q(id__in=filtro['ids'])
+    if filtro.get('skus'):
+        condiciones &= Q(sku__in=filtro['skus'])
+    productos = productos.filter(condiciones)
+    if filtro.get('marca') not in (None, ''):
+        # El JOIN con el M2M no debe repetir productos; el UPDATE usa id IN (subconsulta)
+        productos = Producto.objects.filter(id__in=productos.values('id'))
+    return productos
+
+
+def _expresion(regla):
+    """Expresión SQL del nuevo valor (redondeada, entera y con mínimo)"""
+    base, valor = F(regla['base']), float(regla['valor'])
+    operacion = regla['operacion']
+    if operacion == 'porcentaje':
+        nuevo = base * Value(1 + valor / 100)
+    elif operacion == 'sumar':
+        nuevo = base + Value(valor)
+    elif operacion == 'multiplicar':
+        nuevo = base * Value(valor)
+    else:
+        nuevo = Value(valor)
+    nuevo = ExpressionWrapper(nuevo, output_field=FloatField())
+
+    redondeo = regla['redondeo']
+    if redondeo > 1:
+        nuevo = Round(nuevo / Value(float(redondeo))) * Value(redondeo)
+    else:
+        nuevo = Round(nuevo)
+    return Greatest(Cast(nuevo, IntegerField()), Value(CAMPOS[regla['campo']]))
+
+
+def _validar_lote(reglas):
+    if not isinstance(reglas, list) or not reglas:
+        raise ReglaInvalida("Se requiere una lista de reglas")
+    if len(reglas) > MAX_REGLAS:
+        raise ReglaInvalida(f"Máximo {MAX_REGLAS} reglas por lote")
+    return [validar_regla(regla, posicion) for posicion, regla in enumerate(reglas, start=1)]
+
+
+def simular_ajuste(reglas):
+    """
+    Vista previa sin escribir: filas afectadas y muestra antes/después por regla
+
+    Las reglas se simulan por separado sobre los valores actuales (sin encadenar).
+    """
+    resultado = []
+    for regla in _validar_lote(reglas):
+        productos = _queryset(regla['filtro'])
+        campo = regla['campo']
+        muestra = productos.annotate(nuevo=_expresion(regla)).order_by('id').values(
+            'id', 'sku', 'nombre', campo, 'nuevo'
+        )[:TAMANO_MUESTRA]
+        resultado.append({
+            'campo': campo,
+            'filas': productos.count(),
+            'muestra': [
+                {'id': fila['id'], 'sku': fila['sku'], 'nombre': fila['nombre'],
+                 'antes': fila[campo], 'despues': fila['nuevo']}
+                for fila in muestra
+            ],
+        })
+    return resultado
+
+
+def aplicar_ajuste(reglas, usuario=None):
+    """
+    Aplica las reglas en una transacción (un UPDATE por regla)
+
+    Returns:
+        AjusteMasivo: registro de auditoría con las filas afectadas por regla
+    """
+    validadas = _validar_lote(reglas)
+    inicio = time.perf_counter()
+    with transaction.atomic():
+        filas, stock_antes, stock_despues = [], {}, {}
+        for regla in validadas:
+            productos = _queryset(regla['filtro'])
+            if regla['campo'] == 'stock':
+                # Solo las filas que cambian, para dejarlas en el libro de inventario
+                for producto_id, antes, despues in productos.annotate(nuevo=_expresion(regla)).exclude(
+                    nuevo=F('stock')
+                ).values_list('id', 'stock', 'nuevo'):
+                    stock_antes.setdefault(producto_id, antes)
+                    stock_despues[producto_id] = despues
+            filas.append(productos.update(**{regla['campo']: _expresion(regla)}))
+        ajuste = AjusteMasivo.objects.create(
+            usuario=usuario if usuario and usuario.is_authenticated else None,
+            reglas=reglas,
+            filas_afectadas=filas,
+            duracion_ms=int((time.perf_counter() - inicio) * 1000),
+        )
+        registrar_diferencias(stock_antes, stock_despues, 'ajuste', f'ajuste masivo #{ajuste.pk}', usuario)
+
+    logger.info(f"💲 Ajuste masivo #{ajuste.pk}: {sum(filas)} filas en {ajuste.duracion_ms} ms")
+    return ajuste
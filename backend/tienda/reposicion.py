@@ -0,0 +1,116 @@
+"""
+Alertas de bajo stock y puntos de reorden
+=========================================
+
+Cada producto tiene un `punto_reorden`; cuando su stock queda en o bajo ese
+valor aparece en AlertaStock. La tabla se mantiene de forma incremental:
+inventario.py llama a `actualizar_alertas()` con los productos de cada
+movimiento registrado, así que la vista de bajo stock es un SELECT sobre
+unas pocas filas y no un recorrido del catálogo.
+
+La velocidad de venta (unidades/día) sale de un GROUP BY sobre PedidoItem de
+los últimos STOCK_DIAS_VENTAS días de pedidos pagados, cacheado
+STOCK_VENTAS_CACHE_TTL segundos. Con ella se estiman los días de cobertura
+y la cantidad sugerida para reponer.
+"""
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import Producto, PedidoItem, AlertaStock
+
+logger = logging.getLogger(__name__)
+
+DIAS_VENTAS = getattr(settings, 'STOCK_DIAS_VENTAS', 30)
+DIAS_COBERTURA = getattr(settings, 'STOCK_DIAS_COBERTURA', 14)
+VENTAS_CACHE_TTL = getattr(settings, 'STOCK_VENTAS_CACHE_TTL', 3600)
+ESTADOS_VENTA = ('pagado', 'preparacion', 'listo_retiro', 'enviado', 'retirado')
+TAMANO_LOTE = 500
+
+
+def actualizar_alertas(producto_ids):
+    """
+    Crea, actualiza o elimina las alertas de los productos indicados
+
+    Returns:
+        int: productos que quedaron con alerta
+    """
+    producto_ids = list(producto_ids)
+    con_alerta = 0
+    for inicio in range(0, len(producto_ids), TAMANO_LOTE):
+        lote = producto_ids[inicio:inicio + TAMANO_LOTE]
+        bajos, normales = [], []
+        for producto_id, stock, punto_reorden in Producto.objects.filter(id__in=lote).values_list(
+            'id', 'stock', 'punto_reorden'
+        ):
+            if stock <= punto_reorden:
+                bajos.append(AlertaStock(producto_id=producto_id, stock=stock, punto_reorden=punto_reorden))
+            else:
+                normales.append(producto_id)
+
+        if normales:
+            AlertaStock.objects.filter(producto_id__in=normales).delete()
+        if bajos:
+            # `desde` se conserva en las alertas que ya existían
+            AlertaStock.objects.bulk_create(
+                bajos, update_conflicts=True, unique_fields=['producto'], update_fields=['stock', 'punto_reorden']
+            )
+        con_alerta += len(bajos)
+    return con_alerta
+
+
+def velocidad_ventas(dias=DIAS_VENTAS):
+    """{producto_id: unidades vendidas por día} en los últimos `dias` (cacheado)"""
+    clave = f'reposicion:ventas:{dias}'
+    velocidades = cache.get(clave)
+    if velocidades is None:
+        desde = timezone.now() - timedelta(days=dias)
+        velocidades = {
+            producto_id: unidades / dias
+            for producto_id, unidades in PedidoItem.objects.filter(
+                pedido__estado__in=ESTADOS_VENTA, pedido__fecha__gte=desde
+            ).order_by().values('producto').annotate(unidades=Sum('cantidad')).values_list('producto', 'unidades')
+        }
+        cache.set(clave, velocidades, VENTAS_CACHE_TTL)
+    return velocidades
+
+
+def productos_bajo_stock():
+    """
+    Productos con alerta, los más urgentes primero (menos días de cobertura)
+
+    Returns:
+        list: dicts {'id', 'sku', 'nombre', 'stock', 'punto_reorden', 'desde',
+                     'venta_diaria', 'dias_cobertura', 'sugerido'}
+    """
+    velocidades = velocidad_ventas()
+    resultado = []
+    for alerta in AlertaStock.objects.select_related('producto').only(
+        'stock', 'punto_reorden', 'desde', 'producto__sku', 'producto__nombre'
+    ):
+        venta_diaria = velocidades.get(alerta.producto_id, 0)
+        objetivo = max(alerta.punto_reorden, round(venta_diaria * DIAS_COBERTURA))
+        resultado.append({
+            'id': alerta.producto_id,
+            'sku': alerta.producto.sku,
+            'nombre': alerta.producto.nombre,
+            'stock': alerta.stock,
+            'punto_reorden': alerta.punto_reorden,
+            'desde': alerta.desde.isoformat(),
+            'venta_diaria': round(venta_diaria, 2),
+            'dias_cobertura': round(alerta.stock / venta_diaria, 1) if venta_diaria else None,
+            'sugerido': max(objetivo - alerta.stock, 0),
+        })
+    resultado.sort(key=lambda fila: (
+        fila['dias_cobertura'] is None, fila['dias_cobertura'] or 0, fila['stock']
+    ))
+    return resultado
+
+
+def total_alertas():
+    return AlertaStock.objects.count()
@@ -0,0 +1,162 @@
+"""
+Seguimiento de envíos Chilexpress
+=================================
+
+Poller que refresca Pedido.estado_envio para todas las OTs en tránsito:
+- Recorre los pedidos por lotes (paginación por id, sin cargar todo en memoria)
+- Consulta el tracking en paralelo con concurrencia y ritmo acotados
+- Escribe solo las filas que cambiaron, con un bulk_update por lote
+- Avanza el estado del pedido: en tránsito -> 'enviado', entregado -> 'retirado'.
+  Ese cambio es un UPDATE condicionado al estado leído antes de consultar:
+  si bodega canceló o cerró el pedido mientras corría el poller, no se pisa
+- Con CHILEXPRESS_SIMULACION no corre: el tracking simulado responde
+  'EN TRANSITO' para cualquier OT y marcaría como enviados pedidos reales
+
+Se ejecuta periódicamente con el comando `actualizar_tracking` (cron o --loop).
+"""
+
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from . import chilexpress
+from .chilexpress import consultar_tracking
+from .http_client import LimitadorTasa
+from .models import Pedido
+
+logger = logging.getLogger(__name__)
+
+TRACKING_TAMANO_LOTE = getattr(settings, 'CHILEXPRESS_TRACKING_LOTE', 100)
+TRACKING_MAX_PARALELO = getattr(settings, 'CHILEXPRESS_TRACKING_PARALELO', 4)
+TRACKING_MAX_POR_SEGUNDO = getattr(settings, 'CHILEXPRESS_TRACKING_POR_SEGUNDO', 10)
+
+# estado_envio -> estado del pedido al que debe avanzar
+ESTADO_PEDIDO_POR_ENVIO = {
+    'en_transito': 'enviado',
+    'en_reparto': 'enviado',
+    'entregado': 'retirado',
+}
+
+# Estados del pedido que ya no deben retroceder
+ESTADOS_FINALES = ('retirado', 'cancelado', 'fallido')
+
+# Fragmentos de la descripción de Chilexpress -> estado_envio (se revisan en orden)
+PALABRAS_ESTADO = (
+    ('NO ENTREGAD', 'incidencia'),
+    ('DEVOL', 'incidencia'),
+    ('INCIDENCIA', 'incidencia'),
+    ('ENTREGAD', 'entregado'),
+    ('REPARTO', 'en_reparto'),
+    ('TRANSITO', 'en_transito'),
+    ('TRÁNSITO', 'en_transito'),
+    ('RUTA', 'en_transito'),
+    ('RECIBID', 'en_transito'),
+    ('ADMITID', 'en_transito'),
+)
+
+
+def normalizar_estado(descripcion):
+    """Traduce el estado de Chilexpress a nuestro estado_envio (None si no se reconoce)"""
+    texto = (descripcion or '').upper()
+    for fragmento, estado in PALABRAS_ESTADO:
+        if fragmento in texto:
+            return estado
+    return None
+
+
+def pedidos_en_transito():
+    """Pedidos con OT cuyo envío todavía no termina"""
+    return (
+        Pedido.objects
+        .filter(envio_domicilio=True, ot_codigo__isnull=False)
+        .exclude(ot_codigo='')
+        .exclude(estado_envio='entregado')
+        .exclude(estado__in=ESTADOS_FINALES)
+    )
+
+
+def aplicar_tracking(pedido, descripcion):
+    """
+    Aplica un estado de tracking al pedido (en memoria)
+
+    Returns:
+        bool: True si el pedido cambió
+    """
+    estado_envio = normalizar_estado(descripcion)
+    if estado_envio is None:
+        logger.info(f"Estado de tracking no reconocido para {pedido.ot_codigo}: {descripcion}")
+        return False
+
+    cambio = False
+    if pedido.estado_envio != estado_envio:
+        pedido.estado_envio = estado_envio
+        cambio = True
+
+    nuevo_estado = ESTADO_PEDIDO_POR_ENVIO.get(estado_envio)
+    if nuevo_estado and pedido.estado != nuevo_estado and pedido.estado not in ESTADOS_FINALES:
+        pedido.estado = nuevo_estado
+        cambio = True
+    return cambio
+
+
+def _lotes(queryset, tamano):
+    """Itera el queryset en lotes paginando por id"""
+    ultimo_id = 0
+    while True:
+        lote = list(
+            queryset.filter(id__gt=ultimo_id)
+            .only('id', 'order_id', 'ot_codigo', 'estado', 'estado_envio')
+            .order_by('id')[:tamano]
+        )
+        if not lote:
+            return
+        yield lote
+        ultimo_id = lote[-1].id
+
+
+def actualizar_tracking(tamano_lote=TRACKING_TAMANO_LOTE, max_paralelo=TRACKING_MAX_PARALELO,
+                        max_por_segundo=TRACKING_MAX_POR_SEGUNDO):
+    """
+    Refresca el tracking de todas las OTs en tránsito
+
+    Returns:
+        dict: {'consultados': int, 'actualizados': int, 'errores': int}
+    """
+    resumen = {'consultados': 0, 'actualizados': 0, 'errores': 0}
+    if chilexpress.MODO_SIMULACION:
+        logger.warning("⚠️ Chilexpress en modo simulación: no se actualiza el tracking")
+        return resumen
+    limitador = LimitadorTasa(max_por_segundo)
+
+    def consultar(pedido):
+        limitador.esperar()
+        return consultar_tracking(pedido.ot_codigo, pedido.order_id)
+
+    with ThreadPoolExecutor(max_workers=max_paralelo, thread_name_prefix='tracking') as pool:
+        for lote in _lotes(pedidos_en_transito(), tamano_lote):
+            cambiados = []
+            avances = defaultdict(list)  # (estado leído, estado nuevo) -> ids
+            for pedido, futuro in [(pedido, pool.submit(consultar, pedido)) for pedido in lote]:
+                resumen['consultados'] += 1
+                try:
+                    descripcion = futuro.result()
+                except Exception as e:
+                    resumen['errores'] += 1
+                    logger.warning(f"⚠️ Error consultando tracking de {pedido.ot_codigo}: {e}")
+                    continue
+                estado_leido = pedido.estado
+                if aplicar_tracking(pedido, descripcion):
+                    cambiados.append(pedido)
+                    if pedido.estado != estado_leido:
+                        avances[(estado_leido, pedido.estado)].append(pedido.id)
+
+            if cambiados:
+                Pedido.objects.bulk_update(cambiados, ['estado_envio'])
+                for (estado_leido, nuevo_estado), ids in avances.items():
+                    Pedido.objects.filter(id__in=ids, estado=estado_leido).update(estado=nuevo_estado)
+                resumen['actualizados'] += len(cambiados)
+
+    logger.info(f"📍 Tracking actualizado: {resumen}")
+    return resumen
@@ -2,6 +2,10 @@ import pytz
 from rest_framework import serializers
 from .models import Producto, Marca, Categoria, Vehiculo, Carrito, CarritoItem, MarcaVehiculo, ModeloVehiculo, CompatibilidadVehiculo
 import json
+from django.db import transaction
+from django.utils import timezone
+from .vehiculos import invalidar_cache_vehiculos
+from .inventario import registrar_diferencias
 
 class CompatibilidadVehiculoSerializer(serializers.ModelSerializer):
     marca_nombre = serializers.SerializerMethodField()
@@ -36,7 +40,7 @@ class ProductoSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'nombre', 'precio','precio_mayorista','descripcion', 'stock', 'imagen',
             'marca', 'categoria', 'fecha_creacion',
-            'peso', 'largo', 'ancho', 'alto',
+            'peso', 'largo', 'ancho', 'alto', 'punto_reorden',
             'nombre_categoria', 'nombre_marcas', 'compatibilidades'
         ]
 
@@ -57,61 +61,144 @@ class ProductoSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         # Procesar compatibilidades si están en el request
         compatibilidades_data = self.context.get('compatibilidades', [])
-        print(f"🔍 CREATE - Compatibilidades recibidas: {compatibilidades_data}")
-        print(f"🔍 CREATE - Tipo de compatibilidades: {type(compatibilidades_data)}")
-        print(f"🔍 CREATE - Longitud: {len(compatibilidades_data) if compatibilidades_data else 0}")
-        
         producto = super().create(validated_data)
-        print(f"🔍 CREATE - Producto creado: {producto.id} - {producto.nombre}")
-        
+        registrar_diferencias({}, {producto.id: producto.stock}, 'inicial', usuario=self._usuario())
         self._save_compatibilidades(producto, compatibilidades_data)
         return producto
 
     def update(self, instance, validated_data):
         compatibilidades_data = self.context.get('compatibilidades', [])
+        stock_anterior = instance.stock
         producto = super().update(instance, validated_data)
+        registrar_diferencias(
+            {producto.id: stock_anterior}, {producto.id: producto.stock}, 'ajuste', usuario=self._usuario()
+        )
         self._save_compatibilidades(producto, compatibilidades_data)
         return producto
 
+    def _usuario(self):
+        request = self.context.get('request')
+        return request.user if request else None
+
     def _save_compatibilidades(self, producto, compatibilidades_data):
-        """Guardar compatibilidades de vehículos para el producto"""
-        print(f"🔍 DEBUG _save_compatibilidades - Datos recibidos: {compatibilidades_data}")
-        
-        # Eliminar compatibilidades existentes
-        CompatibilidadVehiculo.objects.filter(producto=producto).delete()
-        if not compatibilidades_data:
-            return
-        # Compatibilidad total
-        if len(compatibilidades_data) == 1 and compatibilidades_data[0].get('todas'):
-            CompatibilidadVehiculo.objects.create(producto=producto, todas=True)
-            return
-        # Compatibilidades normales
+        """
+        Guardar compatibilidades de vehículos para el producto
+
+        Compara con lo que ya está guardado y solo inserta/borra las filas que
+        cambiaron. Marcas y modelos se resuelven en bloque: guardar por primera
+        vez un producto con 300 vehículos son 14 consultas, no ~900.
+        """
+        request = self.context.get('request')
+        usuario = request.user if request and request.user.is_authenticated else None
+
+        with transaction.atomic():
+            existentes = list(CompatibilidadVehiculo.objects.filter(producto=producto))
+
+            # Compatibilidad total: se conserva la fila 'todas' si ya existía
+            if len(compatibilidades_data or []) == 1 and compatibilidades_data[0].get('todas'):
+                total = next((comp for comp in existentes if comp.todas), None)
+                CompatibilidadVehiculo.objects.filter(producto=producto).exclude(
+                    id=total.id if total else None
+                ).delete()
+                if total is None:
+                    CompatibilidadVehiculo.objects.create(producto=producto, todas=True, creado_por=usuario)
+                return
+
+            filas = self._normalizar_compatibilidades(compatibilidades_data or [])
+            modelos = self._resolver_modelos(filas)
+
+            deseadas = {}
+            for marca_nombre, modelo_nombre, año_desde, año_hasta, notas in filas:
+                modelo = modelos[(marca_nombre, modelo_nombre)]
+                deseadas.setdefault((modelo.id, año_desde, año_hasta), notas)
+
+            actuales = {}
+            sobrantes, notas_cambiadas = [], []
+            for comp in existentes:
+                clave = (comp.modelo_vehiculo_id, comp.año_desde, comp.año_hasta)
+                if comp.todas or clave not in deseadas or clave in actuales:
+                    sobrantes.append(comp.id)
+                    continue
+                actuales[clave] = comp
+                if (comp.notas or '') != deseadas[clave]:
+                    comp.notas = deseadas[clave]
+                    notas_cambiadas.append(comp)
+
+            if sobrantes:
+                CompatibilidadVehiculo.objects.filter(id__in=sobrantes).delete()
+            CompatibilidadVehiculo.objects.bulk_update(notas_cambiadas, ['notas'])
+            CompatibilidadVehiculo.objects.bulk_create([
+                CompatibilidadVehiculo(
+                    producto=producto,
+                    modelo_vehiculo_id=modelo_id,
+                    año_desde=año_desde,
+                    año_hasta=año_hasta,
+                    notas=notas,
+                    todas=False,
+                    creado_por=usuario
+                )
+                for (modelo_id, año_desde, año_hasta), notas in deseadas.items()
+                if (modelo_id, año_desde, año_hasta) not in actuales
+            ], batch_size=500)
+
+    @staticmethod
+    def _normalizar_compatibilidades(compatibilidades_data):
+        """[(marca, modelo, año_desde, año_hasta, notas)] descartando filas incompletas"""
+        filas = []
         for comp_data in compatibilidades_data:
-            marca_nombre = comp_data.get('marca_nombre', '')
-            modelo_nombre = comp_data.get('modelo_nombre', '')
+            marca_nombre = (comp_data.get('marca_nombre') or '').strip()
+            modelo_nombre = (comp_data.get('modelo_nombre') or '').strip()
             if not marca_nombre or not modelo_nombre:
                 continue
             año_desde = int(comp_data['año_desde']) if comp_data.get('año_desde') else None
             año_hasta = int(comp_data['año_hasta']) if comp_data.get('año_hasta') else None
-            marca_vehiculo, _ = MarcaVehiculo.objects.get_or_create(nombre=marca_nombre)
-            modelo_vehiculo, _ = ModeloVehiculo.objects.get_or_create(
-                nombre=modelo_nombre,
-                marca_vehiculo=marca_vehiculo,
-                defaults={
-                    'año_inicio': año_desde,
-                    'año_fin': año_hasta if año_hasta != año_desde else None
-                }
-            )
-            CompatibilidadVehiculo.objects.create(
-                producto=producto,
-                modelo_vehiculo=modelo_vehiculo,
-                año_desde=año_desde,
-                año_hasta=año_hasta,
-                notas=comp_data.get('notas', ''),
-                todas=False,
-                creado_por=self.context.get('request').user if self.context.get('request') else None
+            filas.append((marca_nombre, modelo_nombre, año_desde, año_hasta, comp_data.get('notas') or ''))
+        return filas
+
+    @staticmethod
+    def _resolver_modelos(filas):
+        """
+        {(marca, modelo): ModeloVehiculo}, creando en bloque las marcas y
+        modelos que no existan todavía
+        """
+        if not filas:
+            return {}
+        nombres_marcas = {fila[0] for fila in filas}
+        marcas = {m.nombre: m for m in MarcaVehiculo.objects.filter(nombre__in=nombres_marcas)}
+        faltantes = nombres_marcas - marcas.keys()
+        if faltantes:
+            MarcaVehiculo.objects.bulk_create(
+                [MarcaVehiculo(nombre=nombre) for nombre in faltantes], ignore_conflicts=True
             )
-    
+            marcas = {m.nombre: m for m in MarcaVehiculo.objects.filter(nombre__in=nombres_marcas)}
+
+        def cargar_modelos():
+            encontrados = {}
+            consulta = ModeloVehiculo.objects.filter(
+                marca_vehiculo__in=marcas.values(), nombre__in={fila[1] for fila in filas}
+            ).select_related('marca_vehiculo').order_by('año_inicio')
+            for modelo in consulta:
+                encontrados.setdefault((modelo.marca_vehiculo.nombre, modelo.nombre), modelo)
+            return encontrados
+
+        modelos = cargar_modelos()
+        nuevos = {}
+        for marca_nombre, modelo_nombre, año_desde, año_hasta, _ in filas:
+            if (marca_nombre, modelo_nombre) not in modelos:
+                nuevos.setdefault((marca_nombre, modelo_nombre), ModeloVehiculo(
+                    marca_vehiculo=marcas[marca_nombre],
+                    nombre=modelo_nombre,
+                    año_inicio=año_desde or año_hasta or timezone.now().year,
+                    año_fin=año_hasta if año_hasta != año_desde else None
+                ))
+        if nuevos:
+            ModeloVehiculo.objects.bulk_create(nuevos.values(), ignore_conflicts=True)
+            modelos = cargar_modelos()
+        if faltantes or nuevos:
+            # bulk_create no emite señales: avisar al índice de autocompletado
+            invalidar_cache_vehiculos()
+        return modelos
+
 class MarcaSerializer(serializers.ModelSerializer):
     class  Meta:
         model = Marca
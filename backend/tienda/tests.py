@@ -1,7 +1,1243 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+
+# settings.CACHES usa un cache compartido (Redis o tabla en la BD). Las pruebas
+# corren en un solo proceso, así que las que cuentan consultas o coordinan
+# hilos usan un cache en memoria para no medir las lecturas del cache
+CACHE_LOCAL = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
 
 class TiendaTests(TestCase):
     def test_tienda_access(self):
         """Test de acceso a tienda"""
         response = self.client.get('/tienda/')
         self.assertIn(response.status_code, [200, 404, 403])
+
+
+class PdfStorageTests(TestCase):
+    def setUp(self):
+        import tempfile
+        from django.test import override_settings
+        self.media = tempfile.TemporaryDirectory()
+        self.override = override_settings(MEDIA_ROOT=self.media.name, PDF_SERVE_MODE='django')
+        self.override.enable()
+
+    def tearDown(self):
+        self.override.disable()
+        self.media.cleanup()
+
+    def test_pdf_identico_se_deduplica(self):
+        """Guardar dos veces el mismo contenido produce un solo archivo"""
+        from .pdf_storage import guardar_pdf
+        primero = guardar_pdf(b'%PDF-1.4 contenido')
+        segundo = guardar_pdf(b'%PDF-1.4 contenido')
+        self.assertTrue(primero['creado'])
+        self.assertFalse(segundo['creado'])
+        self.assertEqual(primero['pdf_path'], segundo['pdf_path'])
+
+    def test_respuesta_con_etag_y_rango(self):
+        """La descarga soporta If-None-Match y Range"""
+        from django.test import RequestFactory
+        from .pdf_storage import guardar_pdf, respuesta_pdf
+        almacenado = guardar_pdf(b'0123456789')
+        factory = RequestFactory()
+
+        request = factory.get('/', HTTP_RANGE='bytes=2-5')
+        response = respuesta_pdf(request, almacenado['pdf_path'], almacenado['sha256'], 'c.pdf')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+
+        request = factory.get('/', HTTP_IF_NONE_MATCH=f'"{almacenado["sha256"]}"')
+        response = respuesta_pdf(request, almacenado['pdf_path'], almacenado['sha256'], 'c.pdf')
+        self.assertEqual(response.status_code, 304)
+
+
+class EmailOutboxTests(TestCase):
+    def test_lote_se_envia_por_una_conexion(self):
+        """procesar_outbox envía los pendientes y los marca como enviados"""
+        from django.core import mail
+        from django.test import override_settings
+        from .email_outbox import encolar_email, procesar_outbox
+        from .models import EmailOutbox
+
+        with override_settings(EMAIL_OUTBOX_PROCESAR_AL_ENCOLAR=False):
+            for i in range(3):
+                encolar_email(f'cliente{i}@test.cl', 'Comprobante', '<p>Hola</p>')
+
+        resultado = procesar_outbox(backend='django.core.mail.backends.locmem.EmailBackend')
+        self.assertEqual(resultado['enviados'], 3)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(mail.outbox[0].body, 'Hola')
+        self.assertFalse(EmailOutbox.objects.exclude(estado='enviado').exists())
+
+    def test_adjunto_inexistente_falla_sin_reintentos(self):
+        """Un FileNotFoundError del adjunto no es transitorio: queda 'fallido' al primer intento"""
+        from django.test import override_settings
+        from .email_outbox import encolar_email, procesar_outbox
+
+        with override_settings(EMAIL_OUTBOX_PROCESAR_AL_ENCOLAR=False):
+            email = encolar_email('cliente@test.cl', 'Comprobante', '<p>Hola</p>',
+                                  adjunto_path='/no/existe/comprobante.pdf')
+
+        resultado = procesar_outbox(backend='django.core.mail.backends.locmem.EmailBackend')
+        self.assertEqual((resultado['fallidos'], resultado['reintentos']), (1, 0))
+        email.refresh_from_db()
+        self.assertEqual((email.estado, email.intentos), ('fallido', 1))
+
+
+class EmailTemplatesTests(TestCase):
+    def test_comprobante_html_y_texto(self):
+        """La plantilla compilada genera HTML con estilos en línea y texto plano"""
+        from .email_templates import motor_emails, renderizar_email
+        from .benchmarks import _contexto_falso
+
+        html, texto = renderizar_email('comprobante', _contexto_falso(2))
+        self.assertIn('style="', html)
+        self.assertNotIn('<style>', html)
+        self.assertIn('$39.980', html)
+        self.assertNotIn('<', texto)
+        self.assertIn('Repuesto 1', texto)
+        # El loader cacheado devuelve la misma plantilla compilada
+        self.assertIs(
+            motor_emails.get_template('emails/comprobante.html'),
+            motor_emails.get_template('emails/comprobante.html'),
+        )
+
+
+class HttpClientTests(TestCase):
+    def test_circuito_se_abre_y_corta_peticiones(self):
+        """Tras N fallos seguidos el cliente no envía peticiones al upstream"""
+        from .http_client import ClienteHTTP, CircuitoAbierto
+
+        cliente = ClienteHTTP('prueba', umbral_fallos=2, tiempo_abierto=60, reintentos=0,
+                              timeout_conexion=0.2, timeout_lectura=0.2)
+        for _ in range(2):
+            with self.assertRaises(Exception):
+                cliente.get('http://127.0.0.1:9/')  # puerto discard: conexión rechazada
+        self.assertEqual(cliente.breaker.estado, 'abierto')
+        with self.assertRaises(CircuitoAbierto):
+            cliente.get('http://127.0.0.1:9/')
+
+        # Pasado el tiempo de espera se permite una sola petición de prueba
+        cliente.breaker.abierto_desde -= 60
+        self.assertTrue(cliente.breaker.permitir())
+        self.assertFalse(cliente.breaker.permitir())
+        cliente.breaker.registrar_exito()
+        self.assertEqual(cliente.breaker.estado, 'cerrado')
+
+
+class GeografiaChilexpressTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+    def test_snapshot_responde_con_chilexpress_caido(self):
+        """Con un snapshot vencido y la API caída se sigue respondiendo"""
+        from datetime import timedelta
+        from unittest import mock
+        from django.utils import timezone
+        from .chilexpress import regiones_cacheadas
+        from .models import GeografiaChilexpress
+
+        GeografiaChilexpress.objects.create(
+            clave='regiones',
+            datos=[{'regionId': 'RM', 'regionName': 'Metropolitana'}],
+            actualizado=timezone.now() - timedelta(days=365),
+        )
+        with mock.patch('tienda.chilexpress.obtener_regiones', side_effect=Exception('caído')), \
+                mock.patch('tienda.chilexpress.threading.Thread') as hilo:
+            regiones = regiones_cacheadas()
+        self.assertEqual(regiones[0]['regionId'], 'RM')
+        hilo.assert_called_once()  # el dato vencido dispara un refresco en segundo plano
+
+    def test_primera_consulta_guarda_snapshot(self):
+        from unittest import mock
+        from .chilexpress import comunas_cacheadas
+        from .models import GeografiaChilexpress
+
+        GeografiaChilexpress.objects.create(clave='regiones', datos=[{'regionId': 'RM'}])
+        comunas = [{'countyCode': 'STGO', 'countyName': 'Santiago'}]
+        with mock.patch('tienda.chilexpress.obtener_comunas_por_region', return_value=comunas) as api:
+            self.assertEqual(comunas_cacheadas('RM'), comunas)
+            self.assertEqual(comunas_cacheadas('RM'), comunas)
+        api.assert_called_once_with('RM')
+        self.assertTrue(GeografiaChilexpress.objects.filter(clave='comunas:RM').exists())
+
+    def test_region_desconocida_o_vacia_no_crea_snapshot(self):
+        """El endpoint público no consulta la API ni guarda filas para ids inventados o vacíos"""
+        from unittest import mock
+        from .models import GeografiaChilexpress
+
+        GeografiaChilexpress.objects.create(clave='regiones', datos=[{'regionId': 'RM'}, {'regionId': 'R5'}])
+        with mock.patch('tienda.chilexpress.obtener_comunas_por_region', return_value=[]) as api:
+            respuesta = self.client.get('/api/chilexpress/comunas/' + 'X' * 80 + '/')
+            self.assertEqual(respuesta.status_code, 404)
+            api.assert_not_called()
+
+            respuesta = self.client.get('/api/chilexpress/comunas/R5/')
+            self.assertEqual(respuesta.json(), {'success': True, 'comunas': []})
+        api.assert_called_once_with('R5')
+        self.assertEqual(list(GeografiaChilexpress.objects.values_list('clave', flat=True)), ['regiones'])
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class CotizacionesCacheTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+    def _payload(self, peso, destino='STGO'):
+        return {
+            'originCountyCode': 'STGO', 'destinationCountyCode': destino,
+            'package': {'weight': peso, 'height': 9, 'width': 12, 'length': 31},
+            'productType': 3, 'contentType': 1, 'declaredWorth': '45990', 'deliveryTime': 0,
+        }
+
+    def test_paquetes_del_mismo_bucket_comparten_cotizacion(self):
+        from .cotizaciones import cotizar_con_cache, estadisticas_cotizaciones
+
+        llamadas = []
+        def cotizar(normalizado):
+            llamadas.append(normalizado)
+            return [{'descripcion': 'EXPRESS', 'precio': 4500}]
+
+        cotizar_con_cache(self._payload(1.2), cotizar)
+        cotizar_con_cache(self._payload(1.4), cotizar)
+        self.assertEqual(len(llamadas), 1)
+        # Se cotiza el techo del bucket, nunca menos que el paquete real
+        self.assertEqual(llamadas[0]['package'], {'weight': 1.5, 'height': 10, 'width': 15, 'length': 35})
+        self.assertEqual(llamadas[0]['declaredWorth'], '50000')
+        self.assertEqual(estadisticas_cotizaciones()['hits'], 1)
+
+    def test_cotizaciones_concurrentes_llaman_una_vez(self):
+        import threading, time
+        from .cotizaciones import cotizar_con_cache
+
+        llamadas = []
+        def cotizar(normalizado):
+            llamadas.append(1)
+            time.sleep(0.2)
+            return [{'descripcion': 'EXPRESS', 'precio': 4500}]
+
+        resultados = []
+        hilos = [
+            threading.Thread(target=lambda: resultados.append(cotizar_con_cache(self._payload(2), cotizar)))
+            for _ in range(5)
+        ]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        self.assertEqual(len(llamadas), 1)
+        self.assertEqual(len(resultados), 5)
+
+
+class CacheCompartidoTests(TestCase):
+    def test_version_del_carrito_queda_en_la_tabla_de_cache(self):
+        """Sin REDIS_URL la versión vive en la BD, visible para los demás workers"""
+        from django.core.cache import cache
+        from django.db import connection
+        from .envios import version_carrito, invalidar_carrito
+
+        version = version_carrito(41)
+        invalidar_carrito(41)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT cache_key FROM tienda_cache")
+            claves = [fila[0] for fila in cursor.fetchall()]
+        self.assertIn(cache.make_key('carrito:41:version'), claves)
+        self.assertEqual(version_carrito(41), version + 1)
+
+    def test_resumen_ve_los_cambios_hechos_por_otro_worker(self):
+        """El resumen del header se valida contra la versión que otro proceso sube en el cache compartido"""
+        from django.contrib.auth.models import User
+        from django.core.cache import caches
+        from .carrito import resumen
+        from .models import Carrito, CarritoItem, Categoria, Producto
+
+        user = User.objects.create_user('worker', 'w@test.cl', 'x')
+        carrito = Carrito.objects.create(user=user)
+        producto = Producto.objects.create(
+            nombre='Filtro', precio=5000, descripcion='-', stock=10, peso='0.5', largo=10, ancho=10, alto=10,
+            categoria=Categoria.objects.create(nombre='Filtros'),
+        )
+        self.assertEqual(resumen(user)['unidades'], 0)
+
+        # Otro worker agrega el producto: escribe la fila y sube la versión con su propia conexión al cache
+        CarritoItem.objects.bulk_create([CarritoItem(carrito=carrito, producto=producto, cantidad=2, precio=5000)])
+        otro_worker = caches.create_connection('default')
+        otro_worker.incr(f'carrito:{carrito.id}:version')
+
+        self.assertEqual((resumen(user)['unidades'], resumen(user)['subtotal']), (2, 10000))
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class PerfilEnvioTests(TestCase):
+    def setUp(self):
+        from django.contrib.auth.models import User
+        from django.core.cache import cache
+        from .models import Carrito, Categoria, Producto
+        cache.clear()
+        categoria = Categoria.objects.create(nombre='Frenos')
+        self.pastilla = Producto.objects.create(
+            nombre='Pastilla', precio=20000, descripcion='-', stock=10, categoria=categoria,
+            peso='0.80', largo=20, ancho=12, alto=6,
+        )
+        self.disco = Producto.objects.create(
+            nombre='Disco', precio=35000, descripcion='-', stock=10, categoria=categoria,
+            peso='3.50', largo=30, ancho=30, alto=8,
+        )
+        self.carrito = Carrito.objects.create(user=User.objects.create_user('cliente', 'c@test.cl', 'x'))
+
+    def test_perfil_se_memoiza_e_invalida_al_cambiar_items(self):
+        from .envios import perfil_envio
+        from .models import CarritoItem
+
+        CarritoItem.objects.create(carrito=self.carrito, producto=self.pastilla, cantidad=2, precio=20000)
+        perfil = perfil_envio(self.carrito)
+        self.assertEqual([p['caja'] for p in perfil['paquetes']], ['S'])
+        self.assertEqual((perfil['peso_total'], perfil['largo'], perfil['ancho'], perfil['alto']), (1.8, 30, 20, 15))
+
+        with self.assertNumQueries(0):
+            perfil_envio(self.carrito)
+
+        CarritoItem.objects.create(carrito=self.carrito, producto=self.disco, cantidad=1, precio=35000)
+        perfil = perfil_envio(self.carrito)
+        self.assertEqual([p['caja'] for p in perfil['paquetes']], ['M'])
+        self.assertEqual(perfil['peso_total'], 5.45)
+        self.assertEqual(perfil['subtotal'], 75000)
+
+
+class EmpaqueTests(TestCase):
+    def test_productos_chicos_no_arman_un_paquete_largo(self):
+        """Diez filtros van en cajas estándar en vez de un paquete de 150 cm"""
+        from .empaque import planificar_empaque, LARGO_MAXIMO_CM
+
+        paquetes = planificar_empaque([(10, 0.3, 15, 8, 8)])
+        self.assertEqual(sum(p['unidades'] for p in paquetes), 10)
+        self.assertTrue(all(p['largo'] <= LARGO_MAXIMO_CM for p in paquetes))
+        # Dos cajas S salen más baratas que una caja M con todo
+        self.assertEqual([p['caja'] for p in paquetes], ['S', 'S'])
+
+    def test_producto_fuera_de_medida_viaja_solo(self):
+        from .empaque import planificar_empaque
+
+        paquetes = planificar_empaque([(1, 12, 120, 20, 20), (2, 0.5, 10, 10, 5)])
+        sueltos = [p for p in paquetes if p['caja'] is None]
+        self.assertEqual(len(sueltos), 1)
+        self.assertEqual(sueltos[0]['largo'], 120)
+
+    def test_producto_sin_peso_o_medidas_no_se_planifica(self):
+        from .empaque import planificar_empaque, DimensionesInvalidas
+        from .envios import calcular_perfil
+
+        with self.assertRaises(DimensionesInvalidas):
+            planificar_empaque([(1, 0, 0, 0, 0)])
+        perfil = calcular_perfil([(1, 1000, 0.5, 10, 10, 5), (1, 1000, 1, 10, 0, 5)])
+        self.assertEqual((perfil['paquetes'], perfil['valido']), ([], False))
+
+    def test_ot_lleva_una_pieza_por_paquete_cotizado(self):
+        from unittest import mock
+        from .chilexpress import generar_envio_chilexpress
+        from .models import Pedido
+
+        paquetes = [
+            {'caja': 'S', 'largo': 30, 'ancho': 20, 'alto': 15, 'peso': 2.2, 'unidades': 4},
+            {'caja': 'XS', 'largo': 20, 'ancho': 15, 'alto': 10, 'peso': 0.9, 'unidades': 1},
+        ]
+        pedido = Pedido.objects.create(
+            order_id='OT2PAQ', email='c@test.cl', monto=1000, envio_domicilio=True,
+            codigo_comuna_chilexpress='13101', peso_total=3.1, largo=30, ancho=20, alto=15, paquetes=paquetes,
+        )
+        respuesta = mock.Mock(status_code=201)
+        respuesta.json.return_value = {'data': {'detail': [{'transportOrderNumber': 99, 'labelUrl': 'x'}]}}
+        with mock.patch('tienda.chilexpress.MODO_SIMULACION', False), \
+                mock.patch('tienda.chilexpress.obtener_cliente') as cliente:
+            cliente.return_value.post.return_value = respuesta
+            self.assertEqual(generar_envio_chilexpress(pedido)['transport_order_number'], '99')
+        piezas = cliente.return_value.post.call_args.kwargs['json']['packages']
+        self.assertEqual(piezas, [
+            {'weight': 2.2, 'length': 30, 'width': 20, 'height': 15},
+            {'weight': 0.9, 'length': 20, 'width': 15, 'height': 10},
+        ])
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class CotizacionLoteTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+    def test_lote_en_paralelo_con_resultados_parciales(self):
+        """El lote demora lo que la cotización más lenta y reporta los errores por destino"""
+        import time
+        from unittest import mock
+        from .chilexpress import cotizar_destinos
+        from .envios import calcular_perfil
+
+        def cotizar(payload):
+            time.sleep(0.3)
+            if payload['destinationCountyCode'] == 'XXXX':
+                raise Exception('Comuna inválida')
+            return [{'descripcion': 'EXPRESS', 'precio': 5000}]
+
+        perfil = calcular_perfil([(1, 20000, 1, 20, 10, 5)])
+        inicio = time.monotonic()
+        with mock.patch('tienda.chilexpress.cotizar_tarifas', side_effect=cotizar):
+            resultados = cotizar_destinos(perfil, ['STGO', 'PROV', 'XXXX', 'LCON'], 20000)
+        self.assertLess(time.monotonic() - inicio, 0.9)
+        self.assertEqual([r['success'] for r in resultados], [True, True, False, True])
+        self.assertEqual(resultados[2]['error'], 'Comuna inválida')
+
+
+class DespachoLoteTests(TestCase):
+    def setUp(self):
+        import tempfile
+        from django.test import override_settings
+        from .models import Pedido
+        self.media = tempfile.TemporaryDirectory()
+        self.override = override_settings(MEDIA_ROOT=self.media.name)
+        self.override.enable()
+        for i in range(3):
+            Pedido.objects.create(
+                order_id=f'DESP{i}', email=f'c{i}@test.cl', monto=10000, estado='preparacion',
+                envio_domicilio=True, direccion='Calle 1', comuna='Santiago', region='RM',
+                codigo_comuna_chilexpress='STGO', peso_total=1.5, largo=30, ancho=20, alto=15,
+            )
+        Pedido.objects.filter(order_id='DESP2').update(codigo_comuna_chilexpress=None)
+
+    def tearDown(self):
+        self.override.disable()
+        self.media.cleanup()
+
+    def test_genera_ots_y_un_pdf_de_etiquetas(self):
+        from .despacho import despachar_lote
+        from .models import Pedido
+        from .pdf_storage import ruta_absoluta
+
+        resultado = despachar_lote(max_por_segundo=0)
+        self.assertEqual(resultado['generados'], 2)
+        self.assertEqual([e['order_id'] for e in resultado['errores']], ['DESP2'])
+        self.assertEqual(Pedido.objects.filter(estado_envio='generado').exclude(ot_codigo=None).count(), 2)
+        with open(ruta_absoluta(resultado['etiquetas']['pdf_path']), 'rb') as pdf:
+            self.assertEqual(pdf.read().count(b'/Type /Page\n'), 2)
+
+        # El pedido que falló quedó liberado y se puede reintentar
+        self.assertIsNone(Pedido.objects.get(order_id='DESP2').estado_envio)
+
+    def test_pedidos_reclamados_por_otra_corrida_no_se_vuelven_a_generar(self):
+        from unittest import mock
+        from .despacho import generar_ots_lote, pedidos_por_despachar
+        from .models import Pedido
+
+        pedidos = list(pedidos_por_despachar())
+        # Otra corrida reclamó DESP0 después de que esta leyera la lista
+        Pedido.objects.filter(order_id='DESP0').update(estado_envio='generando:otra')
+        with mock.patch('tienda.despacho.generar_envio_chilexpress',
+                        return_value={'transport_order_number': 'OT1', 'label_url': None}) as generar:
+            resultado = generar_ots_lote(pedidos, max_por_segundo=0)
+        self.assertEqual(sorted(p.order_id for p in resultado['generados']), ['DESP1', 'DESP2'])
+        self.assertEqual(generar.call_count, 2)
+        self.assertEqual(Pedido.objects.get(order_id='DESP0').estado_envio, 'generando:otra')
+        self.assertEqual([p.order_id for p in pedidos_por_despachar()], [])
+
+    def test_ot_sin_numero_falla_y_reclamo_vencido_se_libera(self):
+        import time
+        from unittest import mock
+        from .despacho import despachar_lote, pedidos_por_despachar
+        from .models import Pedido
+
+        # DESP0 quedó reclamado por una corrida que murió hace una hora; DESP1 por una en curso
+        ahora = int(time.time())
+        Pedido.objects.filter(order_id='DESP0').update(estado_envio=f'generando:{ahora - 3600:010d}:x')
+        Pedido.objects.filter(order_id='DESP1').update(estado_envio=f'generando:{ahora:010d}:y')
+        self.assertEqual([p.order_id for p in pedidos_por_despachar()], ['DESP2'])
+
+        with mock.patch('tienda.despacho.generar_envio_chilexpress',
+                        return_value={'transport_order_number': '', 'label_url': None}):
+            resultado = despachar_lote(max_por_segundo=0)
+        self.assertEqual(resultado['generados'], 0)
+        self.assertEqual(sorted(e['order_id'] for e in resultado['errores']), ['DESP0', 'DESP2'])
+        self.assertEqual(
+            dict(Pedido.objects.values_list('order_id', 'estado_envio')),
+            {'DESP0': None, 'DESP1': f'generando:{ahora:010d}:y', 'DESP2': None},
+        )
+
+
+class SeguimientoTests(TestCase):
+    def setUp(self):
+        from unittest import mock
+        patcher = mock.patch('tienda.chilexpress.MODO_SIMULACION', False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_solo_se_escriben_los_pedidos_que_cambian(self):
+        from unittest import mock
+        from .models import Pedido
+        from .seguimiento import actualizar_tracking
+
+        estados = {'OT1': 'EN TRANSITO', 'OT2': 'ENTREGADO', 'OT3': 'EN TRANSITO', 'OT4': 'CAIDO'}
+        for i, (ot, _) in enumerate(estados.items()):
+            Pedido.objects.create(
+                order_id=f'TRK{i}', email='c@test.cl', monto=1000, estado='preparacion',
+                envio_domicilio=True, ot_codigo=ot, estado_envio='generado',
+            )
+        Pedido.objects.filter(ot_codigo='OT3').update(estado='enviado', estado_envio='en_transito')
+
+        def consultar(ot, referencia):
+            if estados[ot] == 'CAIDO':
+                raise Exception('timeout')
+            return estados[ot]
+
+        with mock.patch('tienda.seguimiento.consultar_tracking', side_effect=consultar):
+            resumen = actualizar_tracking(tamano_lote=2, max_por_segundo=0)
+
+        self.assertEqual(resumen, {'consultados': 4, 'actualizados': 2, 'errores': 1})
+        estado = dict(Pedido.objects.values_list('ot_codigo', 'estado'))
+        self.assertEqual(estado, {'OT1': 'enviado', 'OT2': 'retirado', 'OT3': 'enviado', 'OT4': 'preparacion'})
+
+    def test_cancelacion_durante_el_poll_no_se_pisa(self):
+        from unittest import mock
+        from .models import Pedido
+        from .seguimiento import actualizar_tracking, aplicar_tracking
+
+        pedido = Pedido.objects.create(
+            order_id='TRKC', email='c@test.cl', monto=1000, estado='preparacion',
+            envio_domicilio=True, ot_codigo='OTC', estado_envio='generado',
+        )
+
+        def aplicar(pedido_leido, descripcion):
+            # Bodega cancela el pedido mientras el poller esperaba a Chilexpress
+            Pedido.objects.filter(pk=pedido.pk).update(estado='cancelado')
+            return aplicar_tracking(pedido_leido, descripcion)
+
+        with mock.patch('tienda.seguimiento.consultar_tracking', return_value='EN TRANSITO'), \
+                mock.patch('tienda.seguimiento.aplicar_tracking', side_effect=aplicar):
+            actualizar_tracking(max_por_segundo=0)
+
+        pedido.refresh_from_db()
+        self.assertEqual((pedido.estado, pedido.estado_envio), ('cancelado', 'en_transito'))
+
+    def test_en_simulacion_no_se_toca_ningun_pedido(self):
+        """El tracking simulado dice 'EN TRANSITO' para todo: no debe marcar pedidos como enviados"""
+        from unittest import mock
+        from .models import Pedido
+        from .seguimiento import actualizar_tracking
+
+        pedido = Pedido.objects.create(
+            order_id='TRKS', email='c@test.cl', monto=1000, estado='preparacion',
+            envio_domicilio=True, ot_codigo='OTS', estado_envio='generado',
+        )
+        with mock.patch('tienda.chilexpress.MODO_SIMULACION', True), \
+                mock.patch('tienda.seguimiento.consultar_tracking') as consultar:
+            resumen = actualizar_tracking(max_por_segundo=0)
+
+        consultar.assert_not_called()
+        self.assertEqual(resumen, {'consultados': 0, 'actualizados': 0, 'errores': 0})
+        pedido.refresh_from_db()
+        self.assertEqual((pedido.estado, pedido.estado_envio), ('preparacion', 'generado'))
+
+
+class UpstreamsFalsosTests(TestCase):
+    def setUp(self):
+        from .upstreams_falsos import iniciar_en_hilo
+        self.servidor = iniciar_en_hilo(semilla=1)
+        self.addCleanup(self.servidor.server_close)
+        self.addCleanup(self.servidor.shutdown)
+
+    def test_checkout_completo_sin_red(self):
+        from transbank.webpay.webpay_plus.transaction import Transaction, WebpayOptions
+        from transbank.common.integration_type import IntegrationType
+        from .chilexpress import cotizar_tarifas, obtener_regiones, _datos_rating
+        from .upstreams_falsos import apuntar_a
+
+        with apuntar_a(self.servidor):
+            self.assertTrue(obtener_regiones())
+            datos = _datos_rating({'peso': 2, 'largo': 30, 'ancho': 20, 'alto': 10}, 'PROV', 10000)
+            self.assertEqual(len(cotizar_tarifas(datos)), 2)
+
+            tx = Transaction(WebpayOptions('597055555532', 'clave', IntegrationType.TEST))
+            creada = tx.create('ORD1', 'sesion', 10000, 'http://testserver/confirmar/')
+            resultado = tx.commit(creada['token'])
+
+        self.assertEqual(resultado['status'], 'AUTHORIZED')
+        self.assertEqual(resultado['amount'], 10000)
+
+    def test_tasa_error_responde_503(self):
+        import requests
+        self.servidor.tasa_error = 1.0
+        response = requests.get(f"{self.servidor.url}/chilexpress/georeference/api/v1.0/regions", timeout=5)
+        self.assertEqual(response.status_code, 503)
+
+
+@override_settings(CARAPI_TOKEN='token', CARAPI_SECRET='secreto')
+class CarAPIClientTests(TestCase):
+    def setUp(self):
+        from .upstreams_falsos import iniciar_en_hilo, apuntar_a
+        servidor = iniciar_en_hilo()
+        self.addCleanup(servidor.server_close)
+        self.addCleanup(servidor.shutdown)
+        contexto = apuntar_a(servidor)
+        contexto.__enter__()
+        self.addCleanup(contexto.__exit__, None, None, None)
+
+    def test_crear_el_cliente_no_hace_login(self):
+        from unittest import mock
+        from .car_api import CarAPIClient
+        with mock.patch('tienda.http_client.ClienteHTTP.request') as peticion:
+            CarAPIClient()
+        peticion.assert_not_called()
+
+    def test_login_unico_con_hilos_concurrentes_y_renovacion_antes_de_vencer(self):
+        import time
+        from concurrent.futures import ThreadPoolExecutor
+        from unittest import mock
+        from .car_api import CarAPIClient, expiracion_jwt
+
+        cliente = CarAPIClient()
+        with mock.patch.object(cliente, '_login', wraps=cliente._login) as login:
+            with ThreadPoolExecutor(8) as pool:
+                respuestas = list(pool.map(lambda _: cliente._make_request('makes'), range(8)))
+            self.assertEqual(login.call_count, 1)
+            self.assertTrue(all(respuesta['data'] for respuesta in respuestas))
+            self.assertAlmostEqual(cliente.token_expira, expiracion_jwt(cliente.jwt_token))
+
+            # A 30 s de vencer (dentro del margen) se renueva sin esperar un 401
+            cliente.token_expira = time.time() + 30
+            cliente._make_request('makes')
+            self.assertEqual(login.call_count, 2)
+
+
+class SincronizacionVehiculosTests(TestCase):
+    def setUp(self):
+        from .upstreams_falsos import iniciar_en_hilo, apuntar_a
+        servidor = iniciar_en_hilo()
+        self.addCleanup(servidor.server_close)
+        self.addCleanup(servidor.shutdown)
+        contexto = apuntar_a(servidor)
+        contexto.__enter__()
+        self.addCleanup(contexto.__exit__, None, None, None)
+
+    def test_upsert_incremental_y_vistas_locales(self):
+        from .car_api import CarAPIClient
+        from .models import ModeloVehiculo
+        from .upstreams_falsos import MARCAS, MODELOS_POR_MARCA
+        from .vehiculos import sincronizar_carapi
+
+        cliente = CarAPIClient()
+        primera = sincronizar_carapi(cliente)
+        self.assertEqual(primera['marcas_creadas'], len(MARCAS))
+        self.assertEqual(primera['modelos_creados'], len(MARCAS) * MODELOS_POR_MARCA)
+
+        # Sin cambios en CarAPI no se escribe nada; un rango recortado se corrige
+        ModeloVehiculo.objects.filter(marca_vehiculo__nombre='Toyota', nombre='Modelo 3').update(año_inicio=2020)
+        segunda = sincronizar_carapi(cliente)
+        self.assertEqual(segunda, {
+            'marcas_creadas': 0, 'marcas_actualizadas': 0, 'modelos_creados': 0, 'modelos_actualizados': 1,
+        })
+
+        with self.settings(VEHICULOS_FUENTE='local'):
+            marcas = self.client.get('/api/marcas-vehiculos/').json()
+            modelos = self.client.get('/api/modelos-vehiculos/', {'marca': 'toyota'}).json()
+        self.assertEqual(sorted(marca['nombre'] for marca in marcas), sorted(MARCAS))
+        self.assertEqual(len(modelos), MODELOS_POR_MARCA)
+        modelo = next(modelo for modelo in modelos if modelo['nombre'] == 'Modelo 3')
+        self.assertEqual((modelo['año_inicio'], modelo['año_fin'], modelo['marca_nombre']), (2013, 2013, 'Toyota'))
+
+    def test_el_comando_invalida_las_listas_en_el_cache_compartido(self):
+        """sincronizar_carapi corre en otro proceso: la versión tiene que quedar en el cache compartido"""
+        from django.core.cache import cache
+        from io import StringIO
+        from django.core.management import call_command
+        from django.db import connection
+        from .upstreams_falsos import MARCAS
+        from .vehiculos import marcas_locales, version_catalogo, CLAVE_VERSION
+
+        self.assertEqual(marcas_locales(), [])
+        version = version_catalogo()
+        call_command('sincronizar_carapi', stdout=StringIO())
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT cache_key FROM tienda_cache")
+            self.assertIn(cache.make_key(CLAVE_VERSION), [fila[0] for fila in cursor.fetchall()])
+        self.assertGreater(version_catalogo(), version)
+        self.assertEqual(len(marcas_locales()), len(MARCAS))
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class AutocompletarVehiculosTests(TestCase):
+    def setUp(self):
+        from .models import MarcaVehiculo, ModeloVehiculo
+        self.peugeot = MarcaVehiculo.objects.create(nombre='Peugeot')
+        ModeloVehiculo.objects.create(marca_vehiculo=self.peugeot, nombre='208', año_inicio=2012, año_fin=2019)
+        ModeloVehiculo.objects.create(marca_vehiculo=self.peugeot, nombre='2008', año_inicio=2014)
+        citroen = MarcaVehiculo.objects.create(nombre='Citroën')
+        ModeloVehiculo.objects.create(marca_vehiculo=citroen, nombre='C3', año_inicio=2010)
+
+    def test_prefijos_sin_tildes_y_por_año(self):
+        from .indice_vehiculos import autocompletar
+        self.assertEqual([r['texto'] for r in autocompletar('CITRO')], ['Citroën', 'Citroën C3'])
+        self.assertEqual([r['modelo'] for r in autocompletar('peugeot 20')], ['2008', '208'])
+        self.assertEqual([r['modelo'] for r in autocompletar('peugeot 20 2021')], ['2008'])
+
+    def test_se_reconstruye_al_cambiar_el_catalogo_y_luego_no_consulta_la_bd(self):
+        from .indice_vehiculos import autocompletar
+        from .models import ModeloVehiculo
+        autocompletar('pe')
+        ModeloVehiculo.objects.create(marca_vehiculo=self.peugeot, nombre='Partner', año_inicio=2008)
+        self.assertIn('Partner', [r['modelo'] for r in autocompletar('peugeot pa')])
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/vehiculos/autocompletar/', {'q': 'peugeot p'})
+        self.assertEqual(response.json()['resultados'][0]['texto'], 'Peugeot Partner')
+
+    def test_ve_cambios_de_otro_proceso_en_la_siguiente_revision(self):
+        """Un bulk_create (sin señales, como el de otro proceso) aparece al revisar la huella de la BD"""
+        from unittest import mock
+        from . import indice_vehiculos
+        from .indice_vehiculos import autocompletar
+        from .models import ModeloVehiculo
+
+        autocompletar('pe')
+        ModeloVehiculo.objects.bulk_create([ModeloVehiculo(marca_vehiculo=self.peugeot, nombre='Rifter', año_inicio=2018)])
+        self.assertEqual(autocompletar('peugeot r'), [])  # entre revisiones se responde de memoria
+
+        with mock.patch.object(indice_vehiculos, 'REVISION_SEGUNDOS', 0):
+            self.assertEqual([r['modelo'] for r in autocompletar('peugeot r')], ['Rifter'])
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class CompatibilidadesSerializerTests(TestCase):
+    def setUp(self):
+        from .models import Categoria, Producto
+        self.producto = Producto.objects.create(
+            nombre='Filtro', precio=5000, descripcion='-', stock=10, peso='0.5', largo=10, ancho=10, alto=10,
+            categoria=Categoria.objects.create(nombre='Filtros'),
+        )
+
+    def _guardar(self, compatibilidades):
+        from .serializers import ProductoSerializer
+        ProductoSerializer(context={'compatibilidades': compatibilidades})._save_compatibilidades(
+            self.producto, compatibilidades
+        )
+
+    def test_guardado_por_diferencias_en_consultas_constantes(self):
+        from .models import CompatibilidadVehiculo, ModeloVehiculo
+        filas = [
+            {'marca_nombre': f'Marca {i % 10}', 'modelo_nombre': f'Modelo {i}', 'año_desde': 2010, 'año_hasta': 2015}
+            for i in range(300)
+        ]
+        with self.assertNumQueries(14):
+            self._guardar(filas)
+        self.assertEqual(CompatibilidadVehiculo.objects.filter(producto=self.producto).count(), 300)
+        self.assertEqual(ModeloVehiculo.objects.count(), 300)
+
+        originales = set(CompatibilidadVehiculo.objects.values_list('id', flat=True))
+        filas[0] = dict(filas[0], año_hasta=2018)
+        filas[1] = dict(filas[1], notas='Solo versión diésel')
+        self._guardar(filas)
+
+        compatibilidades = CompatibilidadVehiculo.objects.filter(producto=self.producto)
+        self.assertEqual(compatibilidades.count(), 300)
+        # Solo la fila cuyo rango cambió se reemplaza; el resto conserva su id
+        self.assertEqual(len(originales - set(compatibilidades.values_list('id', flat=True))), 1)
+        self.assertEqual(compatibilidades.get(modelo_vehiculo__nombre='Modelo 1').notas, 'Solo versión diésel')
+
+        self._guardar([{'todas': True}])
+        self.assertEqual(list(compatibilidades.values_list('todas', flat=True)), [True])
+
+
+class ImportacionProductosTests(TestCase):
+    CSV = (
+        "SKU;Nombre;Precio;Stock;Categoría;Peso;Largo;Ancho;Alto;Marcas;Compatibilidades\n"
+        "F-1;Filtro aceite;12.990;5;Filtros;0,4;10;10;12;Bosch|Mann;Toyota:Corolla:2010-2015\n"
+        "F-2;Filtro aire;8990;3;filtros;0.3;25;20;5;Bosch;\n"
+        "F-3;Sin categoría;1000;1;Motor;1;1;1;1;;\n"
+        "F-1;Repetido;1000;1;Filtros;1;1;1;1;;\n"
+        "\n"
+        "F-4;Precio malo;abc;1;Filtros;1;1;1;1;;Toyota\n"
+    )
+
+    def setUp(self):
+        from .models import Categoria
+        Categoria.objects.create(nombre='Filtros')
+
+    def _importar(self, contenido, **opciones):
+        import io
+        from .importacion import importar_productos
+        return importar_productos(io.BytesIO(contenido.encode('utf-8')), 'lista.csv', **opciones)
+
+    def test_importa_validando_por_fila_y_actualiza_por_sku(self):
+        from .models import Producto
+        resumen = self._importar(self.CSV)
+        self.assertEqual((resumen['filas'], resumen['creados'], resumen['actualizados']), (5, 2, 0))
+        self.assertEqual([(e['fila'], e['sku']) for e in resumen['errores']], [(4, 'F-3'), (5, 'F-1'), (7, 'F-4')])
+        self.assertIn('compatibilidades', resumen['errores'][2]['errores'][-1])
+
+        filtro = Producto.objects.get(sku='F-1')
+        self.assertEqual((filtro.precio, filtro.precio_mayorista, str(filtro.peso)), (12990, 12990, '0.40'))
+        self.assertEqual(sorted(filtro.marca.values_list('nombre', flat=True)), ['Bosch', 'Mann'])
+        self.assertEqual(filtro.compatibilidades.get().modelo_vehiculo.nombre, 'Corolla')
+
+        resumen = self._importar("sku,nombre,precio,stock,categoria,peso,largo,ancho,alto\nF-1,Filtro aceite,13990,8,Filtros,0.4,10,10,12\n")
+        self.assertEqual((resumen['creados'], resumen['actualizados']), (0, 1))
+        filtro.refresh_from_db()
+        self.assertEqual((filtro.precio, filtro.stock, filtro.marca.count()), (13990, 8, 2))
+
+    def test_endpoint_solo_personal_y_modo_validar(self):
+        from django.contrib.auth.models import User
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from .models import Producto
+        url = '/api/productos/importar/'
+
+        self.client.force_login(User.objects.create_user('cliente', 'c@test.cl', 'x'))
+        archivo = SimpleUploadedFile('lista.csv', self.CSV.encode('utf-8'))
+        self.assertEqual(self.client.post(url, {'archivo': archivo}).status_code, 403)
+
+        self.client.force_login(User.objects.create_user('admin', 'a@test.cl', 'x', is_staff=True))
+        archivo = SimpleUploadedFile('lista.csv', self.CSV.encode('utf-8'))
+        respuesta = self.client.post(url, {'archivo': archivo, 'validar': '1'}).json()
+        self.assertEqual((respuesta['filas'], respuesta['total_errores']), (5, 3))
+        self.assertFalse(Producto.objects.exists())
+
+
+class AjusteMasivoTests(TestCase):
+    def setUp(self):
+        from .models import Categoria, Marca, Producto
+        frenos = Categoria.objects.create(nombre='Frenos')
+        motor = Categoria.objects.create(nombre='Motor')
+        bosch = Marca.objects.create(nombre='Bosch', descripcion='-')
+        medidas = dict(descripcion='-', stock=5, peso='1.00', largo=10, ancho=10, alto=10)
+        self.pastilla = Producto.objects.create(nombre='Pastilla', precio=10000, categoria=frenos, **medidas)
+        self.disco = Producto.objects.create(nombre='Disco', precio=20990, categoria=frenos, **medidas)
+        self.bujia = Producto.objects.create(nombre='Bujía', precio=3000, categoria=motor, **medidas)
+        self.pastilla.marca.add(bosch)
+        self.bujia.marca.add(bosch)
+
+    def test_reglas_encadenadas_en_un_update_con_auditoria(self):
+        from .models import AjusteMasivo, Producto
+        from .precios import aplicar_ajuste
+
+        reglas = [
+            {'campo': 'precio', 'operacion': 'porcentaje', 'valor': 7, 'filtro': {'categoria': 'frenos'}},
+            {'campo': 'precio_mayorista', 'operacion': 'multiplicar', 'valor': 0.85, 'base': 'precio',
+             'filtro': {'marca': 'Bosch'}, 'redondeo': 10},
+        ]
+        with self.assertNumQueries(5):
+            ajuste = aplicar_ajuste(reglas)
+
+        precios = dict(Producto.objects.values_list('nombre', 'precio'))
+        mayoristas = dict(Producto.objects.values_list('nombre', 'precio_mayorista'))
+        self.assertEqual(precios, {'Pastilla': 10700, 'Disco': 22459, 'Bujía': 3000})
+        self.assertEqual(mayoristas, {'Pastilla': 9100, 'Disco': 1, 'Bujía': 2550})
+        self.assertEqual(AjusteMasivo.objects.get().filas_afectadas, [2, 2])
+        self.assertEqual(ajuste.filas_afectadas, [2, 2])
+
+    def test_simulacion_no_escribe_y_reglas_invalidas_dan_400(self):
+        from django.contrib.auth.models import User
+        from .models import AjusteMasivo
+        self.client.force_login(User.objects.create_user('admin', 'a@test.cl', 'x', is_staff=True))
+        url = '/api/productos/ajuste-masivo/'
+
+        respuesta = self.client.post(url, {'simular': True, 'reglas': [
+            {'campo': 'stock', 'operacion': 'sumar', 'valor': -10, 'filtro': {'ids': [self.pastilla.id]}},
+        ]}, content_type='application/json').json()
+        self.assertEqual(respuesta['simulacion'][0]['muestra'][0]['despues'], 0)
+        self.pastilla.refresh_from_db()
+        self.assertEqual(self.pastilla.stock, 5)
+        self.assertFalse(AjusteMasivo.objects.exists())
+
+        respuesta = self.client.post(url, {'reglas': [{'campo': 'nombre', 'operacion': 'fijar', 'valor': 1}]},
+                                     content_type='application/json')
+        self.assertEqual(respuesta.status_code, 400)
+
+
+class InventarioTests(TestCase):
+    def setUp(self):
+        from .models import Categoria, Producto
+        categoria = Categoria.objects.create(nombre='Frenos')
+        self.producto = Producto.objects.create(
+            nombre='Pastilla', descripcion='-', stock=10, categoria=categoria,
+            peso='1.00', largo=10, ancho=10, alto=10,
+        )
+
+    def test_venta_devolucion_y_conciliacion(self):
+        from .inventario import conciliar, descontar_stock, reponer_pedido
+        from .models import MovimientoStock, Pedido
+
+        # Creado sin pasar por el serializer: el libro no lo conoce hasta conciliar
+        self.assertEqual(conciliar(corregir=True)[0]['diferencia'], 10)
+        self.assertEqual(conciliar(), [])
+
+        pedido = Pedido.objects.create(order_id='ORD1', email='c@test.cl', monto=1000)
+        self.assertTrue(descontar_stock(self.producto, 3, pedido.order_id))
+        self.assertFalse(descontar_stock(self.producto, 50, pedido.order_id))
+        self.assertEqual(self.producto.stock, 7)
+
+        self.assertEqual(reponer_pedido(pedido), 1)
+        self.assertEqual(reponer_pedido(pedido), 0)
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.stock, 10)
+        self.assertEqual(
+            list(MovimientoStock.objects.order_by('id').values_list('tipo', 'cantidad')),
+            [('ajuste', 10), ('venta', -3), ('devolucion', 3)],
+        )
+        self.assertEqual(conciliar(), [])
+
+    def test_stock_en_fecha_lee_snapshot_mas_movimientos(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .inventario import stock_en, tomar_snapshot
+        from .models import MovimientoStock, SnapshotStock
+
+        ahora = timezone.now()
+        dia = lambda n: ahora - timedelta(days=n)
+        for dias, cantidad in ((10, 10), (8, -2), (5, -3), (2, 4)):
+            MovimientoStock.objects.create(producto=self.producto, tipo='ajuste', cantidad=cantidad, fecha=dia(dias))
+
+        self.assertEqual(tomar_snapshot(dia(6)), 1)
+        self.assertEqual(tomar_snapshot(dia(6) + timedelta(hours=1)), 0)  # sin movimientos nuevos
+        # El saldo posterior parte del snapshot, no de los movimientos anteriores
+        SnapshotStock.objects.filter(producto=self.producto).update(stock=100)
+
+        self.assertEqual(stock_en(dia(9))[self.producto.id], 10)
+        self.assertEqual(stock_en(dia(7))[self.producto.id], 8)
+        self.assertEqual(stock_en(dia(6))[self.producto.id], 100)
+        self.assertEqual(stock_en(dia(3))[self.producto.id], 97)
+        self.assertEqual(stock_en(ahora)[self.producto.id], 101)
+
+    def test_ajuste_masivo_e_importacion_quedan_en_el_libro(self):
+        import io
+        from .importacion import importar_productos
+        from .models import MovimientoStock
+        from .precios import aplicar_ajuste
+
+        ajuste = aplicar_ajuste([
+            {'campo': 'stock', 'operacion': 'sumar', 'valor': 5, 'filtro': {'ids': [self.producto.id]}},
+            {'campo': 'precio', 'operacion': 'fijar', 'valor': 990, 'filtro': {'ids': [self.producto.id]}},
+        ])
+        movimiento = MovimientoStock.objects.get()
+        self.assertEqual((movimiento.tipo, movimiento.cantidad), ('ajuste', 5))
+        self.assertEqual(movimiento.referencia, f'ajuste masivo #{ajuste.pk}')
+
+        csv = 'sku,nombre,precio,stock,categoria,peso,largo,ancho,alto\nA-1,Disco,1000,7,Frenos,1,1,1,1\n'
+        importar_productos(io.BytesIO(csv.encode('utf-8')), 'lista.csv')
+        importar_productos(io.BytesIO(csv.replace(',7,', ',4,').encode('utf-8')), 'lista.csv')
+        self.assertEqual(
+            list(MovimientoStock.objects.filter(tipo='importacion').order_by('id').values_list('cantidad', flat=True)),
+            [7, -3],
+        )
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class ReposicionTests(TestCase):
+    def setUp(self):
+        from .models import Categoria, Producto
+        categoria = Categoria.objects.create(nombre='Frenos')
+        medidas = dict(descripcion='-', categoria=categoria, peso='1.00', largo=10, ancho=10, alto=10)
+        self.pastilla = Producto.objects.create(nombre='Pastilla', stock=8, punto_reorden=5, **medidas)
+        self.disco = Producto.objects.create(nombre='Disco', stock=3, punto_reorden=5, **medidas)
+
+    def test_alertas_se_mantienen_con_cada_movimiento(self):
+        from .inventario import descontar_stock, registrar_diferencias, reponer_pedido
+        from .models import AlertaStock, Pedido
+
+        pedido = Pedido.objects.create(order_id='ORD1', email='c@test.cl', monto=1000)
+        with self.assertNumQueries(7):
+            descontar_stock(self.pastilla, 4, pedido.order_id)
+        alerta = AlertaStock.objects.get()
+        self.assertEqual((alerta.producto_id, alerta.stock), (self.pastilla.id, 4))
+
+        # Subir el punto de reorden (stock sin cambios) también se refleja
+        type(self.disco).objects.filter(pk=self.disco.pk).update(punto_reorden=2)
+        registrar_diferencias({self.disco.id: 3}, {self.disco.id: 3}, 'ajuste')
+        self.assertFalse(AlertaStock.objects.filter(producto=self.disco).exists())
+
+        descontar_stock(self.pastilla, 1, pedido.order_id)
+        self.assertEqual(AlertaStock.objects.get().desde, alerta.desde)
+        reponer_pedido(pedido)
+        self.assertFalse(AlertaStock.objects.exists())
+
+    def test_api_bajo_stock_ordena_por_cobertura_con_ventas_cacheadas(self):
+        from django.contrib.auth.models import User
+        from django.core.cache import cache
+        from .models import Pedido, PedidoItem
+        from .reposicion import actualizar_alertas
+
+        cache.clear()
+        self.pastilla.stock = 4
+        self.pastilla.save()
+        actualizar_alertas([self.pastilla.id, self.disco.id])
+        pedido = Pedido.objects.create(order_id='ORD1', email='c@test.cl', monto=1000, estado='pagado')
+        PedidoItem.objects.create(pedido=pedido, producto=self.pastilla, nombre_producto='Pastilla',
+                                  cantidad=60, precio_unitario=1, subtotal=60)
+
+        url = '/api/productos/bajo-stock/'
+        self.client.force_login(User.objects.create_user('cliente', 'c@test.cl', 'x'))
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.client.force_login(User.objects.create_user('admin', 'a@test.cl', 'x', is_staff=True))
+        datos = self.client.get(url).json()
+        self.assertEqual(datos['total'], 2)
+        pastilla, disco = datos['productos']
+        self.assertEqual((pastilla['nombre'], pastilla['venta_diaria'], pastilla['dias_cobertura']), ('Pastilla', 2, 2))
+        self.assertEqual(pastilla['sugerido'], 2 * 14 - 4)
+        self.assertEqual((disco['dias_cobertura'], disco['sugerido']), (None, 2))
+
+        with self.assertNumQueries(4):  # sesión, usuario, perfil y alertas: las ventas salen de la cache
+            self.client.get(url)
+
+
+@override_settings(CACHES=CACHE_LOCAL)
+class CarritoTests(TestCase):
+    def setUp(self):
+        from django.contrib.auth.models import User
+        from .models import Categoria, Producto
+        categoria = Categoria.objects.create(nombre='Frenos')
+        self.producto = Producto.objects.create(
+            nombre='Pastilla', descripcion='-', precio=1000, stock=2, categoria=categoria,
+            peso='1.00', largo=10, ancho=10, alto=10,
+        )
+        self.user = User.objects.create_user('cliente', 'c@test.cl', 'x')
+
+    def test_restricciones_de_carrito_activo_e_item_unico(self):
+        from django.db import IntegrityError, transaction
+        from .carrito import carrito_activo
+        from .models import Carrito, CarritoItem
+
+        carrito = carrito_activo(self.user)
+        self.assertEqual(carrito_activo(self.user), carrito)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Carrito.objects.create(user=self.user, is_active=True)
+        Carrito.objects.create(user=self.user, is_active=False)  # los inactivos no cuentan
+
+        CarritoItem.objects.create(carrito=carrito, producto=self.producto)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            CarritoItem.objects.create(carrito=carrito, producto=self.producto)
+
+    def test_upsert_atomico_respeta_stock_e_invalida_version(self):
+        from .carrito import (
+            agregar_item, carrito_activo, disminuir_item, ACTUALIZADO, CREADO, ELIMINADO, SIN_STOCK
+        )
+        from .envios import version_carrito
+        from .models import CarritoItem
+
+        carrito = carrito_activo(self.user)
+        self.assertEqual(agregar_item(carrito.id, self.producto.id, 1, 1000, maximo=2), CREADO)
+        version = version_carrito(carrito.id)
+        with self.assertNumQueries(1):
+            self.assertEqual(agregar_item(carrito.id, self.producto.id, 1, 900, maximo=2), ACTUALIZADO)
+        self.assertEqual(version_carrito(carrito.id), version + 1)
+        self.assertEqual(agregar_item(carrito.id, self.producto.id, 1, 900, maximo=2), SIN_STOCK)
+        item = CarritoItem.objects.get()
+        self.assertEqual((item.cantidad, item.precio), (2, 900))
+
+        self.assertEqual(disminuir_item(carrito.id, self.producto.id), ACTUALIZADO)
+        self.assertEqual(disminuir_item(carrito.id, self.producto.id), ELIMINADO)
+        self.assertFalse(CarritoItem.objects.exists())
+
+    def test_vistas_de_cantidad_usan_el_servicio(self):
+        from .models import CarritoItem
+        self.client.force_login(self.user)
+        url = f'/api/carrito/aumentar/{self.producto.id}/'
+
+        self.assertEqual(self.client.post(url).status_code, 200)
+        self.assertEqual(self.client.post(url).status_code, 200)
+        self.assertEqual(self.client.post(url).status_code, 400)
+        self.assertEqual(CarritoItem.objects.get().cantidad, 2)
+
+        self.client.post(f'/api/carrito/disminuir/{self.producto.id}/')
+        self.assertEqual(CarritoItem.objects.get().cantidad, 1)
+        self.assertEqual(self.client.post(f'/api/carrito/remover/{self.producto.id}/').status_code, 200)
+        self.assertEqual(self.client.post(f'/api/carrito/disminuir/{self.producto.id}/').status_code, 404)
+
+    def test_patch_aplica_el_lote_completo_o_nada(self):
+        from .models import Categoria, CarritoItem, Producto
+        disco = Producto.objects.create(
+            nombre='Disco', descripcion='-', precio=5000, stock=10, categoria=Categoria.objects.get(),
+            peso='1.00', largo=10, ancho=10, alto=10,
+        )
+        self.client.force_login(self.user)
+        self.client.post(f'/api/carrito/aumentar/{self.producto.id}/')
+
+        respuesta = self.client.patch('/api/carrito/', {'operaciones': [
+            {'producto_id': disco.id, 'cantidad': 3},
+            {'producto_id': self.producto.id, 'cantidad': 5},
+        ]}, content_type='application/json')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(respuesta.json()['detalles'], [
+            {'producto_id': self.producto.id, 'error': 'Stock insuficiente', 'disponible': 2},
+        ])
+        self.assertEqual(list(CarritoItem.objects.values_list('producto_id', 'cantidad')), [(self.producto.id, 1)])
+
+        operaciones = [{'producto_id': disco.id, 'cantidad': 3}, {'producto_id': self.producto.id, 'cantidad': 0}]
+        # sesión, usuario, perfil, savepoint, stock, carrito, borrar (2), upsert, release, contenido
+        with self.assertNumQueries(11):
+            datos = self.client.patch('/api/carrito/', {'operaciones': operaciones},
+                                      content_type='application/json').json()
+        self.assertEqual((datos['cantidad_total'], datos['subtotal']), (3, 15000))
+        self.assertEqual([(item['producto_id'], item['cantidad']) for item in datos['carrito']], [(disco.id, 3)])
+
+    def test_resumen_cacheado_se_actualiza_con_cada_mutacion(self):
+        from django.core.cache import cache
+        from django.test import RequestFactory
+        from .carrito import agregar_item, carrito_activo, resumen
+        from .context_processors import carrito_resumen
+
+        cache.clear()
+        with self.assertNumQueries(1):
+            self.assertEqual(resumen(self.user)['unidades'], 0)
+        carrito = carrito_activo(self.user)
+        agregar_item(carrito.id, self.producto.id, 1, 1000)
+        agregar_item(carrito.id, self.producto.id, 1, 1000)
+        self.assertEqual(resumen(self.user)['unidades'], 2)
+
+        request = RequestFactory().get('/')
+        request.user = self.user
+        with self.assertNumQueries(0):
+            datos = carrito_resumen(request)['carrito_resumen']
+            self.assertEqual((datos['items'], datos['unidades'], datos['subtotal'], datos['peso']), (1, 2, 2000, 2.0))
+
+        carrito.is_active = False
+        carrito.save()
+        self.assertEqual(resumen(self.user)['unidades'], 0)
+
+    def test_carrito_de_invitado_en_sesion_sin_filas_en_bd(self):
+        from .models import Carrito, CarritoItem
+
+        respuesta = self.client.post('/carrito/agregar/', {'producto_id': self.producto.id, 'cantidad': 1},
+                                     content_type='application/json')
+        self.assertEqual(respuesta.status_code, 200)
+        respuesta = self.client.post('/carrito/agregar/', {'producto_id': self.producto.id, 'cantidad': 2},
+                                     content_type='application/json')
+        self.assertEqual(respuesta.status_code, 400)  # supera el stock
+
+        datos = self.client.get('/api/carrito/').json()
+        self.assertEqual((datos['cantidad_total'], datos['subtotal']), (1, 1000))
+        self.assertEqual(datos['carrito'][0]['producto_id'], self.producto.id)
+        self.assertEqual(self.client.get('/carrito/contador/').json()['count'], 1)
+
+        datos = self.client.patch('/api/carrito/', {'operaciones': [{'producto_id': self.producto.id, 'cantidad': 2}]},
+                                  content_type='application/json').json()
+        self.assertEqual(datos['cantidad_total'], 2)
+        self.assertEqual(self.client.patch('/api/carrito/', [{'producto_id': self.producto.id, 'cantidad': 3}],
+                                           content_type='application/json').status_code, 400)
+        self.assertFalse(Carrito.objects.exists() or CarritoItem.objects.exists())
+
+    def test_login_fusiona_el_carrito_de_invitado_sin_superar_stock(self):
+        from .carrito import agregar_item, carrito_activo, resumen
+        from .models import CarritoItem
+
+        carrito = carrito_activo(self.user)
+        agregar_item(carrito.id, self.producto.id, 1, 1000)
+        self.client.post('/carrito/agregar/', {'producto_id': self.producto.id, 'cantidad': 2},
+                         content_type='application/json')
+        self.client.patch('/api/carrito/', [{'producto_id': 999999, 'cantidad': 0}],
+                          content_type='application/json')  # producto inexistente: lote rechazado
+        resumen(self.user)
+
+        respuesta = self.client.post('/api/login/', {'usuario': 'c@test.cl', 'contraseña': 'x'},
+                                     content_type='application/json')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(CarritoItem.objects.get(carrito=carrito).cantidad, 2)  # 1 + 2, tope de stock 2
+        self.assertEqual(resumen(self.user)['unidades'], 2)
+        self.assertEqual(self.client.get('/carrito/contador/').json()['count'], 0)  # la sesión quedó vacía
+
+        # Con login() de Django la fusión la hace la señal user_logged_in
+        otro = self.client_class()
+        otro.post('/carrito/agregar/', {'producto_id': self.producto.id, 'cantidad': 1},
+                  content_type='application/json')
+        otro.force_login(self.user)
+        self.assertEqual(otro.get('/api/carrito/').json()['cantidad_total'], 2)
+
+
+class LimpiezaTests(TestCase):
+    def setUp(self):
+        import tempfile
+        from django.contrib.auth.models import User
+        from .models import Categoria, Producto
+        self.media = tempfile.TemporaryDirectory()
+        self.override = override_settings(MEDIA_ROOT=self.media.name)
+        self.override.enable()
+        categoria = Categoria.objects.create(nombre='Frenos')
+        self.producto = Producto.objects.create(
+            nombre='Pastilla', descripcion='-', precio=1000, stock=5, categoria=categoria,
+            peso='1.00', largo=10, ancho=10, alto=10,
+        )
+        self.user = User.objects.create_user('cliente', 'c@test.cl', 'x')
+
+    def tearDown(self):
+        self.override.disable()
+        self.media.cleanup()
+
+    def test_carritos_y_pedidos_se_borran_por_lotes_respetando_retencion(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .limpieza import limpiar
+        from .models import Carrito, CarritoItem, Pedido, PedidoItem, MovimientoStock
+
+        antiguo = timezone.now() - timedelta(days=60)
+        usuarios = [self.user] + [
+            type(self.user).objects.create_user(f'u{i}', f'u{i}@test.cl', 'x') for i in range(3)
+        ]
+        for usuario in usuarios:
+            carrito = Carrito.objects.create(user=usuario, is_active=False)
+            CarritoItem.objects.create(carrito=carrito, producto=self.producto)
+        Carrito.objects.filter(user__in=usuarios[:3]).update(creado=antiguo)
+        activo = Carrito.objects.create(user=self.user, is_active=True)
+        Carrito.objects.filter(pk=activo.pk).update(creado=antiguo)
+
+        for order_id, estado in (('P1', 'pendiente'), ('P2', 'pendiente'), ('P3', 'pagado'), ('P4', 'pendiente')):
+            pedido = Pedido.objects.create(order_id=order_id, email='c@test.cl', monto=1000, estado=estado)
+            PedidoItem.objects.create(pedido=pedido, producto=self.producto, nombre_producto='Pastilla',
+                                      cantidad=1, precio_unitario=1000, subtotal=1000)
+        Pedido.objects.filter(order_id__in=['P1', 'P2', 'P3']).update(fecha=antiguo)
+        MovimientoStock.objects.create(producto=self.producto, tipo='venta', cantidad=-1, referencia='P2')
+
+        self.assertEqual(limpiar(['carritos', 'pedidos'], simular=True, lote=2, pausa=0),
+                         {'carritos': 3, 'pedidos': 1})
+        self.assertEqual(Carrito.objects.count(), 5)
+
+        self.assertEqual(limpiar(['carritos', 'pedidos'], lote=2, pausa=0), {'carritos': 3, 'pedidos': 1})
+        self.assertEqual(set(Carrito.objects.values_list('id', flat=True)),
+                         {activo.id, Carrito.objects.get(user=usuarios[3]).id})
+        self.assertEqual(CarritoItem.objects.count(), 1)
+        self.assertEqual(set(Pedido.objects.values_list('order_id', flat=True)), {'P2', 'P3', 'P4'})
+        self.assertEqual(PedidoItem.objects.count(), 3)
+
+    def test_sesiones_vencidas_y_pdfs_huerfanos(self):
+        import os
+        from datetime import timedelta
+        from io import StringIO
+        from django.contrib.sessions.models import Session
+        from django.core.management import call_command
+        from django.utils import timezone
+        from .models import Pedido, Factura, EmailOutbox
+        from .pdf_storage import guardar_pdf, ruta_absoluta
+
+        ahora = timezone.now()
+        Session.objects.create(session_key='vencida', session_data='', expire_date=ahora - timedelta(days=1))
+        Session.objects.create(session_key='vigente', session_data='', expire_date=ahora + timedelta(days=1))
+
+        pedido = Pedido.objects.create(order_id='CONFACTURA', email='c@test.cl', monto=1000)
+        con_factura = guardar_pdf(b'%PDF factura')
+        Factura.objects.create(pedido=pedido, nombre_cliente='C', email_cliente='c@test.cl',
+                               neto=840, iva=160, total=1000, pdf_sha256=con_factura['sha256'])
+        huerfano = ruta_absoluta(guardar_pdf(b'%PDF huerfano')['pdf_path'])
+        adjunto = ruta_absoluta(guardar_pdf(b'%PDF adjunto')['pdf_path'])
+        EmailOutbox.objects.create(destinatario='c@test.cl', asunto='Comprobante', adjunto_path=adjunto)
+        directorio = os.path.dirname(ruta_absoluta(con_factura['pdf_path'])).rsplit(os.sep, 1)[0]
+        legado_vivo = os.path.join(directorio, 'comprobante_CONFACTURA_20250101_000000.pdf')
+        legado_huerfano = os.path.join(directorio, 'comprobante_NOEXISTE_20250101_000000.pdf')
+        reciente = ruta_absoluta(guardar_pdf(b'%PDF recien generado')['pdf_path'])
+        for ruta in (legado_vivo, legado_huerfano):
+            open(ruta, 'wb').close()
+        viejo = (ahora - timedelta(days=30)).timestamp()
+        for ruta in (ruta_absoluta(con_factura['pdf_path']), huerfano, adjunto, legado_vivo, legado_huerfano):
+            os.utime(ruta, (viejo, viejo))
+
+        salida = StringIO()
+        call_command('limpiar_datos', '--solo', 'sesiones', 'pdfs', '--pausa', '0', stdout=salida)
+        self.assertIn('sesiones: 1 borrados', salida.getvalue())
+        self.assertIn('pdfs: 2 borrados', salida.getvalue())
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['vigente'])
+        self.assertFalse(os.path.exists(huerfano) or os.path.exists(legado_huerfano))
+        for ruta in (ruta_absoluta(con_factura['pdf_path']), adjunto, legado_vivo, reciente):
+            self.assertTrue(os.path.exists(ruta))
@@ -0,0 +1,339 @@
+"""
+Upstreams falsos: Chilexpress, Transbank y CarAPI locales
+=========================================================
+
+Servidor HTTP de la librería estándar que imita las rutas que usa la tienda,
+para correr el checkout completo sin red (pruebas de integración y de carga):
+- /chilexpress/...  georeference (regiones, comunas), rating, OTs y tracking
+- /transbank/...    Webpay Plus: tx.create, tx.commit, tx.status y la página
+                    de pago (redirige de vuelta al return_url con token_ws)
+- /carapi/api/...   login JWT, makes y models/v2 paginados
+
+Latencia, jitter y tasa de errores (503) son configurables, para ver cómo se
+comportan los reintentos, el circuit breaker y los caches bajo carga.
+
+Uso:
+    python manage.py upstreams_falsos --puerto 8099 --latencia 80 --tasa-error 0.02
+
+y en el .env:
+    CHILEXPRESS_BASE_URL=http://127.0.0.1:8099/chilexpress
+    CHILEXPRESS_SIMULACION=False
+    TRANSBANK_BASE_URL=http://127.0.0.1:8099/transbank
+    CARAPI_BASE_URL=http://127.0.0.1:8099/carapi/api
+"""
+
+import re
+import json
+import time
+import uuid
+import base64
+import random
+import logging
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, urlencode
+
+logger = logging.getLogger(__name__)
+
+REGIONES = [
+    {'regionId': 'R13', 'regionName': 'Metropolitana de Santiago', 'ineRegionCode': 13},
+    {'regionId': 'R5', 'regionName': 'Valparaíso', 'ineRegionCode': 5},
+    {'regionId': 'R8', 'regionName': 'Biobío', 'ineRegionCode': 8},
+]
+
+COMUNAS = {
+    'R13': [
+        {'countyCode': 'STGO', 'countyName': 'SANTIAGO CENTRO', 'regionCode': 'R13', 'ineCountyCode': 13101},
+        {'countyCode': 'PROV', 'countyName': 'PROVIDENCIA', 'regionCode': 'R13', 'ineCountyCode': 13123},
+        {'countyCode': 'NUNO', 'countyName': 'ÑUÑOA', 'regionCode': 'R13', 'ineCountyCode': 13120},
+        {'countyCode': 'MAIP', 'countyName': 'MAIPÚ', 'regionCode': 'R13', 'ineCountyCode': 13119},
+    ],
+    'R5': [
+        {'countyCode': 'VALP', 'countyName': 'VALPARAÍSO', 'regionCode': 'R5', 'ineCountyCode': 5101},
+        {'countyCode': 'VINA', 'countyName': 'VIÑA DEL MAR', 'regionCode': 'R5', 'ineCountyCode': 5109},
+    ],
+    'R8': [
+        {'countyCode': 'CONC', 'countyName': 'CONCEPCIÓN', 'regionCode': 'R8', 'ineCountyCode': 8101},
+    ],
+}
+
+MARCAS = ['Chevrolet', 'Ford', 'Hyundai', 'Kia', 'Mazda', 'Nissan', 'Suzuki', 'Toyota']
+MODELOS_POR_MARCA = 12
+
+
+class ServidorFalso(ThreadingHTTPServer):
+    """
+    Servidor multi-hilo con el estado de los upstreams falsos
+
+    Args:
+        direccion: (host, puerto); puerto 0 = uno libre
+        latencia_ms: demora base de cada respuesta
+        jitter_ms: demora aleatoria extra (0..jitter_ms)
+        tasa_error: probabilidad de responder 503
+        semilla: semilla del azar (resultados repetibles)
+    """
+
+    daemon_threads = True
+
+    def __init__(self, direccion, latencia_ms=0, jitter_ms=0, tasa_error=0.0, semilla=None):
+        super().__init__(direccion, ManejadorFalso)
+        self.latencia_ms = latencia_ms
+        self.jitter_ms = jitter_ms
+        self.tasa_error = tasa_error
+        self.azar = random.Random(semilla)
+        self.transacciones = {}
+        self.contador_ot = 100000
+        self.peticiones = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, puerto = self.server_address[:2]
+        return f"http://{host}:{puerto}"
+
+    def demora(self):
+        with self._lock:
+            self.peticiones += 1
+            extra = self.azar.uniform(0, self.jitter_ms) if self.jitter_ms else 0
+            falla = self.tasa_error and self.azar.random() < self.tasa_error
+        return (self.latencia_ms + extra) / 1000, falla
+
+    def siguiente_ot(self):
+        with self._lock:
+            self.contador_ot += 1
+            return self.contador_ot
+
+
+# ================================
+# Rutas
+# ================================
+
+def _regiones(servidor, consulta, cuerpo):
+    return 200, {'regions': REGIONES, 'statusCode': 0, 'statusDescription': 'OK'}
+
+
+def _comunas(servidor, consulta, cuerpo):
+    region = consulta.get('RegionCode', [''])[0]
+    return 200, {'coverageAreas': COMUNAS.get(region, []), 'statusCode': 0}
+
+
+def _tarifas(servidor, consulta, cuerpo):
+    paquete = cuerpo.get('package', {})
+    volumetrico = paquete.get('length', 0) * paquete.get('width', 0) * paquete.get('height', 0) / 4000
+    kilos = max(float(paquete.get('weight', 0)), volumetrico, 1)
+    base = 3200 + int(kilos * 650)
+    return 200, {'data': {'courierServiceOptions': [
+        {'serviceTypeCode': 3, 'serviceDescription': 'DIA HABIL SIGUIENTE', 'serviceValue': str(base)},
+        {'serviceTypeCode': 2, 'serviceDescription': 'PRIORITARIO', 'serviceValue': str(int(base * 1.4))},
+    ]}, 'statusCode': 0}
+
+
+def _crear_ot(servidor, consulta, cuerpo):
+    ot = servidor.siguiente_ot()
+    return 201, {'data': {'detail': [{
+        'transportOrderNumber': ot,
+        'reference': cuerpo.get('reference'),
+        'labelUrl': f"{servidor.url}/chilexpress/etiquetas/{ot}.pdf",
+    }]}, 'statusCode': 0}
+
+
+def _tracking(servidor, consulta, cuerpo):
+    estado = servidor.azar.choice(['EN TRANSITO', 'EN REPARTO', 'ENTREGADO'])
+    return 200, {'data': {'transportOrderData': {
+        'transportOrderNumber': cuerpo.get('transportOrderNumber'),
+        'status': estado,
+    }}, 'statusCode': 0}
+
+
+def _tx_crear(servidor, consulta, cuerpo):
+    token = uuid.uuid4().hex
+    servidor.transacciones[token] = {**cuerpo, 'status': 'INITIALIZED'}
+    return 200, {'token': token, 'url': f"{servidor.url}/transbank/webpay/pago"}
+
+
+def _tx_datos(token, transaccion):
+    return {
+        'vci': 'TSY',
+        'amount': int(float(transaccion.get('amount') or 0)),  # el SDK lo envía como texto
+        'status': transaccion['status'],
+        'buy_order': transaccion.get('buy_order'),
+        'session_id': transaccion.get('session_id'),
+        'card_detail': {'card_number': '6623'},
+        'accounting_date': time.strftime('%m%d'),
+        'transaction_date': time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime()),
+        'authorization_code': '1213',
+        'payment_type_code': 'VN',
+        'response_code': 0,
+        'installments_number': 0,
+    }
+
+
+def _tx_confirmar(servidor, consulta, cuerpo, token):
+    transaccion = servidor.transacciones.get(token)
+    if transaccion is None:
+        return 422, {'error_message': 'Invalid value for parameter: token'}
+    transaccion['status'] = 'AUTHORIZED'
+    return 200, _tx_datos(token, transaccion)
+
+
+def _tx_estado(servidor, consulta, cuerpo, token):
+    transaccion = servidor.transacciones.get(token)
+    if transaccion is None:
+        return 422, {'error_message': 'Invalid value for parameter: token'}
+    return 200, _tx_datos(token, transaccion)
+
+
+def _pagina_pago(servidor, consulta, cuerpo):
+    """El 'formulario' de Webpay: aprueba y vuelve al comercio"""
+    token = consulta.get('token_ws', [''])[0]
+    transaccion = servidor.transacciones.get(token)
+    if transaccion is None:
+        return 404, {'error_message': 'token desconocido'}
+    return 302, f"{transaccion.get('return_url')}?{urlencode({'token_ws': token})}"
+
+
+def _jwt_falso():
+    def parte(datos):
+        return base64.urlsafe_b64encode(json.dumps(datos).encode()).rstrip(b'=').decode()
+    return '.'.join([
+        parte({'alg': 'HS256', 'typ': 'JWT'}),
+        parte({'sub': 'autoparts', 'exp': int(time.time()) + 3600}),
+        'firma-falsa',
+    ])
+
+
+def _login(servidor, consulta, cuerpo):
+    return 200, _jwt_falso()
+
+
+def _paginar(filas, consulta):
+    limite = int(consulta.get('limit', ['100'])[0])
+    pagina = int(consulta.get('page', ['1'])[0])
+    inicio = (pagina - 1) * limite
+    siguiente = f"?page={pagina + 1}" if inicio + limite < len(filas) else ''
+    return 200, {
+        'collection': {'count': len(filas), 'pages': -(-len(filas) // limite), 'next': siguiente},
+        'data': filas[inicio:inicio + limite],
+    }
+
+
+def _marcas(servidor, consulta, cuerpo):
+    filas = [{'id': i, 'name': nombre} for i, nombre in enumerate(MARCAS, 1)]
+    return _paginar(filas, consulta)
+
+
+def _modelos(servidor, consulta, cuerpo):
+    marca = consulta.get('make', [None])[0]
+    filtro = consulta.get('json', [None])[0]
+    if filtro:
+        marca = next((f.get('val') for f in json.loads(filtro) if f.get('field') == 'make'), marca)
+    filas = [
+        {'id': i * 100 + j, 'name': f"Modelo {j}", 'make': nombre, 'make_id': i, 'year': 2010 + j}
+        for i, nombre in enumerate(MARCAS, 1) if not marca or marca == nombre
+        for j in range(MODELOS_POR_MARCA)
+    ]
+    return _paginar(filas, consulta)
+
+
+RUTA_WEBPAY = '/transbank/rswebpaytransaction/api/webpay/v1.2/transactions'
+
+RUTAS = [
+    ('GET', r'/chilexpress/georeference/api/v1\.0/regions', _regiones),
+    ('GET', r'/chilexpress/georeference/api/v1\.0/coverage-areas', _comunas),
+    ('POST', r'/chilexpress/rating/api/v1\.0/rates/courier', _tarifas),
+    ('POST', r'/chilexpress/transport-orders/api/v1\.0/transport-orders', _crear_ot),
+    ('POST', r'/chilexpress/transport-orders/api/v1\.0/tracking', _tracking),
+    ('POST', RUTA_WEBPAY + r'/?', _tx_crear),
+    ('PUT', RUTA_WEBPAY + r'/(?P<token>\w+)', _tx_confirmar),
+    ('GET', RUTA_WEBPAY + r'/(?P<token>\w+)', _tx_estado),
+    ('GET', r'/transbank/webpay/pago', _pagina_pago),
+    ('POST', r'/carapi/api/auth/login', _login),
+    ('GET', r'/carapi/api/makes', _marcas),
+    ('GET', r'/carapi/api/models/v2', _modelos),
+]
+RUTAS = [(metodo, re.compile(patron + '$'), funcion) for metodo, patron, funcion in RUTAS]
+
+
+class ManejadorFalso(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, igual que los upstreams reales
+    disable_nagle_algorithm = True  # cabeceras y cuerpo van en escrituras separadas
+
+    def _responder(self):
+        partes = urlsplit(self.path)
+        consulta = parse_qs(partes.query)
+        largo = int(self.headers.get('Content-Length') or 0)
+        crudo = self.rfile.read(largo) if largo else b''
+        try:
+            cuerpo = json.loads(crudo) if crudo else {}
+        except ValueError:
+            cuerpo = {}
+
+        demora, falla = self.server.demora()
+        if demora:
+            time.sleep(demora)
+
+        if falla:
+            estado, datos = 503, {'error_message': 'falla simulada'}
+        else:
+            estado, datos = 404, {'error_message': f'ruta no simulada: {self.command} {partes.path}'}
+            for metodo, patron, funcion in RUTAS:
+                coincidencia = patron.match(partes.path)
+                if metodo == self.command and coincidencia:
+                    estado, datos = funcion(self.server, consulta, cuerpo, **coincidencia.groupdict())
+                    break
+
+        if estado == 302:
+            self.send_response(302)
+            self.send_header('Location', datos)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        if isinstance(datos, str):
+            contenido, tipo = datos.encode(), 'text/plain'
+        else:
+            contenido, tipo = json.dumps(datos).encode(), 'application/json'
+        self.send_response(estado)
+        self.send_header('Content-Type', tipo)
+        self.send_header('Content-Length', str(len(contenido)))
+        self.end_headers()
+        self.wfile.write(contenido)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _responder
+
+    def log_message(self, formato, *args):
+        logger.debug(f"upstream falso: {formato % args}")
+
+
+def iniciar_en_hilo(host='127.0.0.1', puerto=0, **opciones):
+    """Levanta un ServidorFalso en un hilo daemon y lo retorna (detener con .shutdown())"""
+    servidor = ServidorFalso((host, puerto), **opciones)
+    threading.Thread(target=servidor.serve_forever, name='upstreams-falsos', daemon=True).start()
+    return servidor
+
+
+@contextmanager
+def apuntar_a(servidor):
+    """
+    Redirige Chilexpress, Transbank y CarAPI al servidor falso dentro del bloque
+    (para tests y benchmarks; en un deploy se usan las variables de entorno)
+    """
+    from transbank.common.request_service import RequestService
+    from . import chilexpress
+    from .car_api import CarAPIClient
+    from .http_client import instalar_en_transbank
+
+    anteriores = (
+        chilexpress.BASE_URL, chilexpress.MODO_SIMULACION,
+        CarAPIClient.BASE_URL, RequestService.__dict__['host'],
+    )
+    chilexpress.BASE_URL = f"{servidor.url}/chilexpress"
+    chilexpress.MODO_SIMULACION = False
+    CarAPIClient.BASE_URL = f"{servidor.url}/carapi/api"
+    instalar_en_transbank(f"{servidor.url}/transbank")
+    try:
+        yield servidor
+    finally:
+        chilexpress.BASE_URL, chilexpress.MODO_SIMULACION, CarAPIClient.BASE_URL, host = anteriores
+        RequestService.host = host
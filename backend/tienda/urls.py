@@ -37,6 +37,9 @@ urlpatterns=[
     path("crear_pedido/", views.crear_pedido, name="crear_pedido"),
     path("pagar/<str:order_id>/", views.pagar_view, name="pagar_transbank"),
     path('api/productos/mayorista/', ProductoMayoristaAPIView.as_view(), name='api_productos_mayorista'),
+    path('api/productos/importar/', views.importar_productos_archivo, name='api-importar-productos'),
+    path('api/productos/ajuste-masivo/', views.ajuste_masivo_productos, name='api-ajuste-masivo-productos'),
+    path('api/productos/bajo-stock/', views.productos_bajo_stock, name='api-productos-bajo-stock'),
     path('productos/mayorista/', views.productos_mayoristas_page, name='productos_mayorista_page'),
     path('api/categorias/', CategoriasCrudView.as_view(), name='lista_categorias'),
     path('api/categorias/<int:pk>/', CategoriaDetalleAPIView.as_view(), name='detalle_categoria'),
@@ -45,10 +48,13 @@ urlpatterns=[
     path('api/chilexpress/regiones/', obtener_regiones_chilexpress, name='chilexpress-regiones'),
     path('api/chilexpress/comunas/<str:region_id>/', obtener_comunas_chilexpress, name='chilexpress-comunas'),
     path('api/chilexpress/calcular-envio/', calcular_envio_chilexpress, name='chilexpress-calcular'),
+    path('api/chilexpress/cotizar-lote/', views.cotizar_lote_chilexpress, name='chilexpress-cotizar-lote'),
+    path('api/chilexpress/cotizaciones/estadisticas/', views.estadisticas_cotizaciones_chilexpress, name='chilexpress-cotizaciones-estadisticas'),
     
     # APIs para compatibilidad de vehículos
     path('api/marcas-vehiculos/', views.MarcasVehiculosAPIView.as_view(), name='marcas-vehiculos-api'),
     path('api/modelos-vehiculos/', views.ModelosVehiculosAPIView.as_view(), name='modelos-vehiculos-api'),
+    path('api/vehiculos/autocompletar/', views.autocompletar_vehiculos, name='vehiculos-autocompletar'),
     
     # Pagos por Transferencia
     path('pago-transferencia/<str:order_id>/', views.pago_transferencia, name='pago-transferencia'),
@@ -64,9 +70,14 @@ urlpatterns=[
     path('api/dashboard/pedidos/', views.lista_pedidos_dashboard, name='api-dashboard-pedidos'),
     path('api/dashboard/pedidos/<str:order_id>/', views.detalle_pedido_dashboard, name='api-dashboard-detalle-pedido'),
     path('api/dashboard/pedidos/<str:order_id>/estado/', views.actualizar_estado_pedido, name='api-actualizar-estado-pedido'),
+    path('api/dashboard/despacho/generar-ots/', views.generar_ots_despacho, name='api-generar-ots-despacho'),
+    path('despacho/etiquetas/<str:sha256>/pdf/', views.descargar_etiquetas, name='descargar-etiquetas'),
     
     # Manejo de Pagos Rechazados
     path('pago-rechazado/<str:order_id>/', views.pago_rechazado_page, name='pago-rechazado'),
+    
+    # Descarga de comprobantes PDF
+    path('comprobante/<str:order_id>/pdf/', views.descargar_comprobante, name='descargar-comprobante'),
 
     
     # ================================
@@ -0,0 +1,217 @@
+"""
+Catálogo local de marcas y modelos de vehículos
+===============================================
+
+Espejo de CarAPI en MarcaVehiculo / ModeloVehiculo para que los selects de
+vehículos no dependan de la latencia de un tercero:
+- `sincronizar_carapi()` descarga makes y models/v2 y hace upsert en bloque
+  (bulk_create de lo nuevo, bulk_update solo de lo que cambió)
+- Un modelo de CarAPI viene una vez por año; localmente se guarda una fila
+  por (marca, nombre) con el rango año_inicio / año_fin
+- `marcas_locales()` / `modelos_locales()` sirven las vistas desde la BD,
+  cacheados hasta la siguiente sincronización
+
+Con settings.VEHICULOS_FUENTE = 'local' las vistas de marcas y modelos no
+llaman a CarAPI. Sincronizar con: python manage.py sincronizar_carapi
+
+Cualquier cambio (sincronización, admin, poblar_vehiculos) sube la versión
+del catálogo; las listas cacheadas y el índice de autocompletado en memoria
+(indice_vehiculos.py) se reconstruyen al ver una versión nueva. La versión
+vive en el cache compartido (settings.CACHES): los comandos de manage.py
+corren en otro proceso y su cambio tiene que verse en los workers web.
+"""
+
+import time
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import MarcaVehiculo, ModeloVehiculo
+
+logger = logging.getLogger(__name__)
+
+CLAVE_VERSION = 'vehiculos_local:version'
+CACHE_TIMEOUT = 24 * 3600
+
+
+def fuente_vehiculos():
+    """'carapi' (proxy con cache) o 'local' (espejo en BD)"""
+    return getattr(settings, 'VEHICULOS_FUENTE', 'carapi')
+
+
+def version_catalogo():
+    """Versión actual del catálogo de vehículos (sube con cada cambio)"""
+    # Si el cache expulsa la clave se reinicia en un valor nuevo, nunca en uno ya usado
+    return cache.get_or_set(CLAVE_VERSION, time.time_ns, None)
+
+
+def invalidar_cache_vehiculos():
+    """Invalida las listas cacheadas y el índice de autocompletado"""
+    try:
+        cache.incr(CLAVE_VERSION)
+    except ValueError:
+        cache.set(CLAVE_VERSION, time.time_ns(), None)
+
+
+@receiver(post_save, sender=MarcaVehiculo)
+@receiver(post_delete, sender=MarcaVehiculo)
+@receiver(post_save, sender=ModeloVehiculo)
+@receiver(post_delete, sender=ModeloVehiculo)
+def _catalogo_modificado(sender, **kwargs):
+    # bulk_create/bulk_update no emiten señales: sincronizar_carapi invalida al final
+    invalidar_cache_vehiculos()
+
+
+def _rangos_por_modelo(filas):
+    """Agrupa las filas por año de CarAPI en {(marca, nombre): [año_min, año_max]}"""
+    rangos = {}
+    for fila in filas:
+        marca, nombre, año = fila.get('make'), fila.get('name'), fila.get('year')
+        if not marca or not nombre or not año:
+            continue
+        rango = rangos.setdefault((marca, nombre), [año, año])
+        rango[0] = min(rango[0], año)
+        rango[1] = max(rango[1], año)
+    return rangos
+
+
+def _upsert_marcas(marcas_api):
+    """
+    Crea las marcas nuevas y actualiza país / activa de las existentes
+
+    Returns:
+        tuple: ({nombre: MarcaVehiculo}, creadas, actualizadas)
+    """
+    existentes = {marca.nombre: marca for marca in MarcaVehiculo.objects.all()}
+    nuevas, cambiadas = [], []
+    for fila in marcas_api:
+        nombre = (fila.get('name') or '').strip()
+        if not nombre:
+            continue
+        pais = fila.get('country') or None
+        marca = existentes.get(nombre)
+        if marca is None:
+            nuevas.append(MarcaVehiculo(nombre=nombre, pais_origen=pais))
+        elif not marca.activa or (pais and marca.pais_origen != pais):
+            marca.activa = True
+            marca.pais_origen = pais or marca.pais_origen
+            cambiadas.append(marca)
+
+    MarcaVehiculo.objects.bulk_create(nuevas, ignore_conflicts=True)
+    MarcaVehiculo.objects.bulk_update(cambiadas, ['activa', 'pais_origen'])
+    if nuevas:
+        existentes = {marca.nombre: marca for marca in MarcaVehiculo.objects.all()}
+    return existentes, len(nuevas), len(cambiadas)
+
+
+def _upsert_modelos(marcas, rangos):
+    """
+    Crea los modelos nuevos y amplía el rango de años de los existentes
+
+    Returns:
+        tuple: (creados, actualizados)
+    """
+    año_actual = timezone.now().year
+    existentes = {}
+    for modelo in ModeloVehiculo.objects.filter(marca_vehiculo__in=marcas.values()).order_by('año_inicio'):
+        existentes.setdefault((modelo.marca_vehiculo_id, modelo.nombre), modelo)
+
+    nuevos, cambiados = [], []
+    for (nombre_marca, nombre), (desde, hasta) in rangos.items():
+        marca = marcas.get(nombre_marca)
+        if marca is None:
+            continue
+        # Un modelo con el año en curso se considera vigente (año_fin = None)
+        hasta = None if hasta >= año_actual else hasta
+        modelo = existentes.get((marca.id, nombre))
+        if modelo is None:
+            nuevos.append(ModeloVehiculo(marca_vehiculo=marca, nombre=nombre, año_inicio=desde, año_fin=hasta))
+            continue
+
+        inicio = min(modelo.año_inicio, desde)
+        fin = None if hasta is None or modelo.año_fin is None else max(modelo.año_fin, hasta)
+        if (inicio, fin) != (modelo.año_inicio, modelo.año_fin) or not modelo.activo:
+            modelo.año_inicio, modelo.año_fin, modelo.activo = inicio, fin, True
+            cambiados.append(modelo)
+
+    ModeloVehiculo.objects.bulk_create(nuevos, batch_size=500, ignore_conflicts=True)
+    ModeloVehiculo.objects.bulk_update(cambiados, ['año_inicio', 'año_fin', 'activo'], batch_size=500)
+    return len(nuevos), len(cambiados)
+
+
+def sincronizar_carapi(cliente=None, marcas=None):
+    """
+    Copia marcas y modelos de CarAPI a las tablas locales
+
+    Args:
+        cliente: CarAPIClient (por defecto el global)
+        marcas: nombres de marcas a sincronizar (None = todas)
+
+    Returns:
+        dict: {'marcas_creadas', 'marcas_actualizadas', 'modelos_creados', 'modelos_actualizados'}
+    """
+    if cliente is None:
+        from .car_api import car_api_client as cliente
+
+    marcas_api = list(cliente.paginar('makes', {'sort': 'name', 'direction': 'asc'}))
+    if marcas:
+        marcas_api = [fila for fila in marcas_api if fila.get('name') in marcas]
+
+    filas_modelos = []
+    for fila in marcas_api:
+        filas_modelos.extend(cliente.paginar('models/v2', {'make': fila['name'], 'sort': 'name'}))
+    rangos = _rangos_por_modelo(filas_modelos)
+
+    with transaction.atomic():
+        locales, marcas_creadas, marcas_actualizadas = _upsert_marcas(marcas_api)
+        modelos_creados, modelos_actualizados = _upsert_modelos(locales, rangos)
+
+    invalidar_cache_vehiculos()
+    resumen = {
+        'marcas_creadas': marcas_creadas,
+        'marcas_actualizadas': marcas_actualizadas,
+        'modelos_creados': modelos_creados,
+        'modelos_actualizados': modelos_actualizados,
+    }
+    logger.info(f"🚗 CarAPI sincronizado: {resumen}")
+    return resumen
+
+
+def marcas_locales():
+    """Marcas activas con el mismo formato que MarcasVehiculosAPIView"""
+    clave = f'vehiculos_local:{version_catalogo()}:marcas'
+    data = cache.get(clave)
+    if data is None:
+        data = [
+            {'id': marca_id, 'nombre': nombre, 'pais_origen': pais or ''}
+            for marca_id, nombre, pais in MarcaVehiculo.objects.filter(activa=True)
+            .values_list('id', 'nombre', 'pais_origen')
+        ]
+        cache.set(clave, data, CACHE_TIMEOUT)
+    return data
+
+
+def modelos_locales(marca_nombre):
+    """Modelos activos de una marca con el formato de ModelosVehiculosAPIView"""
+    clave = f'vehiculos_local:{version_catalogo()}:modelos:{marca_nombre.lower()}'
+    data = cache.get(clave)
+    if data is None:
+        data = [
+            {
+                'id': modelo_id,
+                'nombre': nombre,
+                'año_inicio': desde,
+                'año_fin': hasta,
+                'marca_nombre': marca,
+            }
+            for modelo_id, nombre, desde, hasta, marca in ModeloVehiculo.objects
+            .filter(activo=True, marca_vehiculo__activa=True, marca_vehiculo__nombre__iexact=marca_nombre)
+            .values_list('id', 'nombre', 'año_inicio', 'año_fin', 'marca_vehiculo__nombre')
+        ]
+        cache.set(clave, data, CACHE_TIMEOUT)
+    return data
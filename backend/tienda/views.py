@@ -17,7 +17,7 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required, user_passes_test
-from django.http import JsonResponse
+from django.http import JsonResponse, Http404
 from django.conf import settings
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
@@ -27,6 +27,16 @@ from transbank.common.integration_type import IntegrationType
 from .models import Pedido, Producto, Vehiculo, Categoria, Carrito, CarritoItem, PerfilUsuario, Factura, PedidoItem
 from .serializers import ProductoSerializer, VehiculoSerializer, CategoriaSerializer, PedidoSerializer
 from django.contrib.auth import logout
+from .http_client import instalar_en_transbank, timeout_de
+from .envios import perfil_envio
+from .indice_vehiculos import autocompletar
+from .inventario import descontar_stock, reponer_pedido
+from .reposicion import total_alertas
+from .carrito import (
+    carrito_activo, agregar_item, disminuir_item, eliminar_item, vaciar, aplicar_operaciones,
+    contenido as contenido_carrito, resumen as resumen_carrito, OperacionInvalida, CREADO, ELIMINADO, NO_ENCONTRADO, SIN_STOCK,
+    contenido_sesion, unidades_sesion, agregar_sesion, aplicar_operaciones_sesion, fusionar_sesion
+)
 from .chilexpress import generar_envio_chilexpress, obtener_regiones, obtener_comunas_por_region, calcular_tarifas_envio
 import requests
 import re, os
@@ -39,8 +49,11 @@ logger = logging.getLogger(__name__)
 
 CommerCode = settings.TRANSBANK_COMMERCE_CODE
 ApiKeySecret = settings.TRANSBANK_API_KEY
-options = WebpayOptions(CommerCode,ApiKeySecret,IntegrationType.TEST)
+instalar_en_transbank()
+options = WebpayOptions(CommerCode,ApiKeySecret,IntegrationType.TEST, timeout=timeout_de('transbank'))
 transaction = Transaction(options)
+
+MAX_DESTINOS_COTIZACION = 20
 # Create your views here.
 
 def lista_productos(request):
@@ -227,6 +240,8 @@ class LoginView(APIView):
         user = authenticate(request, username=email, password=password)
         if user is not None:
             token, created = Token.objects.get_or_create(user=user)
+            # El login por token no pasa por login(): el carrito de invitado se fusiona aquí
+            fusionar_sesion(request.session, user)
             return Response({'token': token.key}, status=status.HTTP_200_OK)
         return Response({'error': 'Usuario o contraseña incorrectos'}, status=status.HTTP_401_UNAUTHORIZED)
     
@@ -349,25 +364,38 @@ def detalle_producto(request, producto_id):
     })
 
 class CarritoView(APIView):
-    permission_classes = [IsAuthenticated]
+    # Los invitados usan el carrito de la sesión, con la misma respuesta
+    permission_classes = [AllowAny]
 
     def get(self, request):
-        carrito, created = Carrito.objects.get_or_create(user=request.user, is_active=True)
-        items = CarritoItem.objects.filter(carrito=carrito)
-        data = [
-            {
-                "producto": item.producto.nombre,
-                "producto_id": item.producto.id,
-                "cantidad": item.cantidad,
-                "precio": item.precio, 
-            }
-            for item in items
-        ]
-        return Response({"carrito": data})
+        if not request.user.is_authenticated:
+            return Response(contenido_sesion(request.session))
+        fusionar_sesion(request.session, request.user)
+        carrito = carrito_activo(request.user)
+        return Response(contenido_carrito(carrito.id))
+
+    def patch(self, request):
+        """
+        Aplica varias cantidades en una sola petición (ver tienda/carrito.py)
+
+        Body: {"operaciones": [{"producto_id": 3, "cantidad": 2}, {"producto_id": 5, "cantidad": 0}]}
+        """
+        operaciones = request.data.get('operaciones') if isinstance(request.data, dict) else request.data
+        try:
+            if request.user.is_authenticated:
+                fusionar_sesion(request.session, request.user)
+                mayorista = hasattr(request.user, 'perfilusuario') and request.user.perfilusuario.empresa
+                resultado = aplicar_operaciones(request.user, operaciones, mayorista=mayorista)
+            else:
+                resultado = aplicar_operaciones_sesion(request.session, operaciones)
+        except OperacionInvalida as e:
+            return Response({'success': False, 'error': str(e), 'detalles': e.detalles},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response({'success': True, **resultado})
 
     
 class AgregarCarritoView(APIView):
-    permission_classes = [IsAuthenticated]
+    permission_classes = [AllowAny]
 
     def post(self, request):
         user = request.user
@@ -385,7 +413,12 @@ class AgregarCarritoView(APIView):
         if producto.stock < cantidad:
             return Response({'error': 'No hay suficiente stock disponible'}, status=status.HTTP_400_BAD_REQUEST)
 
-        carrito, _ = Carrito.objects.get_or_create(user=user, is_active=True)
+        if not user.is_authenticated:
+            if agregar_sesion(request.session, producto.id, cantidad, maximo=producto.stock) == SIN_STOCK:
+                return Response({'error': 'Stock máximo alcanzado'}, status=status.HTTP_400_BAD_REQUEST)
+            return Response({'message': 'Producto agregado al carrito'}, status=status.HTTP_200_OK)
+
+        carrito = carrito_activo(user)
 
         # Precio según tipo de usuario
         if hasattr(user, 'perfilusuario') and user.perfilusuario.empresa:
@@ -393,18 +426,8 @@ class AgregarCarritoView(APIView):
         else:
             precio = producto.precio
 
-        carrito_item, created = CarritoItem.objects.get_or_create(
-            carrito=carrito, producto=producto,
-            defaults={'cantidad': cantidad, 'precio': precio}
-        )
-
-        if not created:
-            nueva_cantidad = carrito_item.cantidad + cantidad
-            if nueva_cantidad > producto.stock:
-                return Response({'error': 'Stock máximo alcanzado'}, status=status.HTTP_400_BAD_REQUEST)
-            carrito_item.cantidad = nueva_cantidad
-            carrito_item.precio = precio
-            carrito_item.save()
+        if agregar_item(carrito.id, producto.id, cantidad, precio, maximo=producto.stock) == SIN_STOCK:
+            return Response({'error': 'Stock máximo alcanzado'}, status=status.HTTP_400_BAD_REQUEST)
 
         return Response({'message': 'Producto agregado al carrito'}, status=status.HTTP_200_OK)
 class RemoverDelCarritoView(APIView):
@@ -413,28 +436,12 @@ class RemoverDelCarritoView(APIView):
     def post(self, request, producto_id):
         user = request.user
 
-        carrito, created = Carrito.objects.get_or_create(user=user, is_active=True)
+        carrito = carrito_activo(user, crear=False)
 
-        print("=== DEBUG ELIMINAR PRODUCTO DEL CARRITO ===")
-        print("Usuario autenticado:", user.username)
-        print("Producto ID recibido:", producto_id)
-        print("Carrito ID:", carrito.id)
-        print("Items en el carrito del usuario:")
-        for item in CarritoItem.objects.filter(carrito=carrito):
-            print(f" - Producto ID: {item.producto.id}, Nombre: {item.producto.nombre}, Cantidad: {item.cantidad}")
-
-        try:
-            item = CarritoItem.objects.get(carrito=carrito, producto_id=producto_id)
-        except CarritoItem.DoesNotExist:
-            print("⚠️ Producto no encontrado en el carrito del usuario.")
+        if carrito is None or disminuir_item(carrito.id, producto_id) == NO_ENCONTRADO:
+            logger.info(f"⚠️ Producto {producto_id} no encontrado en el carrito de {user.pk}")
             return Response({'error': 'El producto no está en el carrito'}, status=status.HTTP_404_NOT_FOUND)
 
-        if item.cantidad > 1:
-            item.cantidad -= 1
-            item.save()
-        else:
-            item.delete()
-
         return redirect('carrito')
     
 def carrito_page(request):
@@ -455,19 +462,20 @@ def carrito_page(request):
 
 class CarritoContadorView(APIView):
     authentication_classes = [TokenAuthentication]
-    permission_classes = [IsAuthenticated]
+    permission_classes = [AllowAny]
 
     def get(self, request):
         try:
             if not request.user.is_authenticated:
-                return JsonResponse({'count': 0})
-            
-            carrito = Carrito.objects.filter(user=request.user, is_active=True).first()
-            if not carrito:
-                return JsonResponse({'count': 0})
+                return JsonResponse({'count': unidades_sesion(request.session)})
             
-            count = sum(item.cantidad for item in CarritoItem.objects.filter(carrito=carrito))
-            return JsonResponse({'count': count})
+            datos = resumen_carrito(request.user)
+            return JsonResponse({
+                'count': datos['unidades'],
+                'items': datos['items'],
+                'subtotal': datos['subtotal'],
+                'peso': datos['peso'],
+            })
         except Exception as e:
             return JsonResponse({'count': 0})
 
@@ -774,107 +782,35 @@ def cerrar_sesion(request):
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def aumentar_producto(request, producto_id):
-    print("➡️ aumentar_producto()")
-    carrito, _ = Carrito.objects.get_or_create(user=request.user, is_active=True)
-
-    # Verificar si ya existe el producto en el carrito
-    items_existentes = CarritoItem.objects.filter(carrito=carrito, producto_id=producto_id)
-    
-    if items_existentes.exists():
-        # Si hay múltiples items del mismo producto, consolidarlos
-        if items_existentes.count() > 1:
-            print(f"⚠️ Se encontraron {items_existentes.count()} items duplicados. Consolidando...")
-            
-            # Sumar todas las cantidades
-            cantidad_total = sum(item.cantidad for item in items_existentes)
-            precio = items_existentes.first().precio
-            
-            # Eliminar todos los items
-            items_existentes.delete()
-            
-            # Crear un nuevo item consolidado
-            item = CarritoItem.objects.create(
-                carrito=carrito,
-                producto_id=producto_id,
-                cantidad=cantidad_total,
-                precio=precio
-            )
-            print(f"✅ Items consolidados. Cantidad total: {cantidad_total}")
-        else:
-            item = items_existentes.first()
-        
-        # Aumentar cantidad
-        producto = item.producto
-        if item.cantidad < producto.stock:
-            item.cantidad += 1
-            item.save()
-            print(f"🟢 Cantidad actualizada: {item.cantidad}")
-            return JsonResponse({'success': True, 'message': 'Cantidad actualizada'})
-        else:
-            print("❌ No se puede aumentar: stock máximo alcanzado")
-            return JsonResponse({'error': 'Stock máximo alcanzado'}, status=400)
-    else:
-        # Crear nuevo item
-        try:
-            producto = Producto.objects.get(id=producto_id)
-            precio = producto.precio_mayorista if (hasattr(request.user, 'perfilusuario') and request.user.perfilusuario.empresa) else producto.precio
-            
-            item = CarritoItem.objects.create(
-                carrito=carrito,
-                producto=producto,
-                cantidad=1,
-                precio=precio
-            )
-            print("🆕 Producto agregado al carrito")
-            return JsonResponse({'success': True, 'message': 'Producto agregado al carrito'})
-        except Producto.DoesNotExist:
-            print(f"❌ Producto {producto_id} no encontrado")
-            return JsonResponse({'error': 'Producto no encontrado'}, status=404)
+    producto = Producto.objects.filter(id=producto_id).only('id', 'precio', 'precio_mayorista', 'stock').first()
+    if producto is None:
+        logger.info(f"❌ Producto {producto_id} no encontrado")
+        return JsonResponse({'error': 'Producto no encontrado'}, status=404)
+
+    carrito = carrito_activo(request.user)
+    precio = producto.precio_mayorista if (hasattr(request.user, 'perfilusuario') and request.user.perfilusuario.empresa) else producto.precio
+
+    resultado = agregar_item(carrito.id, producto.id, 1, precio, maximo=producto.stock)
+    if resultado == SIN_STOCK:
+        logger.info(f"❌ No se puede aumentar el producto {producto_id}: stock máximo alcanzado")
+        return JsonResponse({'error': 'Stock máximo alcanzado'}, status=400)
+    if resultado == CREADO:
+        logger.debug(f"🆕 Producto {producto_id} agregado al carrito {carrito.id}")
+        return JsonResponse({'success': True, 'message': 'Producto agregado al carrito'})
+    logger.debug(f"🟢 Cantidad del producto {producto_id} actualizada en el carrito {carrito.id}")
+    return JsonResponse({'success': True, 'message': 'Cantidad actualizada'})
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def disminuir_producto(request, producto_id):
-    print("➡️ disminuir_producto()")
-    
-    # Buscar todos los items del producto en carritos activos del usuario
-    items = CarritoItem.objects.filter(
-        carrito__user=request.user, 
-        carrito__is_active=True,
-        producto_id=producto_id
-    )
-    
-    if not items.exists():
-        print(f"❌ No se encontró el producto {producto_id} en el carrito")
-        return JsonResponse({'error': 'Producto no encontrado en el carrito'}, status=404)
-    
-    # Si hay múltiples items del mismo producto, procesarlos todos
-    if items.count() > 1:
-        print(f"⚠️ Se encontraron {items.count()} items del producto {producto_id}. Consolidando...")
-        
-        # Sumar todas las cantidades
-        cantidad_total = sum(item.cantidad for item in items)
-        primer_item = items.first()
-        
-        # Eliminar todos los items excepto el primero
-        items.exclude(id=primer_item.id).delete()
-        
-        # Actualizar el primer item con la cantidad total
-        primer_item.cantidad = cantidad_total
-        primer_item.save()
-        
-        item = primer_item
-        print(f"✅ Items consolidados. Cantidad total: {cantidad_total}")
-    else:
-        item = items.first()
+    carrito = carrito_activo(request.user, crear=False)
+    resultado = disminuir_item(carrito.id, producto_id) if carrito else NO_ENCONTRADO
 
-    # Procesar la disminución
-    if item.cantidad > 1:
-        item.cantidad -= 1
-        item.save()
-        print(f"🔽 Cantidad disminuida a: {item.cantidad}")
-    else:
-        item.delete()
-        print("🗑️ Producto eliminado por cantidad = 0")
+    if resultado == NO_ENCONTRADO:
+        logger.info(f"❌ No se encontró el producto {producto_id} en el carrito")
+        return JsonResponse({'error': 'Producto no encontrado en el carrito'}, status=404)
+    if resultado == ELIMINADO:
+        logger.debug(f"🗑️ Producto {producto_id} eliminado por cantidad = 0")
 
     # Devolver JSON success para que el frontend sepa que funcionó
     return JsonResponse({'success': True, 'message': 'Cantidad actualizada'})
@@ -882,23 +818,12 @@ def disminuir_producto(request, producto_id):
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def remover_producto(request, producto_id):
-    print("➡️ remover_producto()")
-    
-    # Buscar todos los items del producto en carritos activos del usuario
-    items = CarritoItem.objects.filter(
-        carrito__user=request.user, 
-        carrito__is_active=True,
-        producto_id=producto_id
-    )
-    
-    if not items.exists():
-        print(f"❌ No se encontró el producto {producto_id} en el carrito")
+    carrito = carrito_activo(request.user, crear=False)
+
+    if carrito is None or not eliminar_item(carrito.id, producto_id):
+        logger.info(f"❌ No se encontró el producto {producto_id} en el carrito")
         return redirect('carrito')
-    
-    # Eliminar todos los items del producto (en caso de duplicados)
-    cantidad_eliminada = items.count()
-    items.delete()
-    print(f"🧹 {cantidad_eliminada} item(s) del producto eliminado(s) del carrito")
+    logger.debug(f"🧹 Producto {producto_id} eliminado del carrito {carrito.id}")
 
     # Devolver JSON success para que el frontend sepa que funcionó
     return JsonResponse({'success': True, 'message': 'Producto eliminado del carrito'})
@@ -970,21 +895,8 @@ def crear_pedido(request):
     for item in items:
         print(f"  - {item.producto.nombre}: {item.cantidad} x ${item.precio}")
 
-    # Calcular peso total y dimensiones
-    peso_total = sum(item.producto.peso * item.cantidad for item in items)
-    
-    # Calcular dimensiones del paquete (igual que en calcular_tarifas_envio)
-    max_alto = 0
-    max_ancho = 0
-    total_largo = 0
-    
-    for item in items:
-        cantidad = item.cantidad
-        producto = item.producto
-        
-        total_largo += (producto.largo or 0) * cantidad
-        max_ancho = max(max_ancho, producto.ancho or 0)
-        max_alto = max(max_alto, producto.alto or 0)
+    # Calcular peso total y dimensiones (mismo perfil usado al cotizar)
+    perfil = perfil_envio(carrito)
 
     # Crear pedido
     order_id = generar_order_id()
@@ -995,10 +907,11 @@ def crear_pedido(request):
         estado="pendiente",
         retiro_en_tienda=(tipo_entrega == "retiro"),
         envio_domicilio=(tipo_entrega == "envio"),
-        peso_total=peso_total,
-        alto=max_alto,
-        ancho=max_ancho,
-        largo=total_largo,
+        peso_total=perfil['peso_total'],
+        alto=perfil['alto'],
+        ancho=perfil['ancho'],
+        largo=perfil['largo'],
+        paquetes=perfil['paquetes'],
         costo_envio=data.get("costo_envio", 0)  # Asegúrate de que este campo exista en tu modelo Pedido
     )
 
@@ -1206,10 +1119,8 @@ def pago_exitoso(request):
                             print(f"🔽 === PROCESANDO STOCK === Producto: {producto.nombre}, Stock actual: {producto.stock}, Cantidad a reducir: {item.cantidad}")
                             
                             # Reducir stock solo si el pedido no estaba ya pagado
-                            if producto.stock >= item.cantidad:
-                                stock_antes = producto.stock
-                                producto.stock -= item.cantidad
-                                producto.save()
+                            stock_antes = producto.stock
+                            if descontar_stock(producto, item.cantidad, pedido.order_id, request.user):
                                 print(f"✅ Stock reducido para {producto.nombre}: {stock_antes} -> {producto.stock} (redujo {item.cantidad} unidades)")
                             else:
                                 messages.warning(request, f"No hay suficiente stock para {producto.nombre}")
@@ -1327,6 +1238,7 @@ def pago_exitoso(request):
                     
                     if resultado_pdf.get('success'):
                         factura.pdf_url = resultado_pdf.get('pdf_url')
+                        factura.pdf_sha256 = resultado_pdf.get('pdf_sha256')
                         factura.save()
                         factura_generada = True
                         pdf_factura_url = resultado_pdf.get('pdf_url')
@@ -1481,20 +1393,8 @@ def crear_pedido_transferencia(request):
         
         print(f"🔍 Debug crear_pedido_transferencia - Carrito encontrado: {carrito.id}, Items: {items.count()}")
 
-        # Calcular peso total y dimensiones (para envío)
-        peso_total = sum(item.producto.peso * item.cantidad for item in items)
-        
-        max_alto = 0
-        max_ancho = 0
-        total_largo = 0
-        
-        for item in items:
-            cantidad = item.cantidad
-            producto = item.producto
-            
-            total_largo += (producto.largo or 0) * cantidad
-            max_ancho = max(max_ancho, producto.ancho or 0)
-            max_alto = max(max_alto, producto.alto or 0)
+        # Calcular peso total y dimensiones (mismo perfil usado al cotizar)
+        perfil = perfil_envio(carrito)
 
         # Crear pedido con estado pendiente
         order_id = generar_order_id()
@@ -1506,10 +1406,11 @@ def crear_pedido_transferencia(request):
             metodo_pago="transferencia",  # Marcar como transferencia
             retiro_en_tienda=(tipo_entrega == "retiro"),
             envio_domicilio=(tipo_entrega == "envio"),
-            peso_total=peso_total,
-            alto=max_alto,
-            ancho=max_ancho,
-            largo=total_largo
+            peso_total=perfil['peso_total'],
+            alto=perfil['alto'],
+            ancho=perfil['ancho'],
+            largo=perfil['largo'],
+            paquetes=perfil['paquetes']
         )
 
         if tipo_entrega == "envio":
@@ -1578,8 +1479,8 @@ def obtener_regiones_chilexpress(request):
     API para obtener todas las regiones disponibles desde Chilexpress
     """
     try:
-        from .chilexpress import obtener_regiones
-        regiones = obtener_regiones()
+        from .chilexpress import regiones_cacheadas
+        regiones = regiones_cacheadas()
         return Response({
             "success": True,
             "regiones": regiones
@@ -1597,13 +1498,18 @@ def obtener_comunas_chilexpress(request, region_id):
     """
     API para obtener comunas de una región específica
     """
+    from .chilexpress import comunas_cacheadas, RegionDesconocida
     try:
-        from .chilexpress import obtener_comunas_por_region
-        comunas = obtener_comunas_por_region(region_id)
+        comunas = comunas_cacheadas(region_id)
         return Response({
             "success": True,
             "comunas": comunas
         })
+    except RegionDesconocida:
+        return Response({
+            "success": False,
+            "error": "Región no encontrada"
+        }, status=404)
     except Exception as e:
         logger.error(f"Error obteniendo comunas: {str(e)}")
         return Response({
@@ -1619,51 +1525,33 @@ def calcular_envio_chilexpress(request):
     API para calcular tarifas de envío usando Chilexpress
     """
     try:
-        from .chilexpress import calcular_tarifas_envio
+        from .chilexpress import cotizar_perfil
         
         # Obtener datos del request
         data = request.data
         logger.info(f"📦 Calculando envío con datos: {data}")
         
         # Validar datos mínimos
-        if not data.get('comuna_destino') or not data.get('productos'):
+        if not data.get('comuna_destino'):
             return Response({
                 "success": False,
-                "error": "Faltan datos requeridos: comuna_destino y productos"
+                "error": "Falta dato requerido: comuna_destino"
             }, status=400)
         
-        # Calcular totales de peso y dimensiones de los productos
-        productos = data.get('productos', [])
-        peso_total = 0
-        max_alto = 0
-        max_ancho = 0
-        total_largo = 0
-        
-        for producto in productos:
-            cantidad = producto.get('cantidad', 1)
-            peso_total += (producto.get('peso', 1) * cantidad)
-            total_largo += (producto.get('largo', 10) * cantidad)
-            max_ancho = max(max_ancho, producto.get('ancho', 10))
-            max_alto = max(max_alto, producto.get('alto', 10))
-
-        # Configurar datos para la API de Chilexpress
-        datos_envio = {
-            'comuna_destino': data.get('comuna_destino'),
-            'region_destino': data.get('region_destino'),
-            'peso_total': peso_total,
-            'largo': total_largo,
-            'ancho': max_ancho,
-            'alto': max_alto
-        }
+        # Peso y dimensiones salen del carrito guardado (datos de Producto),
+        # no de las medidas que envía el navegador
+        carrito = Carrito.objects.filter(user=request.user, is_active=True).first()
+        perfil = perfil_envio(carrito) if carrito else None
+        if not perfil or not perfil['cantidad_items']:
+            return Response({
+                "success": False,
+                "error": "Carrito vacío"
+            }, status=400)
         
-        logger.info(f"📦 Datos de envío calculados: {datos_envio}")
+        logger.info(f"📦 Perfil de envío del carrito: {perfil}")
         
         # Llamar a la función de cálculo de tarifas
-        resultado = calcular_tarifas_envio(
-                    productos,
-                    data.get('comuna_destino'),
-                    data.get('subtotal', 0)
-                )
+        resultado = cotizar_perfil(perfil, data.get('comuna_destino'), perfil['subtotal'])
         
         return Response({
             "success": True,
@@ -1677,6 +1565,64 @@ def calcular_envio_chilexpress(request):
             "error": str(e)
         }, status=500)
 
+@api_view(['POST'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+def cotizar_lote_chilexpress(request):
+    """
+    API para cotizar el carrito hacia varias comunas a la vez
+    (clientes B2B con varias direcciones, comparar plazos de entrega)
+    
+    Body: {"destinos": ["STGO", "PROV", ...]}
+    """
+    try:
+        from .chilexpress import cotizar_destinos
+        
+        destinos = request.data.get('destinos') or []
+        if not isinstance(destinos, list) or not destinos:
+            return Response({
+                "success": False,
+                "error": "Falta dato requerido: destinos (lista de códigos de comuna)"
+            }, status=400)
+        if len(destinos) > MAX_DESTINOS_COTIZACION:
+            return Response({
+                "success": False,
+                "error": f"Máximo {MAX_DESTINOS_COTIZACION} destinos por consulta"
+            }, status=400)
+        
+        carrito = Carrito.objects.filter(user=request.user, is_active=True).first()
+        perfil = perfil_envio(carrito) if carrito else None
+        if not perfil or not perfil['cantidad_items']:
+            return Response({
+                "success": False,
+                "error": "Carrito vacío"
+            }, status=400)
+        
+        resultados = cotizar_destinos(perfil, destinos, perfil['subtotal'])
+        return Response({
+            "success": any(r['success'] for r in resultados),
+            "resultados": resultados
+        })
+        
+    except Exception as e:
+        logger.error(f"❌ Error en cotización por lote: {str(e)}")
+        return Response({
+            "success": False,
+            "error": str(e)
+        }, status=500)
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def estadisticas_cotizaciones_chilexpress(request):
+    """
+    API (solo admin) con la tasa de aciertos del cache de cotizaciones
+    """
+    from .cotizaciones import estadisticas_cotizaciones
+    return Response({
+        "success": True,
+        "estadisticas": estadisticas_cotizaciones()
+    })
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def limpiar_carrito(request):
@@ -1695,7 +1641,7 @@ def limpiar_carrito(request):
             })
         
         # Eliminar todos los items del carrito
-        CarritoItem.objects.filter(carrito=carrito).delete()
+        vaciar(carrito.id)
         
         logger.info(f"🧹 Carrito limpiado para usuario {user.username}")
         
@@ -2018,6 +1964,7 @@ def lista_pedidos_dashboard(request):
             'total_ventas': sum(float(p.monto) for p in pedidos_ventas),
             'pedidos_transferencia': Pedido.objects.filter(metodo_pago='transferencia').count(),
             'pedidos_webpay': Pedido.objects.filter(metodo_pago='webpay').count(),
+            'productos_bajo_stock': total_alertas(),
         }
         
         return Response({
@@ -2086,6 +2033,9 @@ def actualizar_estado_pedido(request, order_id):
         estado_anterior = pedido.estado
         pedido.estado = nuevo_estado
         pedido.save()
+
+        if nuevo_estado == 'cancelado' and estado_anterior != 'cancelado':
+            reponer_pedido(pedido, user)
         
         logger.info(f"✅ Pedido {order_id} actualizado de '{estado_anterior}' a '{nuevo_estado}' por {user.username}")
         
@@ -2292,6 +2242,215 @@ def pago_rechazado_page(request, order_id):
         logger.error(f"❌ Error en pago_rechazado_page: {str(e)}")
         return redirect('carrito')
 
+def descargar_comprobante(request, order_id):
+    """
+    Descarga del comprobante PDF de un pedido (ETag, Range o X-Accel/X-Sendfile)
+    """
+    from .pdf_storage import respuesta_pdf, ruta_relativa
+
+    factura = get_object_or_404(Factura.objects.select_related('pedido'), pedido__order_id=order_id)
+    pedido = factura.pedido
+
+    # Solo el dueño del pedido o personal de la tienda
+    es_personal = request.user.is_authenticated and (
+        request.user.is_staff or
+        (hasattr(request.user, 'perfilusuario') and request.user.perfilusuario.trabajador)
+    )
+    if not (request.user.is_authenticated and (pedido.email == request.user.email or es_personal)):
+        return redirect('login')
+
+    if not factura.pdf_sha256:
+        # Comprobantes antiguos guardados con nombre por fecha
+        if factura.pdf_url:
+            return redirect(factura.pdf_url)
+        raise Http404("Comprobante no disponible")
+
+    return respuesta_pdf(
+        request,
+        ruta_relativa(factura.pdf_sha256),
+        factura.pdf_sha256,
+        f"comprobante_{order_id}.pdf"
+    )
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def generar_ots_despacho(request):
+    """
+    API para generar las OTs y etiquetas de todos los pedidos en preparación
+    
+    Body opcional: {"order_ids": [...]} para limitar el lote
+    """
+    try:
+        user = request.user
+        es_trabajador = hasattr(user, 'perfilusuario') and user.perfilusuario.trabajador
+        if not (user.is_staff or es_trabajador):
+            return Response({
+                'success': False,
+                'error': 'No tienes permisos para generar envíos'
+            }, status=403)
+        
+        from .despacho import despachar_lote
+        resultado = despachar_lote(request.data.get('order_ids') or None)
+        
+        etiquetas = resultado.pop('etiquetas')
+        if etiquetas:
+            resultado['etiquetas_url'] = reverse('descargar-etiquetas', args=[etiquetas['sha256']])
+        
+        return Response({'success': True, **resultado})
+        
+    except Exception as e:
+        logger.error(f"❌ Error generando OTs por lote: {str(e)}")
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=500)
+
+MAX_ERRORES_IMPORTACION = 500
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def importar_productos_archivo(request):
+    """
+    API para importar/actualizar productos por SKU desde un CSV o XLSX (solo personal)
+    
+    Multipart: archivo=<.csv|.xlsx>, validar=1 para revisar sin guardar
+    """
+    try:
+        user = request.user
+        es_trabajador = hasattr(user, 'perfilusuario') and user.perfilusuario.trabajador
+        if not (user.is_staff or es_trabajador):
+            return Response({
+                'success': False,
+                'error': 'No tienes permisos para importar productos'
+            }, status=403)
+        
+        archivo = request.FILES.get('archivo')
+        if not archivo:
+            return Response({
+                'success': False,
+                'error': 'Falta el archivo'
+            }, status=400)
+        
+        from .importacion import importar_productos, ErrorImportacion
+        try:
+            resumen = importar_productos(
+                archivo, archivo.name,
+                solo_validar=str(request.data.get('validar', '')).lower() in ('1', 'true', 'si')
+            )
+        except ErrorImportacion as e:
+            return Response({'success': False, 'error': str(e)}, status=400)
+        
+        resumen['total_errores'] = len(resumen['errores'])
+        resumen['errores'] = resumen['errores'][:MAX_ERRORES_IMPORTACION]
+        return Response({'success': True, **resumen})
+        
+    except Exception as e:
+        logger.error(f"❌ Error importando productos: {str(e)}")
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=500)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def ajuste_masivo_productos(request):
+    """
+    API para actualizar precios/stock por reglas (solo personal)
+    
+    Body: {"reglas": [...], "simular": true}  (ver tienda/precios.py)
+    """
+    try:
+        user = request.user
+        es_trabajador = hasattr(user, 'perfilusuario') and user.perfilusuario.trabajador
+        if not (user.is_staff or es_trabajador):
+            return Response({
+                'success': False,
+                'error': 'No tienes permisos para modificar precios'
+            }, status=403)
+        
+        from .precios import aplicar_ajuste, simular_ajuste, ReglaInvalida
+        reglas = request.data.get('reglas')
+        try:
+            if request.data.get('simular'):
+                return Response({'success': True, 'simulacion': simular_ajuste(reglas)})
+            ajuste = aplicar_ajuste(reglas, request.user)
+        except ReglaInvalida as e:
+            return Response({'success': False, 'error': str(e)}, status=400)
+        
+        return Response({
+            'success': True,
+            'ajuste_id': ajuste.id,
+            'filas_afectadas': ajuste.filas_afectadas,
+            'duracion_ms': ajuste.duracion_ms
+        })
+        
+    except Exception as e:
+        logger.error(f"❌ Error en ajuste masivo: {str(e)}")
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=500)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def productos_bajo_stock(request):
+    """
+    API con los productos en o bajo su punto de reorden (solo personal)
+    
+    Query: ?limite=20
+    """
+    try:
+        user = request.user
+        es_trabajador = hasattr(user, 'perfilusuario') and user.perfilusuario.trabajador
+        if not (user.is_staff or es_trabajador):
+            return Response({
+                'success': False,
+                'error': 'No tienes permisos para ver el stock'
+            }, status=403)
+        
+        from .reposicion import productos_bajo_stock as listar_bajo_stock
+        try:
+            limite = int(request.GET.get('limite') or 0) or None
+        except ValueError:
+            limite = None
+        productos = listar_bajo_stock()
+        
+        return Response({
+            'success': True,
+            'productos': productos[:limite] if limite else productos,
+            'total': len(productos)
+        })
+        
+    except Exception as e:
+        logger.error(f"❌ Error obteniendo productos con bajo stock: {str(e)}")
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=500)
+
+def descargar_etiquetas(request, sha256):
+    """
+    Descarga del PDF de etiquetas de un lote de despacho (solo personal)
+    """
+    from .pdf_storage import respuesta_pdf, ruta_relativa
+    from .despacho import DIRECTORIO_ETIQUETAS
+
+    es_personal = request.user.is_authenticated and (
+        request.user.is_staff or
+        (hasattr(request.user, 'perfilusuario') and request.user.perfilusuario.trabajador)
+    )
+    if not es_personal:
+        return redirect('login')
+    if not re.fullmatch(r'[0-9a-f]{64}', sha256):
+        raise Http404("Etiquetas no encontradas")
+
+    return respuesta_pdf(
+        request,
+        ruta_relativa(sha256, DIRECTORIO_ETIQUETAS),
+        sha256,
+        f"etiquetas_{sha256[:8]}.pdf"
+    )
+
 def api_externa_page(request):
     """
     Página de documentación de la API Externa
@@ -2318,6 +2477,11 @@ class MarcasVehiculosAPIView(APIView):
     
     def get(self, request):
         try:
+            from .vehiculos import fuente_vehiculos, marcas_locales
+            if fuente_vehiculos() == 'local':
+                # Espejo local sincronizado con `sincronizar_carapi`
+                return Response(marcas_locales(), status=200)
+
             from .car_api import car_api_client
             # Obtener marcas desde CarAPI
             marcas = car_api_client.get_makes()
@@ -2357,6 +2521,9 @@ class ModelosVehiculosAPIView(APIView):
                 return Response({
                     'error': 'El parámetro marca es requerido'
                 }, status=400)
+            from .vehiculos import fuente_vehiculos, modelos_locales
+            if fuente_vehiculos() == 'local':
+                return Response(modelos_locales(marca_nombre), status=200)
             # Obtener modelos desde CarAPI
             print(f"🚗 Buscando modelos para marca: {marca_nombre}")
             modelos = car_api_client.search_models_by_make_name(marca_nombre)
@@ -2386,5 +2553,23 @@ class ModelosVehiculosAPIView(APIView):
                 'error': 'Error interno del servidor'
             }, status=500)
 
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def autocompletar_vehiculos(request):
+    """
+    API de autocompletado de marcas/modelos desde el índice en memoria
+    
+    Query: ?q=toyota cor 2015&limite=10
+    """
+    consulta = request.GET.get('q', '')
+    try:
+        limite = int(request.GET.get('limite', 10))
+    except ValueError:
+        limite = 10
+    return Response({
+        "success": True,
+        "resultados": autocompletar(consulta, limite)
+    })
+
 def error_404_view(request, exception=None):
     return render(request, '404.html', status=404)
\ No newline at end of file
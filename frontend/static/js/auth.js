@@ -335,8 +335,12 @@ class AuthManager {
       });
     }
 
-    // Actualizar contador del carrito (autenticado + invitado)
-    this.actualizarContadorCarritoHibrido();
+    // Actualizar contador del carrito (autenticado + invitado); si el header ya
+    // trae las unidades del servidor no se hace la petición
+    const contadorRenderizado = document.getElementById("carrito-count");
+    if (!contadorRenderizado || contadorRenderizado.dataset.unidades === undefined) {
+      this.actualizarContadorCarritoHibrido();
+    }
   }
 
   /**
@@ -391,12 +395,7 @@ class AuthManager {
   async actualizarContadorCarritoHibrido() {
     try {
       const totalItems = await this.obtenerContadorCarritoTotal();
-      
-      const contador = document.getElementById("carrito-count");
-      if (contador) {
-        contador.textContent = totalItems;
-        contador.style.display = totalItems > 0 ? "inline" : "none";
-      }
+      this.mostrarContadorCarrito(totalItems);
     } catch (error) {
       console.error("Error al actualizar contador híbrido:", error);
     }
@@ -411,39 +410,32 @@ class AuthManager {
 
   /**
    * Agrega producto al carrito (autenticado o invitado)
+   * El servidor guarda el carrito del invitado en su sesión
    */
   async agregarAlCarrito(productoId, cantidad = 1) {
     try {
-      // Verificar si hay autenticación
       const token = await this.getTokenIfAvailable();
-      
+      const headers = { "Content-Type": "application/json" };
       if (token) {
-        // Usuario autenticado - agregar al carrito del servidor
-        const response = await fetch("/carrito/agregar/", {
-          method: "POST",
-          headers: {
-            "Authorization": `Token ${token}`,
-            "Content-Type": "application/json"
-          },
-          body: JSON.stringify({
-            producto_id: productoId,
-            cantidad: cantidad
-          })
-        });
-
-        if (response.ok) {
-          // Actualizar contador del servidor
-          await this.actualizarContadorCarrito();
-          return { success: true, type: 'authenticated' };
-        } else {
-          const errorData = await response.json();
-          return { success: false, error: errorData.error || "Error al agregar al carrito" };
-        }
+        headers["Authorization"] = `Token ${token}`;
+      }
+
+      const response = await fetch("/carrito/agregar/", {
+        method: "POST",
+        headers: headers,
+        credentials: "same-origin",
+        body: JSON.stringify({
+          producto_id: productoId,
+          cantidad: cantidad
+        })
+      });
+
+      if (response.ok) {
+        await this.actualizarContadorCarrito();
+        return { success: true, type: token ? 'authenticated' : 'guest' };
       } else {
-        // Usuario invitado - agregar al carrito local
-        this.agregarAlCarritoLocal(productoId, cantidad);
-        this.actualizarContadorCarritoLocal();
-        return { success: true, type: 'guest' };
+        const errorData = await response.json();
+        return { success: false, error: errorData.error || "Error al agregar al carrito" };
       }
     } catch (error) {
       console.error("Error al agregar al carrito:", error);
@@ -452,28 +444,9 @@ class AuthManager {
   }
 
   /**
-   * Agrega producto al carrito local (invitado)
-   */
-  agregarAlCarritoLocal(productoId, cantidad = 1) {
-    let carritoLocal = JSON.parse(localStorage.getItem("carrito_invitado") || "{}");
-    
-    if (carritoLocal[productoId]) {
-      carritoLocal[productoId] += cantidad;
-    } else {
-      carritoLocal[productoId] = cantidad;
-    }
-    
-    localStorage.setItem("carrito_invitado", JSON.stringify(carritoLocal));
-    console.log("✅ Producto agregado al carrito de invitado");
-  }
-
-  /**
-   * Actualiza el contador del carrito local
+   * Muestra en el header las unidades del carrito
    */
-  actualizarContadorCarritoLocal() {
-    const carritoLocal = JSON.parse(localStorage.getItem("carrito_invitado") || "{}");
-    const totalItems = Object.values(carritoLocal).reduce((sum, cantidad) => sum + cantidad, 0);
-    
+  mostrarContadorCarrito(totalItems) {
     const contador = document.getElementById("carrito-count");
     if (contador) {
       contador.textContent = totalItems;
@@ -482,136 +455,124 @@ class AuthManager {
   }
 
   /**
-   * Obtiene el conteo total del carrito (autenticado + invitado)
+   * Obtiene el conteo total del carrito (autenticado o invitado)
    */
   async obtenerContadorCarritoTotal() {
     const token = await this.getTokenIfAvailable();
-    
-    if (token) {
-      // Usuario autenticado - obtener del servidor
-      try {
-        const response = await fetch("/carrito/contador/", {
-          headers: { "Authorization": `Token ${token}` }
-        });
-        
-        if (response.ok) {
-          const data = await response.json();
-          return data.count || 0;
-        }
-      } catch (error) {
-        console.error("Error al obtener contador del servidor:", error);
+    try {
+      // Sin token el servidor cuenta el carrito de invitado de la sesión
+      const response = await fetch("/carrito/contador/", {
+        headers: token ? { "Authorization": `Token ${token}` } : {},
+        credentials: "same-origin"
+      });
+
+      if (response.ok) {
+        const data = await response.json();
+        return data.count || 0;
       }
+    } catch (error) {
+      console.error("Error al obtener contador del servidor:", error);
     }
-    
-    // Usuario invitado - obtener del localStorage
-    const carritoLocal = JSON.parse(localStorage.getItem("carrito_invitado") || "{}");
-    return Object.values(carritoLocal).reduce((sum, cantidad) => sum + cantidad, 0);
+    return 0;
   }
 
   /**
-   * Migra carrito de invitado al carrito autenticado
+   * El servidor fusiona el carrito de invitado al iniciar sesión (una sola
+   * operación); aquí solo se descarta el carrito antiguo de localStorage y se
+   * refresca el contador
    */
   async migrarCarritoInvitado() {
-    const carritoLocal = JSON.parse(localStorage.getItem("carrito_invitado") || "{}");
-    
-    if (Object.keys(carritoLocal).length === 0) {
-      return; // No hay productos en carrito local
-    }
-
-    const token = await this.getTokenIfAvailable();
-    if (!token) {
-      console.warn("No se puede migrar carrito sin autenticación");
-      return;
-    }
-
-    try {
-      // Agregar cada producto del carrito local al carrito autenticado
-      for (const [productoId, cantidad] of Object.entries(carritoLocal)) {
-        await fetch("/carrito/agregar/", {
-          method: "POST",
-          headers: {
-            "Authorization": `Token ${token}`,
-            "Content-Type": "application/json"
-          },
-          body: JSON.stringify({
-            producto_id: parseInt(productoId),
-            cantidad: cantidad
-          })
-        });
-      }
+    localStorage.removeItem("carrito_invitado");
+    await this.actualizarContadorCarrito();
+  }
 
-      // Limpiar carrito local después de migrar
-      localStorage.removeItem("carrito_invitado");
-      console.log("✅ Carrito de invitado migrado al carrito autenticado");
-      
-      // Actualizar contador
-      await this.actualizarContadorCarrito();
-    } catch (error) {
-      console.error("Error al migrar carrito de invitado:", error);
+  /**
+   * Envía cambios de cantidad al carrito de invitado (PATCH /api/carrito/)
+   * @param {Array} operaciones [{producto_id, cantidad}]
+   */
+  async enviarOperacionesCarritoInvitado(operaciones) {
+    const response = await fetch("/api/carrito/", {
+      method: "PATCH",
+      headers: { "Content-Type": "application/json" },
+      credentials: "same-origin",
+      body: JSON.stringify({ operaciones: operaciones })
+    });
+    const data = await response.json();
+    if (!response.ok) {
+      console.error("❌ CARRITO INVITADO:", data.error, data.detalles);
     }
+    this.mostrarContadorCarrito(data.cantidad_total || 0);
+    return data;
   }
 
   /**
    * Obtiene los productos del carrito de invitado con información completa
    */
   async obtenerCarritoInvitado() {
-    const carritoLocal = JSON.parse(localStorage.getItem("carrito_invitado") || "{}");
+    const response = await fetch("/api/carrito/", { credentials: "same-origin" });
+    const datos = response.ok ? await response.json() : { carrito: [] };
+    this.carritoInvitado = {};
     const productosCarrito = [];
 
-    console.log("🔍 CARRITO INVITADO: Carrito local:", carritoLocal);
-
-    for (const [productoId, cantidad] of Object.entries(carritoLocal)) {
+    for (const item of datos.carrito) {
+      this.carritoInvitado[item.producto_id] = item.cantidad;
       try {
-        console.log(`🔍 CARRITO INVITADO: Obteniendo producto ${productoId}...`);
         // Obtener información del producto desde la API pública
-        const response = await fetch(`/api/productos/${productoId}/`);
-        console.log(`🔍 CARRITO INVITADO: Respuesta para producto ${productoId}:`, response.status);
-        
-        if (response.ok) {
-          const producto = await response.json();
-          console.log(`✅ CARRITO INVITADO: Producto ${productoId} obtenido:`, producto);
+        const respuestaProducto = await fetch(`/api/productos/${item.producto_id}/`);
+        if (respuestaProducto.ok) {
+          const producto = await respuestaProducto.json();
           productosCarrito.push({
-            id: parseInt(productoId),
+            id: item.producto_id,
             producto: producto,
-            cantidad: cantidad,
-            subtotal: producto.precio * cantidad
+            cantidad: item.cantidad,
+            subtotal: item.precio * item.cantidad
           });
         } else {
-          console.error(`❌ CARRITO INVITADO: Error al obtener producto ${productoId}:`, response.status);
+          console.error(`❌ CARRITO INVITADO: Error al obtener producto ${item.producto_id}:`, respuestaProducto.status);
         }
       } catch (error) {
-        console.error(`❌ CARRITO INVITADO: Error al obtener producto ${productoId}:`, error);
+        console.error(`❌ CARRITO INVITADO: Error al obtener producto ${item.producto_id}:`, error);
       }
     }
 
-    console.log("🔍 CARRITO INVITADO: Productos finales:", productosCarrito);
+    this.mostrarContadorCarrito(datos.cantidad_total || 0);
     return productosCarrito;
   }
 
+  /**
+   * Cantidad de un producto en el carrito de invitado (según la última carga)
+   */
+  cantidadCarritoInvitado(productoId) {
+    return (this.carritoInvitado || {})[productoId] || 0;
+  }
+
   /**
    * Actualiza cantidad de producto en carrito de invitado
    */
-  actualizarCantidadCarritoLocal(productoId, nuevaCantidad) {
-    let carritoLocal = JSON.parse(localStorage.getItem("carrito_invitado") || "{}");
-    
-    if (nuevaCantidad <= 0) {
-      delete carritoLocal[productoId];
-    } else {
-      carritoLocal[productoId] = nuevaCantidad;
-    }
-    
-    localStorage.setItem("carrito_invitado", JSON.stringify(carritoLocal));
-    this.actualizarContadorCarritoLocal();
+  async actualizarCantidadCarritoLocal(productoId, nuevaCantidad) {
+    return await this.enviarOperacionesCarritoInvitado([
+      { producto_id: parseInt(productoId), cantidad: Math.max(nuevaCantidad, 0) }
+    ]);
   }
 
   /**
    * Elimina producto del carrito de invitado
    */
-  eliminarDelCarritoLocal(productoId) {
-    let carritoLocal = JSON.parse(localStorage.getItem("carrito_invitado") || "{}");
-    delete carritoLocal[productoId];
-    localStorage.setItem("carrito_invitado", JSON.stringify(carritoLocal));
-    this.actualizarContadorCarritoLocal();
+  async eliminarDelCarritoLocal(productoId) {
+    return await this.actualizarCantidadCarritoLocal(productoId, 0);
+  }
+
+  /**
+   * Vacía el carrito de invitado en una sola petición
+   */
+  async vaciarCarritoInvitado() {
+    const operaciones = Object.keys(this.carritoInvitado || {}).map((productoId) => ({
+      producto_id: parseInt(productoId), cantidad: 0
+    }));
+    this.carritoInvitado = {};
+    if (operaciones.length > 0) {
+      await this.enviarOperacionesCarritoInvitado(operaciones);
+    }
   }
 }
 
@@ -332,57 +332,89 @@ function mostrarCarrito(carrito, tipo) {
 }
 
 // Funciones para carrito autenticado
-async function cambiarCantidadAutenticado(productoId, cambio) {
-  try {
-    const endpoint = cambio > 0 ? "aumentar" : "disminuir";
-    const response = await window.authManager.fetchAutenticado(`/api/carrito/${endpoint}/${productoId}/`, {
-      method: 'POST'
-    });
+// Los clics se acumulan como cantidades finales {producto_id: cantidad} y se
+// envían juntos en un solo PATCH /api/carrito/ cuando el usuario deja de hacer clic
+const ESPERA_CAMBIOS_CARRITO_MS = 400;
+const cambiosCarritoPendientes = {};
+let temporizadorCambiosCarrito = null;
+
+function cambiarCantidadAutenticado(productoId, cambio) {
+  const carrito = window.carritoActual || [];
+  const item = carrito.find(i => i.producto_id === productoId);
+  if (!item) return;
+
+  const nuevaCantidad = Math.max(0, item.cantidad + cambio);
+  programarCambioCarrito(productoId, nuevaCantidad);
+
+  // Mostrar el cambio de inmediato; la respuesta del servidor lo confirma
+  item.cantidad = nuevaCantidad;
+  mostrarCarrito(carrito.filter(i => i.cantidad > 0), 'authenticated');
+}
 
-    if (response.ok) {
-      await cargarCarritoAutenticado(); // Recargar carrito
-      await window.authManager.actualizarContadorCarrito();
-    } else {
-      console.error("Error al cambiar cantidad");
-    }
-  } catch (error) {
-    console.error("Error:", error);
-  }
+function eliminarProductoAutenticado(productoId) {
+  const carrito = window.carritoActual || [];
+  programarCambioCarrito(productoId, 0);
+  mostrarCarrito(carrito.filter(i => i.producto_id !== productoId), 'authenticated');
+  enviarCambiosCarrito();
 }
 
-async function eliminarProductoAutenticado(productoId) {
+function programarCambioCarrito(productoId, cantidad) {
+  cambiosCarritoPendientes[productoId] = cantidad;
+  clearTimeout(temporizadorCambiosCarrito);
+  temporizadorCambiosCarrito = setTimeout(enviarCambiosCarrito, ESPERA_CAMBIOS_CARRITO_MS);
+}
+
+async function enviarCambiosCarrito() {
+  clearTimeout(temporizadorCambiosCarrito);
+  const operaciones = Object.entries(cambiosCarritoPendientes).map(([productoId, cantidad]) => ({
+    producto_id: Number(productoId),
+    cantidad
+  }));
+  if (operaciones.length === 0) return;
+  Object.keys(cambiosCarritoPendientes).forEach(productoId => delete cambiosCarritoPendientes[productoId]);
+
   try {
-    const response = await window.authManager.fetchAutenticado(`/api/carrito/remover/${productoId}/`, {
-      method: 'POST'
+    const response = await window.authManager.fetchAutenticado("/api/carrito/", {
+      method: 'PATCH',
+      body: JSON.stringify({ operaciones })
     });
+    const data = await response.json();
 
     if (response.ok) {
-      await cargarCarritoAutenticado(); // Recargar carrito
-      await window.authManager.actualizarContadorCarrito();
+      mostrarCarrito(data.carrito, 'authenticated');
     } else {
-      console.error("Error al eliminar producto");
+      console.error("Error al actualizar el carrito:", data.error, data.detalles);
+      const sinStock = (data.detalles || []).find(d => d.disponible !== undefined);
+      if (sinStock) {
+        alert(`Stock insuficiente: solo quedan ${sinStock.disponible} unidades`);
+      }
+      await cargarCarritoAutenticado(); // Volver al estado real del servidor
     }
+    await window.authManager.actualizarContadorCarrito();
   } catch (error) {
     console.error("Error:", error);
+    await cargarCarritoAutenticado();
   }
 }
 
 // Funciones para carrito de invitado
-function cambiarCantidadInvitado(productoId, cambio) {
-  const carritoLocal = JSON.parse(localStorage.getItem("carrito_invitado") || "{}");
-  const nuevaCantidad = (carritoLocal[productoId] || 0) + cambio;
+async function cambiarCantidadInvitado(productoId, cambio) {
+  const nuevaCantidad = window.authManager.cantidadCarritoInvitado(productoId) + cambio;
   
-  window.authManager.actualizarCantidadCarritoLocal(productoId, nuevaCantidad);
-  cargarCarritoInvitado(); // Recargar carrito
+  await window.authManager.actualizarCantidadCarritoLocal(productoId, nuevaCantidad);
+  await cargarCarritoInvitado(); // Recargar carrito
 }
 
-function eliminarProductoInvitado(productoId) {
-  window.authManager.eliminarDelCarritoLocal(productoId);
-  cargarCarritoInvitado(); // Recargar carrito
+async function eliminarProductoInvitado(productoId) {
+  await window.authManager.eliminarDelCarritoLocal(productoId);
+  await cargarCarritoInvitado(); // Recargar carrito
 }
 
 async function finalizarCompra() {
   try {
+    // Enviar los cambios de cantidad que aún esperan el debounce
+    await enviarCambiosCarrito();
+
     // Validar formulario antes de proceder
     if (!validarFormularioCompra()) {
       return; // No proceder si la validación falla
@@ -1022,9 +1054,9 @@ async function limpiarCarritoDespuesDeCompra() {
         await vaciarCarritoAutenticadoManualmente();
       }
     } else {
-      // Usuario invitado - limpiar carrito local
+      // Usuario invitado - limpiar el carrito de la sesión
       console.log("🧹 CARRITO: Limpiando carrito de usuario invitado");
-      localStorage.removeItem("carrito_invitado");
+      await window.authManager.vaciarCarritoInvitado();
       console.log("✅ CARRITO: Carrito de invitado limpiado exitosamente");
     }
     
@@ -1056,15 +1088,14 @@ async function vaciarCarritoAutenticadoManualmente() {
       const data = await response.json();
       const carrito = data.carrito;
       
-      // Eliminar cada producto del carrito
-      for (const item of carrito) {
-        try {
-          await window.authManager.fetchAutenticado(`/api/carrito/remover/${item.producto_id}/`, {
-            method: 'POST'
-          });
-        } catch (error) {
-          console.warn(`Error eliminando producto ${item.producto_id}:`, error);
-        }
+      // Eliminar todos los productos en un solo PATCH
+      if (carrito.length > 0) {
+        await window.authManager.fetchAutenticado("/api/carrito/", {
+          method: 'PATCH',
+          body: JSON.stringify({
+            operaciones: carrito.map(item => ({ producto_id: item.producto_id, cantidad: 0 }))
+          })
+        });
       }
       
       console.log("✅ CARRITO: Carrito autenticado vaciado manualmente");
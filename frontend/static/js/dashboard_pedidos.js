@@ -205,6 +205,16 @@ class DashboardPedidos {
                     <div class="stat-label">WebPay</div>
                 </div>
             </div>
+            
+            <!-- Alertas de inventario -->
+            <div class="col-lg-2 col-md-4 col-sm-6 mb-3">
+                <a href="/gestion_productos#bajo-stock" class="text-decoration-none">
+                    <div class="stat-card ${stats.productos_bajo_stock ? 'border border-warning' : ''}">
+                        <span class="stat-number ${stats.productos_bajo_stock ? 'text-warning' : ''}">${stats.productos_bajo_stock || 0}</span>
+                        <div class="stat-label"><i class="fas fa-exclamation-triangle"></i> Bajo Stock</div>
+                    </div>
+                </a>
+            </div>
         `;
     }
 